@@ -0,0 +1,253 @@
+"""Retention tiers: per-product OHLC bars for history older than the raw snapshots.
+
+Completed days of raw snapshots are rolled up into 15-minute, hourly and
+daily bars; the raw hour partitions (and each tier) are then dropped once
+they are older than their retention. Layout on disk:
+
+    <root>/<tier>/<period>/<col>.bin    raw little-endian columns (period: YYYYMM, or YYYY for 1d)
+    <root>/<tier>/<period>/blocks.bin   one record per rolled-up day: (day, cumulative rows)
+
+Each day is appended as one block whose rows are sorted by product and then
+bucket, so one product's bars in a block are a binary search on the product
+column - the DepthStore layout, with days in place of ticks. As there, a
+block is visible only once its blocks.bin record is written, and the next
+append truncates anything an interrupted one left behind.
+
+A bar carries the open/high/low/close of sellPrice and buyPrice, the close
+of every other snapshot column, the tick count and the times of its first
+and last tick. Its close columns keep their snapshot names and snapshot_time
+is its last tick, so a run of bars reads like a (coarser) snapshot series.
+"""
+import os
+import shutil
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from snapshot_store import SCHEMA, VALUE_COLUMNS
+
+DAY = 86400
+TIERS = {"15m": 900, "1h": 3600, "1d": DAY}  # finest first
+PERIOD_FORMAT = {"15m": "%Y%m", "1h": "%Y%m", "1d": "%Y"}
+OHLC_COLUMNS = ["sellPrice", "buyPrice"]
+BAR_SCHEMA = dict(
+    {"product": SCHEMA["product"], "bucket": np.dtype("<i8"), "first_time": np.dtype("<i8"),
+     "snapshot_time": SCHEMA["snapshot_time"], "count": np.dtype("<i4")},
+    **{f"{col}_{part}": np.dtype("<f8") for col in OHLC_COLUMNS for part in ("open", "high", "low")},
+    **{col: SCHEMA[col] for col in VALUE_COLUMNS},
+)
+BLOCK_DTYPE = np.dtype([("day", "<i8"), ("rows", "<i8")])
+
+
+def aggregate(data, seconds):
+    """Bars of width seconds from {column: array} snapshot rows; sorted by product, then bucket."""
+    if len(data["snapshot_time"]) == 0:
+        return {col: np.empty(0, dtype=dt) for col, dt in BAR_SCHEMA.items()}
+    order = np.lexsort((data["snapshot_time"], data["product"]))
+    times = data["snapshot_time"][order]
+    products = data["product"][order]
+    buckets = times - times % seconds
+    starts = np.flatnonzero(np.concatenate(([True], (products[1:] != products[:-1]) |
+                                            (buckets[1:] != buckets[:-1]))))
+    ends = np.append(starts[1:], len(times)) - 1
+    bars = {"product": products[starts], "bucket": buckets[starts], "first_time": times[starts],
+            "snapshot_time": times[ends], "count": ends - starts + 1}
+    for col in VALUE_COLUMNS:
+        values = data[col][order]
+        bars[col] = values[ends]
+        if col in OHLC_COLUMNS:
+            bars[f"{col}_open"] = values[starts]
+            bars[f"{col}_high"] = np.maximum.reduceat(values, starts)
+            bars[f"{col}_low"] = np.minimum.reduceat(values, starts)
+    return {col: np.asarray(bars[col], dtype=dt) for col, dt in BAR_SCHEMA.items()}
+
+
+def period_key(tier, epoch):
+    return np.datetime64(int(epoch), "s").astype(datetime).strftime(PERIOD_FORMAT[tier])
+
+
+def period_bounds(tier, key):
+    start = datetime.strptime(key, PERIOD_FORMAT[tier])
+    end = start.replace(year=start.year + 1) if tier == "1d" else \
+        start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+    return (int(np.datetime64(start, "s").astype(np.int64)), int(np.datetime64(end, "s").astype(np.int64)))
+
+
+class BarStore:
+    """Append-only, day-blocked bar tiers next to a SnapshotStore (whose product codes they use)."""
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        for tier in TIERS:
+            os.makedirs(os.path.join(root, tier), exist_ok=True)
+
+    def _dir(self, tier, key):
+        return os.path.join(self.root, tier, key)
+
+    def periods(self, tier, start=None, end=None):
+        """Sorted period keys of tier overlapping [start, end)."""
+        keys = sorted(k for k in os.listdir(os.path.join(self.root, tier)) if k.isdigit())
+        return [k for k in keys if (start is None or period_bounds(tier, k)[1] > start) and
+                (end is None or period_bounds(tier, k)[0] < end)]
+
+    def blocks(self, tier, key):
+        path = os.path.join(self._dir(tier, key), "blocks.bin")
+        try:
+            n = os.path.getsize(path) // BLOCK_DTYPE.itemsize
+        except FileNotFoundError:
+            return np.empty(0, dtype=BLOCK_DTYPE)
+        return np.fromfile(path, dtype=BLOCK_DTYPE, count=n)
+
+    def is_empty(self):
+        return not any(self.periods(tier) for tier in TIERS)
+
+    def last_day(self, tier):
+        """Start of the newest day rolled into tier, or None."""
+        for key in reversed(self.periods(tier)):
+            blocks = self.blocks(tier, key)
+            if len(blocks):
+                return int(blocks["day"][-1])
+        return None
+
+    def first_time(self):
+        """Earliest bucket any tier still holds, or None."""
+        firsts = []
+        for tier in TIERS:
+            for key in self.periods(tier):
+                blocks = self.blocks(tier, key)
+                if len(blocks):
+                    firsts.append(int(blocks["day"][0]))
+                    break
+        return min(firsts) if firsts else None
+
+    # ---- writing ---------------------------------------------------------
+    def append_day(self, day, data):
+        """Roll one day of raw snapshot columns into every tier that does not have it yet."""
+        for tier, seconds in TIERS.items():
+            last = self.last_day(tier)
+            if last is not None and last >= day:
+                continue
+            self._append_block(tier, day, aggregate(data, seconds))
+
+    def _append_block(self, tier, day, bars):
+        with self._lock:
+            part = self._dir(tier, period_key(tier, day))
+            os.makedirs(part, exist_ok=True)
+            blocks_path = os.path.join(part, "blocks.bin")
+            if os.path.exists(blocks_path) and os.path.getsize(blocks_path) % BLOCK_DTYPE.itemsize:
+                os.truncate(blocks_path, os.path.getsize(blocks_path) // BLOCK_DTYPE.itemsize * BLOCK_DTYPE.itemsize)
+            blocks = self.blocks(tier, os.path.basename(part))
+            committed = int(blocks["rows"][-1]) if len(blocks) else 0
+            for col, dtype in BAR_SCHEMA.items():
+                with open(os.path.join(part, f"{col}.bin"), "ab") as f:
+                    if f.tell() > committed * dtype.itemsize:  # left over from an interrupted append
+                        f.truncate(committed * dtype.itemsize)
+                    f.write(bars[col].astype(dtype, copy=False).tobytes())
+            with open(blocks_path, "ab") as f:
+                f.write(np.array([(day, committed + len(bars["product"]))], dtype=BLOCK_DTYPE).tobytes())
+
+    def drop_before(self, tier, cutoff):
+        """Remove whole periods of tier that end at or before cutoff. Returns periods removed."""
+        dropped = [k for k in self.periods(tier) if period_bounds(tier, k)[1] <= cutoff]
+        for key in dropped:
+            shutil.rmtree(self._dir(tier, key), ignore_errors=True)
+        if dropped:
+            logging.info(f"Dropped {len(dropped)} {tier} bar period(s) before {np.datetime64(cutoff, 's')}")
+        return len(dropped)
+
+    # ---- reading ---------------------------------------------------------
+    def _column(self, part, col, rows):
+        return np.memmap(os.path.join(part, f"{col}.bin"), dtype=BAR_SCHEMA[col], mode="r", shape=(rows,))
+
+    def product(self, tier, code, start=None, end=None, columns=None):
+        """One product's bars of tier with start <= bucket < end, as {column: array} in time order."""
+        columns = list(columns or BAR_SCHEMA)
+        chunks = {col: [] for col in columns}
+        for key in self.periods(tier, start, end):
+            part = self._dir(tier, key)
+            blocks = self.blocks(tier, key)
+            if len(blocks) == 0:
+                continue
+            rows = int(blocks["rows"][-1])
+            if rows == 0:
+                continue
+            products = self._column(part, "product", rows)
+            buckets = self._column(part, "bucket", rows)
+            maps = {col: self._column(part, col, rows) for col in columns}
+            lo_block = 0
+            for hi_block in blocks["rows"].tolist():
+                lo = lo_block + int(np.searchsorted(products[lo_block:hi_block], code, side="left"))
+                hi = lo_block + int(np.searchsorted(products[lo_block:hi_block], code, side="right"))
+                lo_block = hi_block
+                if lo == hi:
+                    continue
+                b = buckets[lo:hi]
+                i = 0 if start is None else int(np.searchsorted(b, start, side="left"))
+                j = len(b) if end is None else int(np.searchsorted(b, end, side="left"))
+                if i == j:
+                    continue
+                lo, hi = lo + i, lo + j
+                for col in columns:
+                    chunks[col].append(np.array(maps[col][lo:hi]))
+        return {col: np.concatenate(chunks[col]) if chunks[col] else np.empty(0, dtype=BAR_SCHEMA[col])
+                for col in columns}
+
+    def read(self, tier, start=None, end=None, columns=None):
+        """Every product's bars of tier with start <= bucket < end (block order: day, product, bucket)."""
+        columns = list(columns or BAR_SCHEMA)
+        wanted = columns if "bucket" in columns else columns + ["bucket"]
+        chunks = {col: [] for col in wanted}
+        for key in self.periods(tier, start, end):
+            part = self._dir(tier, key)
+            blocks = self.blocks(tier, key)
+            if len(blocks) == 0:
+                continue
+            rows = int(blocks["rows"][-1])
+            data = {col: np.fromfile(os.path.join(part, f"{col}.bin"), dtype=BAR_SCHEMA[col], count=rows)
+                    for col in wanted}
+            keep = np.ones(rows, dtype=bool)
+            if start is not None:
+                keep &= data["bucket"] >= start
+            if end is not None:
+                keep &= data["bucket"] < end
+            for col in wanted:
+                chunks[col].append(data[col][keep])
+        return {col: np.concatenate(chunks[col]) if chunks[col] else np.empty(0, dtype=BAR_SCHEMA[col])
+                for col in columns}
+
+    def pick_tier(self, resolution, start=None):
+        """Coarsest tier whose bars are at most resolution seconds wide and that still reaches back to start.
+
+        Falls back to the finest tier that reaches start (or the finest tier) when none is fine enough.
+        """
+        reach = {}
+        for tier in TIERS:
+            keys = self.periods(tier)
+            reach[tier] = period_bounds(tier, keys[0])[0] if keys else None
+        covering = [t for t in TIERS if reach[t] is not None and (start is None or reach[t] <= start)] or \
+                   [t for t in TIERS if reach[t] is not None]
+        if not covering:
+            return None
+        fine_enough = [t for t in covering if TIERS[t] <= resolution]
+        return fine_enough[-1] if fine_enough else covering[0]
+
+    def window_summary(self, tier, start, end):
+        """Per product first (open) sellPrice/time, min low, max high and tick count of tier's bars in [start, end).
+
+        Returns {code: (first_price, first_time, low, high, count)}.
+        """
+        bars = self.read(tier, start, end, ["product", "bucket", "first_time", "count", "sellPrice_open",
+                                            "sellPrice_high", "sellPrice_low"])
+        if len(bars["product"]) == 0:
+            return {}
+        order = np.lexsort((bars["bucket"], bars["product"]))
+        bars = {col: arr[order] for col, arr in bars.items()}
+        starts = np.flatnonzero(np.concatenate(([True], bars["product"][1:] != bars["product"][:-1])))
+        return dict(zip(bars["product"][starts].tolist(), zip(
+            bars["sellPrice_open"][starts].tolist(), bars["first_time"][starts].tolist(),
+            np.minimum.reduceat(bars["sellPrice_low"], starts).tolist(),
+            np.maximum.reduceat(bars["sellPrice_high"], starts).tolist(),
+            np.add.reduceat(bars["count"].astype(np.int64), starts).tolist())))
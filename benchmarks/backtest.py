@@ -0,0 +1,156 @@
+"""Offline backtest of the forecasting engines: fit cost, predict latency and error.
+
+    python benchmarks/backtest.py                         # market_snapshot.csv in the repo root
+    python benchmarks/backtest.py --csv path/to/market_snapshot.csv --products 200 --json backtest.json
+    python benchmarks/backtest.py --synthetic 100 --hours 48
+
+Replays a market_snapshot.csv (or a seeded synthetic random walk of the same
+shape) product by product: the training set is built exactly as the trainer
+builds it, then cut into --folds expanding-window folds (fit on everything
+before a block, score on the block). For every engine in
+forecasters.ENGINES, and for "auto" (select_engine() on the training part,
+as the trainer does), we report mean CPU fit time, single-row predict
+latency, per-product latency of one batched predict over every product,
+mean absolute error and MAPE on the held-out blocks, and how often each
+engine had the lowest error. Everything is seeded, so runs are comparable
+across commits.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from training import FEATURE_COLUMNS, build_training_set  # noqa: E402
+from forecasters import ENGINES, evaluate, select_engine  # noqa: E402
+from inference import predict_batch  # noqa: E402
+
+
+def load_csv(path, limit):
+    """{product_id: (times, sellPrice, features)} from a market_snapshot.csv, time-sorted."""
+    import pandas as pd
+    df = pd.read_csv(path, usecols=["snapshot_time", "product_id", "sellPrice"] + FEATURE_COLUMNS)
+    df["snapshot_time"] = pd.to_datetime(df["snapshot_time"]).astype("int64") // 10**9
+    df = df.sort_values(["product_id", "snapshot_time"], kind="stable")
+    out = {}
+    for pid, group in df.groupby("product_id", sort=True):
+        out[pid] = (group["snapshot_time"].to_numpy(), group["sellPrice"].to_numpy(float),
+                    group[FEATURE_COLUMNS].to_numpy(float))
+        if len(out) == limit:
+            break
+    return out
+
+
+def synthetic(products, hours, seed=0):
+    """Random-walk series with a little drift and mean reversion, 2-minute ticks."""
+    rng = np.random.default_rng(seed)
+    times = 1_700_000_000 + 120 * np.arange(int(hours * 30))
+    out = {}
+    for i in range(products):
+        base = rng.lognormal(3, 2)
+        steps = rng.normal(rng.normal(0, 2e-4), 0.01, len(times))
+        log_price = np.cumsum(steps)
+        log_price -= 0.02 * (log_price - log_price.mean())
+        features = rng.integers(0, 10_000_000, (len(times), len(FEATURE_COLUMNS))).astype(float)
+        out[f"ITEM_{i}"] = (times, base * np.exp(log_price), features)
+    return out
+
+
+def folds(n, k):
+    block = n // (k + 1)
+    return [(i * block, (i + 1) * block) for i in range(1, k + 1)] if block else []
+
+
+def single_row_latency(model, scaler, row, repeat=50):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        predict_batch([model], [scaler], row)
+    return (time.perf_counter() - t0) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default=os.path.join(ROOT, "market_snapshot.csv"))
+    parser.add_argument("--synthetic", type=int, default=0, help="use N synthetic products instead of --csv")
+    parser.add_argument("--hours", type=float, default=24, help="history per synthetic product")
+    parser.add_argument("--products", type=int, default=100, help="products to replay from --csv")
+    parser.add_argument("--folds", type=int, default=3)
+    parser.add_argument("--window", type=int, default=600, help="seconds ahead the peak target looks")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES))
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    if args.synthetic or not os.path.exists(args.csv):
+        source = f"synthetic {args.synthetic or args.products} products x {args.hours:g}h"
+        series = synthetic(args.synthetic or args.products, args.hours)
+    else:
+        source = args.csv
+        series = load_csv(args.csv, args.products)
+    names = args.engines + ["auto"]
+    rows = {name: {"fit": [], "latency": [], "abs": [], "ape": [], "wins": 0} for name in names}
+    final = {name: [] for name in args.engines}  # one model per product fitted on all its data
+    products = 0
+    for pid, (times, prices, features) in series.items():
+        X, y, _ = build_training_set(times, prices, features, args.window)
+        splits = folds(len(y), args.folds)
+        if not splits:
+            continue
+        products += 1
+        errors = {}
+        for name in names:
+            fit_s, err = [], []
+            for lo, hi in splits:
+                if name == "auto":
+                    t0 = time.process_time()
+                    chosen, _ = select_engine(X[:lo], y[:lo], args.engines)
+                    result = evaluate(chosen, X[:lo], y[:lo], X[lo:hi], y[lo:hi])
+                    result["fit_seconds"] += time.process_time() - t0 - result["predict_seconds"]
+                else:
+                    result = evaluate(name, X[:lo], y[:lo], X[lo:hi], y[lo:hi])
+                fit_s.append(result["fit_seconds"])
+                err.append(result["error"])
+                rows[name]["ape"].append(result["error"] / max(np.mean(np.abs(y[lo:hi])), 1e-12))
+            rows[name]["fit"].append(np.mean(fit_s))
+            rows[name]["abs"].append(np.mean(err))
+            errors[name] = np.mean(err)
+            if name != "auto":
+                model, scaler = ENGINES[name](X, y)
+                final[name].append((model, scaler, X[-1]))
+                rows[name]["latency"].append(single_row_latency(model, scaler, X[-1:]))
+        rows[min(args.engines, key=errors.get)]["wins"] += 1
+
+    results = {"source": source, "products": products, "folds": args.folds, "engines": {}}
+    print(f"# {source}: {products} products, {args.folds} folds")
+    print(f"{'engine':>11} {'fit ms':>9} {'1-row us':>9} {'batch us':>9} {'MAE':>10} {'MAPE %':>8} {'wins':>5}")
+    for name in names:
+        r = rows[name]
+        batch_us = None
+        if name in final and final[name]:
+            models, scalers, X_last = zip(*final[name])
+            t0 = time.perf_counter()
+            predict_batch(list(models), list(scalers), np.stack(X_last))
+            batch_us = (time.perf_counter() - t0) / len(models) * 1e6
+        entry = {
+            "fit_ms": float(np.mean(r["fit"]) * 1000),
+            "predict_us": float(np.mean(r["latency"]) * 1e6) if r["latency"] else None,
+            "batch_predict_us_per_product": batch_us,
+            "mae": float(np.mean(r["abs"])),
+            "mape_pct": float(np.mean(r["ape"]) * 100),
+            "wins": r["wins"],
+        }
+        results["engines"][name] = entry
+        fmt = lambda v, spec: format(v, spec) if v is not None else format("-", ">9")  # noqa: E731
+        print(f"{name:>11} {entry['fit_ms']:>9.2f} {fmt(entry['predict_us'], '>9.1f')} "
+              f"{fmt(batch_us, '>9.2f')} {entry['mae']:>10.4f} {entry['mape_pct']:>8.3f} {r['wins']:>5}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
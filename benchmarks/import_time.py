@@ -0,0 +1,92 @@
+"""Cold-start import time of a web worker, checked against a budget.
+
+    python benchmarks/import_time.py                  # BZ_ROLE=web, 5 runs, 250ms budget
+    python benchmarks/import_time.py --role all --budget 400
+
+Each run starts a fresh interpreter with `python -X importtime` that imports
+run.py and calls create_app(), in an empty temp directory. We report the
+median of `import run` (self + children, as -X importtime measures it) and
+of the whole process wall time, list the slowest top-level imports, and fail
+(exit 1) if the median is over budget or a web worker pulled in one of the
+heavy modules that should only load on demand: sklearn (trainer, trend fit),
+plotly (/plot), pandas (CSV migration), requests (fetcher).
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ["sklearn", "scipy", "plotly", "pandas", "requests"]
+PROGRAM = ("import sys, json, run; run.create_app(); "
+           "print(json.dumps(sorted({m.split('.')[0] for m in sys.modules} & set(%r))))" % HEAVY)
+
+
+def parse(stderr):
+    """({module: cumulative us} of run's direct imports, cumulative us of run) from -X importtime output."""
+    out, total = {}, None
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header
+        depth = len(name) - len(name.lstrip())
+        if depth == 1 and name.strip() == "run":
+            total = int(cumulative)
+        elif depth == 3:  # children are printed before their parent
+            out[name.strip()] = int(cumulative)
+        elif depth == 1:  # another top-level import's children: drop them
+            out = {}
+    return out, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--role", default="web")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=250, help="milliseconds for `import run` + create_app()")
+    parser.add_argument("--top", type=int, default=10, help="slowest direct imports of run.py to list")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bz_import_bench_")
+    env = dict(os.environ, BZ_ROLE=args.role, PYTHONPATH=ROOT)
+    try:
+        run_ms, wall_ms, imports, heavy = [], [], {}, []
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            proc = subprocess.run([sys.executable, "-X", "importtime", "-c", PROGRAM], cwd=workdir, env=env,
+                                  capture_output=True, text=True, check=True)
+            wall_ms.append((time.perf_counter() - t0) * 1000)
+            imports, total = parse(proc.stderr)
+            run_ms.append(total / 1000)
+            heavy = json.loads(proc.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"# BZ_ROLE={args.role}, {args.runs} runs")
+    print(f"import run:       median {np.median(run_ms):7.1f}ms  (min {min(run_ms):.1f}ms)")
+    print(f"process wall:     median {np.median(wall_ms):7.1f}ms")
+    print("slowest imports made by run.py (last run):")
+    for name, us in sorted(imports.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"  {us / 1000:8.1f}ms  {name}")
+    failures = []
+    if np.median(run_ms) > args.budget:
+        failures.append(f"import run took {np.median(run_ms):.1f}ms, budget {args.budget:.0f}ms")
+    if heavy and args.role == "web":
+        failures.append(f"web worker imported {', '.join(heavy)} at startup")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print(f"OK: within the {args.budget:.0f}ms budget")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Storage and one-year query cost: raw snapshots vs the retention-tier bars.
+
+    python benchmarks/retention.py                    # 365 days, 100 products, 10-minute ticks
+    python benchmarks/retention.py --days 90 --products 300 --tick 120
+
+A synthetic history is written to a SnapshotStore, then rolled day by day
+into a BarStore (as the compaction job does). We report bytes on disk per
+tier and the time and row count of a one-product, whole-range query: a raw
+scan of every partition against the bars of the tier pick_tier() chooses
+for a 1,500-point chart. The bar query should stay flat as ticks get
+denser; the raw scan grows with them.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from snapshot_store import SnapshotStore, VALUE_COLUMNS  # noqa: E402
+from bars import BarStore, DAY, TIERS  # noqa: E402
+
+
+def du(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def generate(store, start, days, products, tick, seed=0):
+    """Random-walk snapshots of every product every tick seconds, one day per append."""
+    rng = np.random.default_rng(seed)
+    pids = [f"ITEM_{i}" for i in range(products)]
+    price = rng.lognormal(3, 2, products)
+    for day in range(days):
+        ticks = start + day * DAY + np.arange(0, DAY, tick)
+        prices = price * np.exp(np.cumsum(rng.normal(0, 0.01, (len(ticks), products)), axis=0))
+        price = prices[-1]
+        cols = {"sellPrice": prices.ravel(), "buyPrice": (prices * 1.02).ravel()}
+        for col in VALUE_COLUMNS[2:]:
+            cols[col] = rng.integers(0, 10_000_000, prices.size)
+        store.append(np.repeat(ticks, products), pids * len(ticks), cols)
+
+
+def best_of(fn, runs=5):
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return min(times) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--products", type=int, default=100)
+    parser.add_argument("--tick", type=int, default=600, help="seconds between snapshots")
+    parser.add_argument("--points", type=int, default=1500, help="chart points the query is sized for")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bz_retention_bench_")
+    try:
+        store = SnapshotStore(os.path.join(tmp, "snapshot_store"))
+        bars = BarStore(os.path.join(tmp, "snapshot_store", "bars"))
+        today = int(np.datetime64(datetime.now(), "s").astype(np.int64)) // DAY * DAY
+        start = today - args.days * DAY
+        t0 = time.perf_counter()
+        generate(store, start, args.days, args.products, args.tick)
+        print(f"generated {args.days} days x {args.products} products every {args.tick}s "
+              f"in {time.perf_counter() - t0:.1f}s")
+
+        t0 = time.perf_counter()
+        for day in range(start, today, DAY):
+            bars.append_day(day, store.read(start=day, end=day + DAY - 1))
+        roll = time.perf_counter() - t0
+        print(f"rolled up in {roll:.1f}s ({roll / args.days * 1000:.0f}ms per day)")
+
+        raw_bytes = du(store.root) - du(bars.root)
+        print(f"{'tier':>6} {'MiB':>9}")
+        print(f"{'raw':>6} {raw_bytes / 2**20:>9.1f}")
+        for tier in TIERS:
+            print(f"{tier:>6} {du(os.path.join(bars.root, tier)) / 2**20:>9.1f}")
+
+        code = store.codes["ITEM_0"]
+
+        def raw_query():
+            data = store.read(["snapshot_time", "product", "sellPrice"], start=start)
+            return int((data["product"] == code).sum())
+
+        tier = bars.pick_tier((today - start) / args.points, start)
+
+        def bar_query():
+            return len(bars.product(tier, code, start, today, ["snapshot_time", "sellPrice"])["snapshot_time"])
+
+        raw_ms, raw_rows = best_of(raw_query, 3)
+        bar_ms, bar_rows = best_of(bar_query)
+        print(f"one product, {args.days} days:")
+        print(f"  raw scan     {raw_ms:9.1f}ms  {raw_rows:>8} rows")
+        print(f"  {tier:>3} bars     {bar_ms:9.1f}ms  {bar_rows:>8} rows")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
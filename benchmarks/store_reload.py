@@ -0,0 +1,105 @@
+"""Reload time / peak RSS: legacy market_snapshot.csv vs the columnar SnapshotStore.
+
+    python benchmarks/store_reload.py                 # 1M, 10M and 50M rows
+    python benchmarks/store_reload.py 1000000 --keep  # one scale, keep generated data
+
+Every measurement runs in a fresh interpreter so peak RSS is not polluted by
+the generator or by the other reader.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from snapshot_store import SnapshotStore, VALUE_COLUMNS, CSV_COLUMNS, partition_start  # noqa: E402
+
+PRODUCTS = 1300
+TICK_SECONDS = 120
+START = int(np.datetime64("2025-01-01T00:00:00", "s").astype(np.int64))
+
+
+def generate(rows, csv_path, store_dir, ticks_per_chunk=500):
+    """Write the same synthetic history to a CSV file and to a store."""
+    rng = np.random.default_rng(0)
+    store = SnapshotStore(store_dir)
+    pids = [f"ITEM_{i}" for i in range(PRODUCTS)]
+    ticks = rows // PRODUCTS
+    with open(csv_path, "w", newline="", encoding="utf-8") as f:
+        f.write(",".join(CSV_COLUMNS) + "\n")
+        for first in range(0, ticks, ticks_per_chunk):
+            n = min(ticks_per_chunk, ticks - first)
+            times = np.repeat(START + TICK_SECONDS * np.arange(first, first + n), PRODUCTS)
+            cols = {
+                "sellPrice": rng.lognormal(3, 2, n * PRODUCTS),
+                "buyPrice": rng.lognormal(3, 2, n * PRODUCTS),
+            }
+            for col in VALUE_COLUMNS[2:]:
+                cols[col] = rng.integers(0, 10_000_000, n * PRODUCTS)
+            store.append(times, pids * n, cols)
+            frame = pd.DataFrame({"snapshot_time": times.astype("datetime64[s]"), "product_id": pids * n, **cols})
+            frame.to_csv(f, header=False, index=False, date_format="%Y-%m-%d %H:%M:%S")
+
+
+def measure(kind, path):
+    """Run inside a child process: load once, report seconds and peak RSS."""
+    t0 = time.perf_counter()
+    if kind == "csv":
+        df = pd.read_csv(path)
+    elif kind == "store":
+        df = SnapshotStore(path).read_frame()
+    else:  # store_hour: the partition-pruned read /top?time_filter=hour does
+        store = SnapshotStore(path)
+        last = store.read(["snapshot_time"], start=partition_start(store.partitions()[-1]))["snapshot_time"][-1]
+        df = store.read_frame(start=int(last) - 3600)
+    elapsed = time.perf_counter() - t0
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"kind": kind, "rows": len(df), "seconds": round(elapsed, 3), "peak_rss_mb": round(rss_mb, 1)}))
+
+
+def run_scale(rows, workdir):
+    csv_path = os.path.join(workdir, "market_snapshot.csv")
+    store_dir = os.path.join(workdir, "snapshot_store")
+    t0 = time.perf_counter()
+    generate(rows, csv_path, store_dir)
+    print(f"# generated {rows:,} rows in {time.perf_counter() - t0:.1f}s "
+          f"(csv {os.path.getsize(csv_path) / 2**20:.0f} MiB)", flush=True)
+    results = []
+    for kind, path in (("csv", csv_path), ("store", store_dir), ("store_hour", store_dir)):
+        out = subprocess.run([sys.executable, __file__, "--measure", kind, path],
+                             check=True, capture_output=True, text=True).stdout
+        result = json.loads(out)
+        results.append(result)
+        print(f"{rows:>12,}  {kind:<11} {result['seconds']:>8.3f}s  {result['peak_rss_mb']:>9.1f} MiB", flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("rows", nargs="*", type=int, default=[1_000_000, 10_000_000, 50_000_000])
+    parser.add_argument("--measure", nargs=2, metavar=("KIND", "PATH"), help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help="where to generate data (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep generated data")
+    args = parser.parse_args()
+    if args.measure:
+        measure(*args.measure)
+        return
+    for rows in args.rows:
+        workdir = args.workdir or tempfile.mkdtemp(prefix="bz_store_bench_")
+        try:
+            run_scale(rows, workdir)
+        finally:
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Local stand-in for the Hypixel Bazaar endpoint that replays recorded payloads.
+
+    python benchmarks/stub_bazaar.py payloads/*.json          # replay recorded responses
+    python benchmarks/stub_bazaar.py --products 1300          # synthetic payloads instead
+    BAZAAR_API_URL=http://127.0.0.1:8765/ python run.py
+
+Each payload is served for --advance-every requests before moving on to the
+next one (looping at the end), with a stable ETag / Last-Modified per payload
+so conditional requests get 304s while it is current. --fail-every N answers
+every Nth request with a 503 to exercise the fetcher's backoff. Also usable
+in-process: start_stub(...) returns a running server.
+"""
+import sys
+import json
+import zlib
+import argparse
+import threading
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from synthetic_data import Market
+
+
+def synthetic_payload(products, tick, tiers=30, seed=0):
+    """A Bazaar-shaped payload: quick_status plus sell/buy order-book tiers per product.
+
+    Drawn from synthetic_data.Market with the same seed, so prices, volumes,
+    order counts and tiers follow the distributions of the synthetic history
+    the models are trained on.
+    """
+    market = Market(products, seed)
+    market.rng = np.random.default_rng(seed * 100_003 + tick)
+    cols = market.step(1_700_000_000 + tick * 20)
+    book = {side: market.tiers(cols, side, tiers) for side in ("sell", "buy")}
+    body = {"success": True, "lastUpdated": 1_700_000_000_000 + tick * 20_000, "products": {}}
+    quick = {col: cols[col].tolist() for col in cols}
+    for i in range(products):
+        pid = f"ITEM_{i}"
+        body["products"][pid] = {
+            "product_id": pid,
+            **{f"{side}_summary": [{"amount": int(a), "pricePerUnit": float(p), "orders": int(o)}
+                                   for p, a, o in zip(prices[i], amounts[i], orders[i])]
+               for side, (prices, amounts, orders) in book.items()},
+            "quick_status": dict({"productId": pid}, **{col: values[i] for col, values in quick.items()}),
+        }
+    return json.dumps(body).encode()
+
+
+class _Replay:
+    def __init__(self, payloads, advance_every, fail_every):
+        self.payloads = payloads
+        self.advance_every = advance_every
+        self.fail_every = fail_every
+        self.requests = 0
+        self.served = {200: 0, 304: 0, 503: 0}
+        self.lock = threading.Lock()
+
+    def next(self):
+        with self.lock:
+            self.requests += 1
+            n = self.requests
+        if self.fail_every and n % self.fail_every == 0:
+            return None
+        index = ((n - 1) // self.advance_every) % len(self.payloads)
+        body = self.payloads[index]
+        return body, f'"{zlib.crc32(body):08x}-{index}"', formatdate(1_700_000_000 + index * 20, usegmt=True)
+
+
+def _handler(replay):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def do_GET(self):
+            current = replay.next()
+            if current is None:
+                self._send(503, b'{"success":false,"cause":"stub failure"}')
+                return
+            body, etag, modified = current
+            if self.headers.get("If-None-Match") == etag:
+                self._send(304, b"", etag, modified)
+            else:
+                self._send(200, body, etag, modified)
+
+        def _send(self, status, body, etag=None, modified=None):
+            replay.served[status] += 1
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            if etag:
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", modified)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_stub(payloads, port=0, advance_every=1, fail_every=0):
+    """Serve payloads (list of bytes) on 127.0.0.1 in a daemon thread; returns (server, url, replay)."""
+    replay = _Replay(payloads, advance_every, fail_every)
+    server = ThreadingHTTPServer(("127.0.0.1", port), _handler(replay))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/", replay
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("payloads", nargs="*", help="recorded JSON responses, served in order")
+    parser.add_argument("--products", type=int, default=1300, help="synthetic products when no payloads are given")
+    parser.add_argument("--ticks", type=int, default=10, help="synthetic payloads to cycle through")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--advance-every", type=int, default=1, help="requests per payload before the next one")
+    parser.add_argument("--fail-every", type=int, default=0, help="answer every Nth request with a 503")
+    args = parser.parse_args()
+    if args.payloads:
+        payloads = []
+        for path in args.payloads:
+            with open(path, "rb") as f:
+                payloads.append(f.read())
+    else:
+        payloads = [synthetic_payload(args.products, t) for t in range(args.ticks)]
+    server, url, _ = start_stub(payloads, args.port, args.advance_every, args.fail_every)
+    print(f"Serving {len(payloads)} payload(s) at {url}", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
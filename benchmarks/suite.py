@@ -0,0 +1,266 @@
+"""End-to-end benchmark: synthetic history, stub API, concurrent load on every page.
+
+    python benchmarks/suite.py --json results.json                 # 300 products x 2 days
+    python benchmarks/suite.py --products 1300 --days 7 --threads 32 --requests 4000 --json big.json
+    python benchmarks/suite.py --json after.json --baseline before.json   # exit 1 on a regression
+
+Steps:
+
+1. synthetic_data.write_history() writes market_snapshot.csv and the
+   summary CSVs into a fresh copy of the app;
+2. stub_bazaar serves synthetic payloads for the same products as API_URL;
+3. the app starts in its own process (create_app(), background services,
+   threaded Flask server) and migrates the CSVs. Startup time is measured
+   until it answers;
+4. once the first training cycle has finished, each scenario runs
+   --requests requests from --threads concurrent clients. The scenarios
+   are /, /top (every time_filter and compare=2min), /plot/<id>,
+   /investments, /predict/<id>, /tracked (over --positions purchases,
+   written straight into the app's portfolio database), and all of them
+   mixed;
+5. we report throughput, p50/p99 latency and errors per scenario. We also
+   report the training cycle time from /metrics, and the peak RSS of the
+   app and of its training workers.
+
+--json stores everything along with the commit and parameters.
+--baseline compares against an earlier file: throughput or latency more
+than --tolerance worse is reported as a regression.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stub_bazaar import start_stub, synthetic_payload  # noqa: E402
+from synthetic_data import write_history  # noqa: E402
+from workers import children  # noqa: E402
+from portfolio import Portfolio  # noqa: E402
+
+TIME_FILTERS = ["minute", "hour", "day", "week", "month", "year", "all"]
+SERVE = ("import run; run.create_app(); run.start_background_services(); "
+         "run.app.run(host='127.0.0.1', port={port}, threaded=True, use_reloader=False)")
+
+
+def scenarios(products, sample=20):
+    items = [f"ITEM_{i}" for i in range(0, products, max(1, products // sample))][:sample]
+    named = {
+        "index": ["/"],
+        "top": [f"/top?time_filter={w}" for w in TIME_FILTERS] + ["/top?compare=2min"],
+        "plot": [f"/plot/{pid}" for pid in items],
+        "investments": ["/investments"],
+        "predict": [f"/predict/{pid}" for pid in items],
+        "tracked": ["/tracked"] * 4 + [f"/tracked?product_id={pid}" for pid in items[:4]],
+    }
+    named["mixed"] = [url for urls in named.values() for url in urls]
+    return named
+
+
+def get(base, path, timeout=120):
+    with urllib.request.urlopen(base + path, timeout=timeout) as response:
+        return response.status, response.read()
+
+
+def metric(base, name):
+    """Value of one unlabelled series from /metrics, or None."""
+    _, body = get(base, "/metrics")
+    for line in body.decode().splitlines():
+        if line.startswith(name + " "):
+            return float(line.split()[1])
+    return None
+
+
+def peak_rss(pid):
+    """Peak resident set size (VmHWM) of pid in MiB, or None where /proc is not available."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 1024
+    except (OSError, StopIteration):
+        return None
+
+
+def load(base, urls, threads, requests):
+    """Hit urls round-robin from threads clients; returns the scenario's stats."""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    per_thread = max(1, requests // threads)
+
+    def client(offset):
+        mine, failed = [], 0
+        for i in range(per_thread):
+            t0 = time.perf_counter()
+            try:
+                status, _ = get(base, urls[(offset + i) % len(urls)])
+                failed += status != 200
+            except (urllib.error.URLError, OSError):
+                failed += 1
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    for url in urls:  # warm up: first renders, chart and forecast caches
+        get(base, url)
+    started = time.perf_counter()
+    pool = [threading.Thread(target=client, args=(k,)) for k in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    ms = np.array(latencies) * 1000
+    return {"requests": len(ms), "errors": errors[0], "seconds": elapsed, "throughput": len(ms) / elapsed,
+            "p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99)),
+            "mean_ms": float(ms.mean())}
+
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Print the change of every figure against baseline; returns the regressions."""
+    regressions = []
+
+    def check(label, new, old, higher_is_better):
+        if new is None or old is None or old == 0:
+            return
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        print(f"{label:>32} {old:>10.2f} -> {new:>10.2f} ({change * 100:+6.1f}%){flag}")
+        if flag:
+            regressions.append(label)
+
+    print(f"# against {baseline['meta'].get('commit')} ({baseline['meta'].get('date')})")
+    for name, stats in results["scenarios"].items():
+        old = baseline["scenarios"].get(name)
+        if old:
+            check(f"{name} req/s", stats["throughput"], old["throughput"], True)
+            check(f"{name} p50 ms", stats["p50_ms"], old["p50_ms"], False)
+            check(f"{name} p99 ms", stats["p99_ms"], old["p99_ms"], False)
+    check("training cycle s", results["training"]["cycle_seconds"], baseline["training"]["cycle_seconds"], False)
+    check("startup s", results["startup_seconds"], baseline["startup_seconds"], False)
+    for proc, mib in results["peak_rss_mib"].items():
+        check(f"peak RSS {proc} MiB", mib, baseline["peak_rss_mib"].get(proc), False)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=300)
+    parser.add_argument("--days", type=float, default=2, help="history to generate")
+    parser.add_argument("--tiers", type=int, default=5, help="order-book rows per side and tick")
+    parser.add_argument("--threads", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per scenario")
+    parser.add_argument("--positions", type=int, default=2000, help="tracked purchases for /tracked")
+    parser.add_argument("--scenarios", nargs="+", help="run only these (default: all)")
+    parser.add_argument("--train-workers", type=int, default=2)
+    parser.add_argument("--train-timeout", type=float, default=1800, help="seconds to wait for the first cycle")
+    parser.add_argument("--port", type=int, default=8021)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="earlier --json results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change that counts as a regression")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory (and app.log)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bz_suite_")
+    stub, url, _ = start_stub([synthetic_payload(args.products, t) for t in range(3)])
+    server = None
+    try:
+        shutil.copytree(ROOT, workdir, dirs_exist_ok=True, ignore=shutil.ignore_patterns(
+            "snapshot_store", "*.csv", ".git", "__pycache__", "benchmarks", "requests.jsonl"))
+        data = write_history(workdir, args.products, args.days, tiers=args.tiers)
+        print(f"# {data['snapshots']} snapshots, {data['summary_rows']} order-book rows "
+              f"({args.products} products x {args.days:g} days) written in {data['seconds']:.1f}s")
+
+        env = dict(os.environ, BAZAAR_API_URL=url, TRAIN_WORKERS=str(args.train_workers), BZ_ROLE="all")
+        log = open(os.path.join(workdir, "app.log"), "w")
+        started = time.perf_counter()
+        server = subprocess.Popen([sys.executable, "-c", SERVE.format(port=args.port)], cwd=workdir, env=env,
+                                  stdout=log, stderr=subprocess.STDOUT)
+        base = f"http://127.0.0.1:{args.port}"
+        while True:
+            try:
+                get(base, "/metrics", timeout=5)
+                break
+            except (urllib.error.URLError, OSError):
+                if server.poll() is not None:
+                    raise SystemExit(f"the app exited with {server.returncode}; see {workdir}/app.log")
+                time.sleep(0.2)
+        startup = time.perf_counter() - started
+        print(f"# app up (CSV migration included) in {startup:.1f}s; waiting for the first training cycle")
+        deadline = time.time() + args.train_timeout
+        while not metric(base, "bz_training_cycle_seconds_count"):
+            if time.time() > deadline:
+                raise SystemExit("no training cycle finished within --train-timeout")
+            time.sleep(1)
+        cycles = metric(base, "bz_training_cycle_seconds_count")
+        training = {"cycle_seconds": metric(base, "bz_training_cycle_seconds_sum") / cycles,
+                    "models": metric(base, "bz_models")}
+        print(f"# training cycle {training['cycle_seconds']:.1f}s, {training['models']:.0f} models")
+
+        portfolio = Portfolio(os.path.join(workdir, "snapshot_store", "portfolio.db"))
+        for i in range(args.positions):
+            portfolio.add(time.time() - i * 60, f"ITEM_{i % args.products}", 1 + i % 64, 10.0, 12.0)
+        named = scenarios(args.products)
+        results = {
+            "meta": {"commit": commit(), "date": datetime.now().isoformat(timespec="seconds"),
+                     "python": platform.python_version(), "cpus": os.cpu_count(),
+                     "args": {k: v for k, v in vars(args).items() if k not in ("json", "baseline", "keep")}},
+            "startup_seconds": startup,
+            "training": training,
+            "scenarios": {},
+        }
+        print(f"{'scenario':>12} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'mean ms':>9} {'errors':>7}")
+        for name in args.scenarios or named:
+            stats = load(base, named[name], args.threads, args.requests)
+            results["scenarios"][name] = stats
+            print(f"{name:>12} {stats['throughput']:>9.1f} {stats['p50_ms']:>9.2f} {stats['p99_ms']:>9.2f} "
+                  f"{stats['mean_ms']:>9.2f} {stats['errors']:>7}")
+        workers = [peak_rss(pid) for pid in children(server.pid)]
+        workers = [mib for mib in workers if mib is not None]
+        results["peak_rss_mib"] = {"app": peak_rss(server.pid), "training_worker": max(workers, default=None)}
+        rss = {proc: "n/a" if mib is None else f"{mib:.0f} MiB" for proc, mib in results["peak_rss_mib"].items()}
+        print(f"# peak RSS: app {rss['app']}, largest training worker {rss['training_worker']}")
+
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+            print(f"wrote {args.json}")
+        if args.baseline:
+            with open(args.baseline, encoding="utf-8") as f:
+                regressions = compare(results, json.load(f), args.tolerance)
+            if regressions:
+                raise SystemExit(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+    finally:
+        if server is not None and server.poll() is None:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+        stub.shutdown()
+        if args.keep:
+            print(f"kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Synthetic Bazaar history in the legacy CSV layout, at any scale.
+
+    python benchmarks/synthetic_data.py --out /tmp/bz                      # 300 products x 2 days
+    python benchmarks/synthetic_data.py --out /tmp/bz --products 1300 --days 30 --tiers 10
+
+Writes market_snapshot.csv, sell_summary.csv and buy_summary.csv with the
+columns the old fetch loop wrote (one snapshot row per product per tick,
+--tiers order-book rows per side), ending at --end (default: now), so
+run.py migrates them into its stores on first start. Products are
+ITEM_<n>, like stub_bazaar.synthetic_payload, so a stub API can carry
+the history on.
+
+Each product gets its own price level, volatility, spread and liquidity.
+Its log price is a mean-reverting random walk with a daily cycle and
+occasional jumps; volumes and order counts drift around the product's
+level and rise with the size of the move. Everything is seeded.
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from snapshot_store import VALUE_COLUMNS  # noqa: E402
+
+DAY = 86400
+SNAPSHOT_HEADER = ["snapshot_time", "product_id"] + VALUE_COLUMNS
+SUMMARY_HEADER = ["snapshot_time", "product_id", "pricePerUnit", "amount", "orders", "tier_rank"]
+MEAN_REVERSION = 0.002  # per tick, towards the product's level
+JUMP_PROBABILITY = 5e-4  # per product and tick
+DAILY_AMPLITUDE = 0.02  # log-price swing of the daily cycle
+
+
+class Market:
+    """Per-product parameters and state of the simulation."""
+
+    def __init__(self, products, seed=0):
+        rng = np.random.default_rng(seed)
+        self.rng = rng
+        self.pids = np.array([f"ITEM_{i}" for i in range(products)], dtype=object)
+        self.level = np.log(rng.lognormal(3, 2, products))
+        self.volatility = rng.lognormal(np.log(0.005), 0.6, products)
+        self.spread = np.clip(rng.lognormal(np.log(0.03), 0.7, products), 0.001, 0.5)
+        self.phase = rng.uniform(0, 2 * np.pi, products)
+        self.liquidity = rng.lognormal(12, 2, products)  # typical instant sell volume
+        self.orders = rng.uniform(5, 300, products)
+        self.log_price = self.level + rng.normal(0, 0.05, products)
+
+    def step(self, epoch):
+        """Advance one tick; returns the snapshot columns for every product."""
+        rng, n = self.rng, len(self.pids)
+        shock = rng.normal(0, self.volatility)
+        jumps = rng.random(n) < JUMP_PROBABILITY
+        shock[jumps] += rng.normal(0, 0.1, jumps.sum())
+        self.log_price += shock - MEAN_REVERSION * (self.log_price - self.level)
+        cycle = DAILY_AMPLITUDE * np.sin(2 * np.pi * (epoch % DAY) / DAY + self.phase)
+        sell = np.exp(self.log_price + cycle)
+        activity = 1 + 20 * np.abs(shock)  # big moves bring volume
+        sell_volume = self.liquidity * activity * rng.lognormal(0, 0.2, n)
+        buy_volume = self.liquidity * activity * rng.lognormal(0, 0.3, n)
+        return {
+            "sellPrice": sell,
+            "buyPrice": sell * (1 + self.spread),
+            "sellVolume": sell_volume.astype(np.int64),
+            "buyVolume": buy_volume.astype(np.int64),
+            "sellMovingWeek": (self.liquidity * 50 * rng.lognormal(0, 0.05, n)).astype(np.int64),
+            "buyMovingWeek": (self.liquidity * 50 * rng.lognormal(0, 0.05, n)).astype(np.int64),
+            "sellOrders": rng.poisson(self.orders * activity),
+            "buyOrders": rng.poisson(self.orders * activity),
+        }
+
+    def tiers(self, cols, side, tiers):
+        """(pricePerUnit, amount, orders) of shape (products, tiers) for one side of the book."""
+        rng, n = self.rng, len(self.pids)
+        best = cols["sellPrice"] if side == "sell" else cols["buyPrice"]
+        step = np.maximum(0.1, np.round(best * 0.002, 1))[:, None] * np.arange(tiers)
+        prices = np.round(best[:, None] - step if side == "sell" else best[:, None] + step, 1)
+        amounts = (self.liquidity[:, None] / 20 * rng.lognormal(0, 1, (n, tiers))).astype(np.int64) + 1
+        orders = rng.poisson(3, (n, tiers)) + 1
+        return np.maximum(prices, 0.1), amounts, orders
+
+
+def _write(f, columns):
+    """Append rows to an open CSV file; columns are equal-length arrays (str or numbers)."""
+    text = [np.asarray(c).astype(str) for c in columns]
+    rows = text[0]
+    for col in text[1:]:
+        rows = np.char.add(np.char.add(rows, ","), col)
+    f.write("\n".join(rows.tolist()))
+    f.write("\n")
+
+
+def write_history(directory, products=300, days=2, tick_seconds=120, tiers=5, end=None, seed=0):
+    """Write the three CSVs into directory; returns {"snapshots", "summary_rows", "ticks", "seconds"}."""
+    started = time.perf_counter()
+    end = int(np.datetime64(end or datetime.now(), "s").astype(np.int64))
+    ticks = int(days * DAY // tick_seconds)
+    market = Market(products, seed)
+    os.makedirs(directory, exist_ok=True)
+    files = {name: open(os.path.join(directory, name), "w", encoding="utf-8")
+             for name in ("market_snapshot.csv", "sell_summary.csv", "buy_summary.csv")}
+    try:
+        files["market_snapshot.csv"].write(",".join(SNAPSHOT_HEADER) + "\n")
+        for name in ("sell_summary.csv", "buy_summary.csv"):
+            files[name].write(",".join(SUMMARY_HEADER) + "\n")
+        rank = np.tile(np.arange(tiers), products)
+        tier_pids = np.repeat(market.pids, tiers)
+        for epoch in end - tick_seconds * np.arange(ticks)[::-1]:
+            stamp = str(np.datetime64(int(epoch), "s")).replace("T", " ")
+            cols = market.step(int(epoch))
+            _write(files["market_snapshot.csv"],
+                   [np.full(products, stamp), market.pids] + [cols[col] for col in VALUE_COLUMNS])
+            if tiers:
+                for side in ("sell", "buy"):
+                    prices, amounts, orders = market.tiers(cols, side, tiers)
+                    _write(files[f"{side}_summary.csv"], [np.full(products * tiers, stamp), tier_pids,
+                                                         prices.ravel(), amounts.ravel(), orders.ravel(), rank])
+    finally:
+        for f in files.values():
+            f.close()
+    return {"snapshots": ticks * products, "summary_rows": 2 * ticks * products * tiers, "ticks": ticks,
+            "seconds": time.perf_counter() - started}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True, help="directory to write the CSVs into")
+    parser.add_argument("--products", type=int, default=300)
+    parser.add_argument("--days", type=float, default=2)
+    parser.add_argument("--tick", type=int, default=120, help="seconds between snapshots")
+    parser.add_argument("--tiers", type=int, default=5, help="order-book rows per side and tick (0: none)")
+    parser.add_argument("--end", help="time of the last snapshot, YYYY-mm-dd HH:MM:SS (default: now)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    end = datetime.strptime(args.end, "%Y-%m-%d %H:%M:%S") if args.end else None
+    stats = write_history(args.out, args.products, args.days, args.tick, args.tiers, end, args.seed)
+    print(f"{stats['snapshots']} snapshots and {stats['summary_rows']} order-book rows "
+          f"({stats['ticks']} ticks) in {stats['seconds']:.1f}s -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Load test for /top: rollup lookups vs the legacy per-request groupby.
+
+    python benchmarks/top_load.py                         # 2 days of 1,300 products, 60s ticks
+    python benchmarks/top_load.py --hours 6 --threads 16 --requests 2000
+
+Generates a synthetic history ending now in a temp SnapshotStore, loads
+run.py against it (create_app(), no background services), and checks that
+/top renders the same page as the legacy implementation for every window,
+compare mode and sort order - before and after a new tick is folded in. Then both versions are
+hit from concurrent threads and p50/p99 latencies are reported.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from snapshot_store import SnapshotStore, VALUE_COLUMNS  # noqa: E402
+
+PRODUCTS = 1300
+TICK_SECONDS = 60
+URLS = ["/top"] + [f"/top?time_filter={w}" for w in ("minute", "hour", "day", "week", "month", "year")] + \
+       ["/top?compare=2min", "/top?sort_by=raw_margin&sort_order=asc", "/top?time_filter=hour&min_percentage=5",
+        "/top?sort_by=product_id", "/top?sort_by=current_price&sort_order=asc&min_margin=1"]
+
+
+def generate(store, end, n_ticks, seed=0):
+    """Append n_ticks random-walk snapshots of every product, the last one at end."""
+    rng = np.random.default_rng(seed)
+    pids = [f"ITEM_{i}" for i in range(PRODUCTS)]
+    ticks = end - TICK_SECONDS * np.arange(n_ticks)[::-1]
+    price = rng.lognormal(3, 2, PRODUCTS)
+    for chunk in np.array_split(ticks, max(1, len(ticks) // 500)):
+        walk = np.exp(np.cumsum(rng.normal(0, 0.01, (len(chunk), PRODUCTS)), axis=0))
+        prices = price * walk
+        price = prices[-1]
+        cols = {"sellPrice": prices.ravel(), "buyPrice": (prices * 1.02).ravel()}
+        for col in VALUE_COLUMNS[2:]:
+            cols[col] = rng.integers(0, 10_000_000, prices.size)
+        store.append(np.repeat(chunk, PRODUCTS), pids * len(chunk), cols)
+
+
+def legacy_top(run):
+    """The pre-rollup /top view over the cached snapshot frame (verbatim, but with stable tie-breaking)."""
+    from flask import request, render_template
+    df = run.SNAPSHOT_CACHE.frame()
+    if df.empty:
+        return "No data available."
+    variations = []
+    compare_mode = request.args.get("compare", "").lower()
+    now = datetime.now()
+    if compare_mode == "2min":
+        target_time = now - timedelta(minutes=2)
+        for pid, group in df.groupby("product_id", observed=True):
+            group_sorted = group.sort_values("snapshot_time")
+            if len(group_sorted) < 2:
+                continue
+            prev = group_sorted.iloc[(group_sorted["snapshot_time"] - target_time).abs().argsort(kind="stable")].iloc[0]
+            latest = group_sorted.iloc[-1]
+            if prev["snapshot_time"] >= latest["snapshot_time"]:
+                continue
+            raw_margin = latest["sellPrice"] - prev["sellPrice"]
+            perc = (raw_margin / prev["sellPrice"] * 100) if prev["sellPrice"] else 0
+            variations.append({"product_id": pid, "previous_price": prev["sellPrice"],
+                               "current_price": latest["sellPrice"], "raw_margin": raw_margin,
+                               "percentage_variation": perc,
+                               "snapshot_time": latest["snapshot_time"].strftime("%Y-%m-%d %H:%M:%S")})
+        variations.sort(key=lambda x: abs(x["percentage_variation"]), reverse=True)
+    else:
+        time_filter = request.args.get("time_filter", "all").lower()
+        time_deltas = {"minute": timedelta(minutes=2), "hour": timedelta(hours=1),
+                       "day": timedelta(days=1), "week": timedelta(weeks=1),
+                       "month": timedelta(days=30), "year": timedelta(days=365), "all": None}
+        delta = time_deltas.get(time_filter)
+        if delta:
+            df = df[df["snapshot_time"] >= now - delta]
+        for pid, group in df.groupby("product_id", observed=True):
+            group_sorted = group.sort_values("snapshot_time")
+            if len(group_sorted) < 2:
+                continue
+            first = group_sorted.iloc[0]
+            last = group_sorted.iloc[-1]
+            raw_margin = last["sellPrice"] - first["sellPrice"]
+            perc = (raw_margin / first["sellPrice"] * 100) if first["sellPrice"] else 0
+            variations.append({"product_id": pid, "previous_price": first["sellPrice"],
+                               "current_price": last["sellPrice"], "raw_margin": raw_margin,
+                               "percentage_variation": perc,
+                               "snapshot_time": last["snapshot_time"].strftime("%Y-%m-%d %H:%M:%S")})
+        sort_by = request.args.get("sort_by", "percentage_variation")
+        sort_order = request.args.get("sort_order", "desc")
+        variations.sort(key=lambda x: x.get(sort_by, 0), reverse=(sort_order == "desc"))
+    try:
+        min_perc = float(request.args.get("min_percentage", 0))
+    except Exception:
+        min_perc = 0
+    try:
+        min_margin = float(request.args.get("min_margin", 0))
+    except Exception:
+        min_margin = 0
+    variations = [v for v in variations if abs(v["percentage_variation"]) >= min_perc and abs(v["raw_margin"]) >= min_margin]
+    return render_template("top.html", variations=variations[:100],
+                           current_filter=request.args.get("time_filter", "all"), compare_mode=compare_mode,
+                           last_event=run.STREAM.last_id)
+
+
+def check_parity(client, clock):
+    for url in URLS:
+        for attempt in range(3):
+            second = clock()
+            new = client.get(url).data
+            old = client.get(url.replace("/top", "/legacy_top", 1)).data
+            if new == old:
+                break
+            if clock() == second:  # not just a window edge crossed between the two requests
+                raise SystemExit(f"/top differs from the legacy view for {url}")
+        else:
+            raise SystemExit(f"/top differs from the legacy view for {url}")
+
+
+def load(client, prefix, threads, requests):
+    latencies = []
+    lock = threading.Lock()
+    per_thread = max(1, requests // threads)
+
+    def worker(seed):
+        mine = []
+        for i in range(per_thread):
+            url = URLS[(seed + i) % len(URLS)].replace("/top", prefix, 1)
+            t0 = time.perf_counter()
+            client.get(url)
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(mine)
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(k,)) for k in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    ms = np.array(latencies) * 1000
+    return len(ms) / elapsed, np.percentile(ms, 50), np.percentile(ms, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=int, default=48, help="history to generate (default: 48)")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=800, help="requests for the rollup path")
+    parser.add_argument("--legacy-requests", type=int, default=40, help="requests for the legacy path (0 to skip)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bz_top_bench_")
+    try:
+        end = int(np.datetime64(datetime.now(), "s").astype(np.int64))
+        t0 = time.perf_counter()
+        generate(SnapshotStore(os.path.join(workdir, "snapshot_store")), end, args.hours * 3600 // TICK_SECONDS)
+        print(f"# generated {args.hours}h x {PRODUCTS} products in {time.perf_counter() - t0:.1f}s", flush=True)
+        os.chdir(workdir)
+        t0 = time.perf_counter()
+        import run
+        run.create_app()
+        print(f"# imported run (cache load + rollup build) in {time.perf_counter() - t0:.1f}s", flush=True)
+        import logging
+        logging.disable(logging.CRITICAL)
+        run.app.add_url_rule("/legacy_top", "legacy_top", lambda: legacy_top(run))
+        client = run.app.test_client()
+
+        check_parity(client, run.now_epoch)
+        # Fold in one more tick incrementally and check again.
+        time.sleep(1)
+        generate(run.STORE, run.now_epoch(), 1, seed=1)
+        run.SNAPSHOT_CACHE.refresh()
+        t0 = time.perf_counter()
+        run.ROLLUPS.update(run.SNAPSHOT_CACHE, run.now_epoch())
+        print(f"# incremental rollup update for one tick: {(time.perf_counter() - t0) * 1000:.1f}ms")
+        check_parity(client, run.now_epoch)
+        print("# parity: /top matches the legacy view for all", len(URLS), "URLs")
+
+        print(f"{'path':<12} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+        rps, p50, p99 = load(client, "/top", args.threads, args.requests)
+        print(f"{'rollups':<12} {rps:>9.1f} {p50:>9.2f} {p99:>9.2f}", flush=True)
+        if args.legacy_requests:
+            rps, p50, p99 = load(client, "/legacy_top", args.threads, args.legacy_requests)
+            print(f"{'legacy':<12} {rps:>9.1f} {p50:>9.2f} {p99:>9.2f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
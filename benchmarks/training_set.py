@@ -0,0 +1,118 @@
+"""Microbenchmark: legacy O(n^2) prepare_training_data loop vs build_training_set.
+
+    python benchmarks/training_set.py                  # 1k, 10k, 100k rows per product
+    python benchmarks/training_set.py 5000 --legacy-max 5000
+
+Before timing, both implementations are checked for identical X, y and mean
+dt on every product of market_snapshot.csv and on synthetic series (the
+legacy path only runs up to --legacy-max rows; it is quadratic).
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from training import FEATURE_COLUMNS, build_training_set  # noqa: E402
+
+
+def legacy_prepare(snapshots, window_seconds=600):
+    """The pre-vectorization loop body of prepare_training_data, verbatim."""
+    if not snapshots or len(snapshots) < 5:
+        return None
+    X, y, dt_diffs = [], [], []
+    for row in snapshots:
+        try:
+            current_time = row["snapshot_time"].to_pydatetime() if isinstance(row["snapshot_time"], pd.Timestamp) else datetime.strptime(row["snapshot_time"], "%Y-%m-%d %H:%M:%S")
+        except Exception:
+            continue
+        future = [r for r in snapshots if 0 < ( (r["snapshot_time"].to_pydatetime() if isinstance(r["snapshot_time"], pd.Timestamp) else datetime.strptime(r["snapshot_time"], "%Y-%m-%d %H:%M:%S")) - current_time).total_seconds() <= window_seconds]
+        if not future:
+            continue
+        peak = max(future, key=lambda r: float(r["sellPrice"]))
+        X.append([current_time.timestamp(), float(row["sellVolume"]), float(row["buyVolume"]), float(row["sellOrders"]), float(row["buyOrders"])])
+        y.append(float(peak["sellPrice"]))
+        dt_diffs.append(((peak["snapshot_time"].to_pydatetime() if isinstance(peak["snapshot_time"], pd.Timestamp) else datetime.strptime(peak["snapshot_time"], "%Y-%m-%d %H:%M:%S")) - current_time).total_seconds())
+    if len(X) < 5:
+        return None
+    avg_dt = np.mean(dt_diffs)
+    return np.array(X), np.array(y), avg_dt
+
+
+def vectorized_prepare(frame, window_seconds=600):
+    """prepare_training_data as run.py now does it, on a time-sorted product frame."""
+    if len(frame) < 5:
+        return None
+    times = frame["snapshot_time"].values.astype("datetime64[s]").astype(np.int64)
+    X, y, dt = build_training_set(times, frame["sellPrice"].to_numpy(),
+                                  frame[FEATURE_COLUMNS].to_numpy(), window_seconds)
+    if len(X) < 5:
+        return None
+    return X, y, np.mean(dt)
+
+
+def synthetic(rows, seed=0):
+    """One product's history: ~120s ticks with jitter, repeated prices and duplicate times."""
+    rng = np.random.default_rng(seed)
+    steps = rng.choice([0, 1, 60, 120, 121, 125, 240], size=rows, p=[.02, .08, .05, .5, .2, .1, .05])
+    times = np.datetime64("2025-04-28T18:00:00") + np.cumsum(steps).astype("timedelta64[s]")
+    price = np.round(100 + np.cumsum(rng.normal(0, 1, rows)), 1)
+    frame = pd.DataFrame({"snapshot_time": times, "sellPrice": price})
+    for col in FEATURE_COLUMNS:
+        frame[col] = rng.integers(0, 1_000_000, rows)
+    return frame
+
+
+def check(frame):
+    legacy = legacy_prepare(frame.to_dict(orient="records"))
+    fast = vectorized_prepare(frame)
+    if legacy is None or fast is None:
+        assert legacy is None and fast is None, "one implementation returned None"
+        return
+    for a, b in zip(legacy, fast):
+        np.testing.assert_allclose(a, b, rtol=0, atol=1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("rows", nargs="*", type=int, default=[1_000, 10_000, 100_000])
+    parser.add_argument("--legacy-max", type=int, default=2_000, help="largest size to run the legacy loop on")
+    args = parser.parse_args()
+
+    os.environ["TZ"] = "UTC"  # legacy X[:, 0] uses local-time datetime.timestamp()
+    time.tzset()
+    fixture = os.path.join(ROOT, "market_snapshot.csv")
+    if os.path.exists(fixture):
+        df = pd.read_csv(fixture)
+        df["snapshot_time"] = pd.to_datetime(df["snapshot_time"], format="%Y-%m-%d %H:%M:%S")
+        df = df.sort_values("snapshot_time", kind="stable")
+        for _, group in df.groupby("product_id"):
+            check(group)
+        print(f"parity ok on {df['product_id'].nunique()} products of {fixture}")
+    for seed, rows in enumerate([5, 6, 50, 500]):
+        check(synthetic(rows, seed))
+    print("parity ok on synthetic series")
+
+    print(f"{'rows':>8}  {'legacy':>10}  {'vectorized':>10}  speedup")
+    for rows in args.rows:
+        frame = synthetic(rows)
+        t0 = time.perf_counter()
+        vectorized_prepare(frame)
+        fast = time.perf_counter() - t0
+        if rows <= args.legacy_max:
+            records = frame.to_dict(orient="records")
+            t0 = time.perf_counter()
+            legacy_prepare(records)
+            slow = time.perf_counter() - t0
+            print(f"{rows:>8}  {slow:>9.3f}s  {fast:>9.4f}s  {slow / fast:>6.0f}x")
+        else:
+            print(f"{rows:>8}  {'skipped':>10}  {fast:>9.4f}s")
+
+
+if __name__ == "__main__":
+    main()
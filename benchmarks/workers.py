@@ -0,0 +1,115 @@
+"""Memory and CPU of `gunicorn -w N` with the shared data plane, for several N.
+
+    python benchmarks/workers.py                  # -w 1 and -w 8, 1,300 products
+    python benchmarks/workers.py --workers 1 2 4 8 --hours 12
+
+For each worker count a copy of the app is started with gunicorn (which, via
+gunicorn.conf.py, also starts the single ingest process) against the stub
+Bazaar API and a synthetic snapshot history. Once the first version has been
+published every route is requested a few times through the pool, and we
+report, per role, proportional set size (PSS: shared pages are split between
+the processes that map them, so the sum is the real footprint) and CPU
+seconds. Fetching, training and the snapshot history should be paid once,
+whatever N is.
+"""
+import os
+import sys
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+from datetime import datetime
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from snapshot_store import SnapshotStore  # noqa: E402
+from stub_bazaar import start_stub, synthetic_payload  # noqa: E402
+from top_load import generate, TICK_SECONDS  # noqa: E402
+
+URLS = ["/", "/top", "/top?time_filter=hour", "/top?compare=2min", "/investments",
+        "/predict/ITEM_3", "/plot/ITEM_3", "/depth/ITEM_3"]
+
+
+def proc_stats(pid):
+    """(PSS in MiB, CPU seconds) of one process."""
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        pss = next(int(line.split()[1]) for line in f if line.startswith("Pss:"))
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    ticks = os.sysconf("SC_CLK_TCK")
+    return pss / 1024, (int(fields[11]) + int(fields[12])) / ticks
+
+
+def children(pid):
+    """Child pids of every thread of pid (the ingest process is spawned from a supervisor thread)."""
+    pids = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            pids += [int(p) for p in f.read().split()]
+    return pids
+
+
+def run(workdir, n_workers, url, port, settle):
+    env = dict(os.environ, BAZAAR_API_URL=url, TRAIN_WORKERS="2")
+    server = subprocess.Popen(["gunicorn", "-w", str(n_workers), "-b", f"127.0.0.1:{port}", "run:create_app()"],
+                              cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        version = os.path.join(workdir, "snapshot_store", "shared", "VERSION")
+        deadline = time.time() + 120
+        while not os.path.exists(version) and time.time() < deadline:
+            time.sleep(0.5)
+        time.sleep(settle)
+        for _ in range(3):
+            for path in URLS:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=60).read()
+        roles = {"master": [server.pid], "ingest": [], "web": []}
+        for pid in children(server.pid):
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                role = "ingest" if b"run.py" in f.read() else "web"
+            roles[role].append(pid)
+        return {role: [proc_stats(pid) for pid in pids] for role, pids in roles.items()}
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--hours", type=float, default=6, help="history to generate")
+    parser.add_argument("--settle", type=float, default=30, help="seconds to let ingest fetch and train first")
+    parser.add_argument("--port", type=int, default=8019)
+    args = parser.parse_args()
+
+    stub, url, _ = start_stub([synthetic_payload(1300, t) for t in range(5)])
+    tmp = tempfile.mkdtemp(prefix="bz_workers_bench_")
+    try:
+        print(f"{'workers':>8} {'role':>7} {'procs':>6} {'PSS MiB':>9} {'CPU s':>7}")
+        for n in args.workers:
+            workdir = os.path.join(tmp, f"w{n}")
+            shutil.copytree(ROOT, workdir, ignore=shutil.ignore_patterns(
+                "snapshot_store", "*.csv", ".git", "__pycache__", "benchmarks"))
+            end = int(np.datetime64(datetime.now(), "s").astype(np.int64))
+            generate(SnapshotStore(os.path.join(workdir, "snapshot_store")), end,
+                     int(args.hours * 3600 // TICK_SECONDS))
+            stats = run(workdir, n, url, args.port, args.settle)
+            total = [0.0, 0.0]
+            for role, rows in stats.items():
+                pss, cpu = (sum(r[0] for r in rows), sum(r[1] for r in rows))
+                total[0] += pss
+                total[1] += cpu
+                print(f"{n:>8} {role:>7} {len(rows):>6} {pss:>9.1f} {cpu:>7.1f}")
+            print(f"{n:>8} {'total':>7} {'':>6} {total[0]:>9.1f} {total[1]:>7.1f}")
+    finally:
+        stub.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Per-tick write cost: legacy row-at-a-time CSV writer vs TickWriter.
+
+    python benchmarks/write_tick.py                     # 1,300 products x 30 tiers, 20 ticks
+    python benchmarks/write_tick.py --ticks 50 --tiers 10
+
+For each writer, ticks of a synthetic Bazaar payload are written into a temp
+directory (logging goes to a file there, as it would on a server) and we
+report the mean wall time per tick and, per tick, the write()/read() syscalls
+(from /proc/self/io), files opened (audit hook), fsyncs and bytes on disk.
+Every order-book tier TickWriter stored is read back through DepthStore and
+checked against the payload, and /depth-style queries are timed.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from snapshot_store import SnapshotStore, VALUE_COLUMNS  # noqa: E402
+from tick_writer import TickWriter  # noqa: E402
+from depth_store import DepthStore, SIDES  # noqa: E402
+from stub_bazaar import synthetic_payload  # noqa: E402
+
+COUNTS = {"opens": 0, "fsyncs": 0}
+
+
+def _audit(event, args):
+    if event == "open":
+        COUNTS["opens"] += 1
+
+
+_fsync = os.fsync
+
+
+def _counting_fsync(fd):
+    COUNTS["fsyncs"] += 1
+    return _fsync(fd)
+
+
+def proc_io():
+    with open("/proc/self/io") as f:
+        io = dict(line.split(": ") for line in f.read().splitlines())
+    return int(io["syscw"]), int(io["syscr"])
+
+
+def legacy_write(store, sell_path, buy_path, now, products):
+    """The pre-TickWriter body of fetch_and_log_data's write path, verbatim."""
+    snapshot_time = now.isoformat(sep=" ")
+    quick = [info.get("quick_status", {}) for info in products.values()]
+    store.append(np.full(len(quick), np.datetime64(now, "s").astype(np.int64)),
+                 list(products.keys()),
+                 {col: np.array([q.get(col, 0) for q in quick]) for col in VALUE_COLUMNS})
+    with open(sell_path, "a", newline="", encoding="utf-8") as sell_f, \
+         open(buy_path, "a", newline="", encoding="utf-8") as buy_f:
+        sell_writer = csv.writer(sell_f)
+        buy_writer = csv.writer(buy_f)
+        for pid, info in products.items():
+            for i, sell in enumerate(info.get("sell_summary", [])):
+                sell_writer.writerow([snapshot_time, pid,
+                                      sell.get("pricePerUnit", 0.0),
+                                      sell.get("amount", 0),
+                                      sell.get("orders", 0), i])
+            for i, buy in enumerate(info.get("buy_summary", [])):
+                buy_writer.writerow([snapshot_time, pid,
+                                     buy.get("pricePerUnit", 0.0),
+                                     buy.get("amount", 0),
+                                     buy.get("orders", 0), i])
+            logging.info(f"Logged data for {pid} at {snapshot_time}")
+
+
+def run_writer(kind, workdir, payloads, sync):
+    os.makedirs(workdir)
+    sell_path = os.path.join(workdir, "sell_summary.csv")
+    buy_path = os.path.join(workdir, "buy_summary.csv")
+    store = SnapshotStore(os.path.join(workdir, "snapshot_store"))
+    handler = logging.FileHandler(os.path.join(workdir, "app.log"))
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(logging.INFO)
+    if kind == "legacy":
+        for path in (sell_path, buy_path):
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(["snapshot_time", "product_id", "pricePerUnit", "amount", "orders", "tier_rank"])
+        write = lambda now, products: legacy_write(store, sell_path, buy_path, now, products)  # noqa: E731
+    else:
+        writer = TickWriter(store, DepthStore(os.path.join(store.root, "depth"), store), sync=sync)
+
+        def write(now, products):
+            stats = writer.write(now, products)
+            logging.info(f"Logged {stats['products']} products, {stats['sell_summary']} sell / "
+                         f"{stats['buy_summary']} buy tiers at {now} in {stats['seconds'] * 1000:.0f}ms")
+
+    start = datetime(2025, 1, 1)
+    seconds = []
+    COUNTS.update(opens=0, fsyncs=0)
+    syscw0, syscr0 = proc_io()
+    for i, products in enumerate(payloads):
+        t0 = time.perf_counter()
+        write(start + timedelta(minutes=2 * i), products)
+        seconds.append(time.perf_counter() - t0)
+    syscw1, syscr1 = proc_io()
+    handler.close()
+    n = len(payloads)
+    disk = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(workdir) for f in files
+               if not f.endswith(".log"))
+    return {
+        "writer": kind if kind == "legacy" else f"tick_writer{'' if sync else ' (no fsync)'}",
+        "ms_per_tick": round(float(np.mean(seconds)) * 1000, 2),
+        "write_syscalls_per_tick": round((syscw1 - syscw0) / n, 1),
+        "read_syscalls_per_tick": round((syscr1 - syscr0) / n, 1),
+        "opens_per_tick": round(COUNTS["opens"] / n, 1),
+        "fsyncs_per_tick": round(COUNTS["fsyncs"] / n, 1),
+        "disk_kib_per_tick": round(disk / n / 1024, 1),
+    }
+
+
+def check_depth(workdir, payloads):
+    """Every stored tier matches the payload; returns p50/p99 query time in ms."""
+    store = SnapshotStore(os.path.join(workdir, "snapshot_store"))
+    depth = DepthStore(os.path.join(workdir, "snapshot_store", "depth"), store)
+    for tick, products in enumerate(payloads):
+        for pid, info in products.items():
+            code = store.codes[pid]
+            for side, key in SIDES.items():
+                prices, amounts, orders = depth.levels(code, side, tick)
+                tiers = info.get(key, [])
+                if prices.tolist() != [t["pricePerUnit"] for t in tiers] or \
+                        amounts.tolist() != [t["amount"] for t in tiers] or \
+                        orders.tolist() != [t["orders"] for t in tiers]:
+                    raise SystemExit(f"DepthStore disagrees with the payload for {pid} {side} at tick {tick}")
+    rng = np.random.default_rng(0)
+    pids = list(payloads[0])
+    times = []
+    for _ in range(2000):
+        pid, tick = pids[rng.integers(len(pids))], int(rng.integers(len(payloads)))
+        t0 = time.perf_counter()
+        depth.depth(pid, tick, quantity=100_000)
+        times.append(time.perf_counter() - t0)
+    return np.percentile(times, 50) * 1000, np.percentile(times, 99) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=1300)
+    parser.add_argument("--tiers", type=int, default=30, help="order-book tiers per side")
+    parser.add_argument("--ticks", type=int, default=20)
+    args = parser.parse_args()
+
+    payloads = [json.loads(synthetic_payload(args.products, t, tiers=args.tiers))["products"]
+                for t in range(args.ticks)]
+    sys.addaudithook(_audit)
+    os.fsync = _counting_fsync
+    workdir = tempfile.mkdtemp(prefix="bz_write_bench_")
+    try:
+        results = []
+        for kind, sync in (("legacy", False), ("tick_writer", True), ("tick_writer", False)):
+            results.append(run_writer(kind, os.path.join(workdir, f"{kind}-{sync}"), payloads, sync))
+        p50, p99 = check_depth(os.path.join(workdir, "tick_writer-True"), payloads)
+        print(f"# {args.products} products x {args.tiers} tiers/side, {args.ticks} ticks; depth store matches "
+              f"the payloads; depth query p50 {p50:.3f}ms, p99 {p99:.3f}ms")
+        keys = list(results[0])
+        print("  ".join(f"{k:>24}" if i else f"{k:<24}" for i, k in enumerate(keys)))
+        for r in results:
+            print("  ".join(f"{r[k]:>24}" if i else f"{r[k]:<24}" for i, k in enumerate(keys)))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Plotly figure specs for /plot, built as plain JSON-able dicts.
+
+The browser renders them with plotly.js (served once as a static asset), so
+the server never imports plotly and never inlines the bundle. Long series
+are reduced with Largest-Triangle-Three-Buckets (LTTB), which keeps the
+visual shape - peaks, troughs, the first and last point - with a bounded
+number of points. Times are sent as epoch milliseconds on date axes; like
+snapshot_time they are naive local wall-clock, and plotly shows them as-is.
+"""
+import numpy as np
+
+MAX_POINTS = 1500  # per trace; LTTB above this
+
+
+def lttb(x, y, threshold):
+    """Indices of the threshold points of (x, y) that LTTB keeps (all of them if there are fewer)."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Buckets over the inner points; the first and last point are always kept.
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    avg_x = np.append(avg_x[1:], x[-1])  # each bucket looks at the next bucket's mean
+    avg_y = np.append(avg_y[1:], y[-1])
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def _trace(times_ms, values, name, mode="lines+markers", max_points=MAX_POINTS, **extra):
+    idx = lttb(times_ms, values, max_points)
+    return dict({"type": "scatter", "x": np.asarray(times_ms)[idx].tolist(),
+                 "y": np.asarray(values, dtype=float)[idx].tolist(), "mode": mode, "name": name}, **extra)
+
+
+def _layout(title, y_title, **extra):
+    return dict({"title": {"text": title}, "xaxis": {"title": {"text": "Time"}, "type": "date"},
+                 "yaxis": {"title": {"text": y_title}}}, **extra)
+
+
+def product_figures(product_id, series, forecast=None, max_points=MAX_POINTS):
+    """{"price", "sell_volume", "buy_volume"} figures from a product's column views.
+
+    forecast is (future_times, predictions, peak_time, peak_price, confidence)
+    with epoch-second times, or None.
+    """
+    times_ms = series["snapshot_time"].astype(np.int64) * 1000
+    price = [_trace(times_ms, series["sellPrice"], "Sell Price", max_points=max_points),
+             _trace(times_ms, series["buyPrice"], "Buy Price", max_points=max_points)]
+    if forecast is not None:
+        future_times, preds, peak_time, peak_price, confidence = forecast
+        price.append(_trace(np.asarray(future_times, dtype=np.int64) * 1000, preds, "Predicted Trend",
+                            mode="lines", max_points=max_points))
+        price.append({"type": "scatter", "x": [int(peak_time) * 1000], "y": [float(peak_price)],
+                      "mode": "markers", "marker": {"size": 12, "symbol": "star"},
+                      "name": f"Expected Peak (Conf: {confidence:.2f}%)"})
+    return {
+        "price": {"data": price,
+                  "layout": _layout(f"Price Evolution for {product_id}", "Price", hovermode="x unified")},
+        "sell_volume": {"data": [_trace(times_ms, series["sellVolume"], "Sell Volume", max_points=max_points)],
+                        "layout": _layout(f"Sell Volume for {product_id}", "Volume")},
+        "buy_volume": {"data": [_trace(times_ms, series["buyVolume"], "Buy Volume", max_points=max_points)],
+                       "layout": _layout(f"Buy Volume for {product_id}", "Volume")},
+    }
@@ -0,0 +1,219 @@
+"""Compact, memory-mapped store for Bazaar order-book tiers (sell_summary / buy_summary).
+
+Layout on disk:
+
+    <root>/ticks.bin               one record per tick: (snapshot_time, sell rows, buy rows)
+    <root>/<side>/<col>.bin        raw little-endian columns per side (sell, buy):
+                                   tick <i4, product <i4, price <f8, amount <i8, orders <i4
+
+The row index of a tick is its position in ticks.bin, and the row counts
+in that record are cumulative. So tick i covers rows [ticks[i-1], ticks[i])
+of each side. Inside a tick, rows are sorted by product code with the tiers
+in API order, so one product's book is a binary search on the product column
+of that slice. Product ids are interned in the SnapshotStore dictionary.
+
+Readers memory-map the columns, so a query touches a few pages of the
+files and never loads the history. As in the snapshot store, a tick becomes
+visible only once its ticks.bin record is appended, after the column
+blocks. The next writer truncates anything an interrupted write left
+past the last record.
+"""
+import os
+import logging
+import threading
+from itertools import chain
+
+import numpy as np
+
+SIDES = {"sell": "sell_summary", "buy": "buy_summary"}  # side -> payload key / legacy CSV name
+COLUMNS = {
+    "tick": np.dtype("<i4"),
+    "product": np.dtype("<i4"),
+    "price": np.dtype("<f8"),
+    "amount": np.dtype("<i8"),
+    "orders": np.dtype("<i4"),
+}
+TICK_DTYPE = np.dtype([("snapshot_time", "<i8"), ("sell", "<i8"), ("buy", "<i8")])
+
+
+def fill(prices, amounts, quantity):
+    """Walk tiers in order to fill quantity; returns filled amount, cost, average and worst price."""
+    before = np.cumsum(amounts) - amounts
+    take = np.clip(quantity - before, 0, amounts)
+    filled = float(take.sum())
+    cost = float((take * prices).sum())
+    used = np.flatnonzero(take > 0)
+    return {
+        "quantity": quantity,
+        "filled": filled,
+        "complete": filled >= quantity,
+        "cost": cost,
+        "average_price": cost / filled if filled else None,
+        "worst_price": float(prices[used[-1]]) if len(used) else None,
+    }
+
+
+class DepthStore:
+    """Append-only order-book tier store; dictionary is the SnapshotStore whose product codes it shares."""
+
+    def __init__(self, root, dictionary):
+        self.root = root
+        self.dictionary = dictionary
+        self._ticks_path = os.path.join(root, "ticks.bin")
+        self._lock = threading.Lock()
+        self._maps = {}  # (side, col) -> memmap over the committed rows
+        self._ticks = np.empty(0, dtype=TICK_DTYPE)
+        for side in SIDES:
+            os.makedirs(os.path.join(root, side), exist_ok=True)
+
+    def _path(self, side, col):
+        return os.path.join(self.root, side, f"{col}.bin")
+
+    # ---- committed state -------------------------------------------------
+    def ticks(self):
+        """Memory-mapped tick table, remapped when another writer has committed more ticks."""
+        try:
+            n = os.path.getsize(self._ticks_path) // TICK_DTYPE.itemsize
+        except FileNotFoundError:
+            n = 0
+        if n != len(self._ticks):
+            with self._lock:
+                if n != len(self._ticks):
+                    self._ticks = (np.memmap(self._ticks_path, dtype=TICK_DTYPE, mode="r", shape=(n,))
+                                   if n else np.empty(0, dtype=TICK_DTYPE))
+        return self._ticks
+
+    def _column(self, side, col, rows):
+        if rows == 0:
+            return np.empty(0, dtype=COLUMNS[col])
+        mapped = self._maps.get((side, col))
+        if mapped is None or len(mapped) < rows:
+            mapped = np.memmap(self._path(side, col), dtype=COLUMNS[col], mode="r", shape=(rows,))
+            self._maps[(side, col)] = mapped
+        return mapped
+
+    # ---- writing ---------------------------------------------------------
+    def append(self, snapshot_time, products, sync=False):
+        """Commit one tick of {product_id: {"sell_summary": [...], "buy_summary": [...]}}. Returns tier rows per side."""
+        codes = self.dictionary.encode(list(products), sync)
+        blocks = {}
+        for side, key in SIDES.items():
+            tiers = [info.get(key, []) for info in products.values()]
+            counts = np.fromiter(map(len, tiers), dtype=np.int64, count=len(tiers))
+            n = int(counts.sum())
+            flat = list(chain.from_iterable(tiers))
+            block = {
+                "product": np.repeat(codes, counts),
+                "price": np.fromiter((t.get("pricePerUnit", 0.0) for t in flat), dtype=COLUMNS["price"], count=n),
+                "amount": np.fromiter((t.get("amount", 0) for t in flat), dtype=COLUMNS["amount"], count=n),
+                "orders": np.fromiter((t.get("orders", 0) for t in flat), dtype=COLUMNS["orders"], count=n),
+            }
+            order = np.argsort(block["product"], kind="stable")  # keeps each product's tiers in order
+            blocks[side] = {col: arr[order] for col, arr in block.items()}
+        with self._lock:
+            size = os.path.getsize(self._ticks_path) if os.path.exists(self._ticks_path) else 0
+            n_ticks = size // TICK_DTYPE.itemsize
+            if size % TICK_DTYPE.itemsize:
+                os.truncate(self._ticks_path, n_ticks * TICK_DTYPE.itemsize)
+            last = (np.fromfile(self._ticks_path, dtype=TICK_DTYPE, count=1,
+                                offset=(n_ticks - 1) * TICK_DTYPE.itemsize)[0] if n_ticks else None)
+            record = [snapshot_time]
+            for side, block in blocks.items():
+                committed = int(last[side]) if last is not None else 0
+                block["tick"] = np.full(len(block["product"]), n_ticks, dtype=COLUMNS["tick"])
+                for col, dtype in COLUMNS.items():
+                    path = self._path(side, col)
+                    with open(path, "ab") as f:
+                        if f.tell() > committed * dtype.itemsize:  # left over from an interrupted write
+                            f.truncate(committed * dtype.itemsize)
+                        f.write(block[col].astype(dtype, copy=False).tobytes())
+                        if sync:
+                            f.flush()
+                            os.fsync(f.fileno())
+                record.append(committed + len(block["product"]))
+            with open(self._ticks_path, "ab") as f:
+                f.write(np.array([tuple(record)], dtype=TICK_DTYPE).tobytes())
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+        return {side: len(block["product"]) for side, block in blocks.items()}
+
+    # ---- reading ---------------------------------------------------------
+    def tick_at(self, epoch):
+        """Id of the newest tick taken at or before epoch, or None."""
+        ticks = self.ticks()
+        i = int(np.searchsorted(ticks["snapshot_time"], epoch, side="right")) - 1
+        return i if i >= 0 else None
+
+    def levels(self, code, side, tick):
+        """(price, amount, orders) arrays of one product's tiers at tick, best tier first."""
+        ticks = self.ticks()
+        start = int(ticks[tick - 1][side]) if tick else 0
+        end = int(ticks[tick][side])
+        products = self._column(side, "product", int(ticks[-1][side]))[start:end]
+        lo = start + int(np.searchsorted(products, code, side="left"))
+        hi = start + int(np.searchsorted(products, code, side="right"))
+        rows = int(ticks[-1][side])
+        return tuple(np.array(self._column(side, col, rows)[lo:hi]) for col in ("price", "amount", "orders"))
+
+    def depth(self, product_id, tick=None, quantity=None, sides=None):
+        """Cumulative depth (and optionally the fill for quantity) of product_id at tick (default: latest).
+
+        Returns None if the product or tick is unknown.
+        """
+        ticks = self.ticks()
+        if len(ticks) == 0:
+            return None
+        tick = len(ticks) - 1 if tick is None else tick
+        if not 0 <= tick < len(ticks):
+            return None
+        self.dictionary.reload_dictionary()
+        code = self.dictionary.codes.get(product_id)
+        if code is None:
+            return None
+        result = {
+            "product_id": product_id,
+            "tick": tick,
+            "snapshot_time": str(np.datetime64(int(ticks[tick]["snapshot_time"]), "s")).replace("T", " "),
+        }
+        for side in sides or SIDES:
+            prices, amounts, orders = self.levels(code, side, tick)
+            result[side] = {
+                "levels": [{"price": p, "amount": a, "orders": o, "cumulative_amount": c}
+                           for p, a, o, c in zip(prices.tolist(), amounts.tolist(), orders.tolist(),
+                                                 np.cumsum(amounts).tolist())],
+                "total_amount": int(amounts.sum()),
+            }
+            if quantity is not None:
+                result[side]["fill"] = fill(prices, amounts, quantity)
+        return result
+
+    # ---- migration -------------------------------------------------------
+    def migrate_csv(self, sell_path, buy_path=None):
+        """One-shot import of legacy sell_summary.csv / buy_summary.csv. Returns ticks imported."""
+        import pandas as pd
+        frames = []
+        for side, path in (("sell", sell_path), ("buy", buy_path)):
+            if path and os.path.exists(path):
+                frame = pd.read_csv(path)
+                frame["side"] = SIDES[side]
+                frames.append(frame)
+        if not frames:
+            return 0
+        rows = pd.concat(frames, ignore_index=True).dropna(subset=["snapshot_time", "product_id"])
+        # Concurrent writers (one fetcher per gunicorn worker) logged some ticks twice.
+        rows = rows.drop_duplicates(["snapshot_time", "side", "product_id", "tier_rank"])
+        rows = rows.sort_values(["snapshot_time", "side", "product_id", "tier_rank"], kind="stable")
+        ticks = 0
+        for snapshot_time, tick in rows.groupby("snapshot_time", sort=True):
+            products = {}
+            for (pid, side), tiers in tick.groupby(["product_id", "side"], sort=False):
+                products.setdefault(pid, {})[side] = [
+                    {"pricePerUnit": p, "amount": a, "orders": o}
+                    for p, a, o in zip(tiers["pricePerUnit"].tolist(), tiers["amount"].tolist(),
+                                       tiers["orders"].tolist())]
+            epoch = int(np.datetime64(pd.Timestamp(snapshot_time), "s").astype(np.int64))
+            self.append(epoch, products)
+            ticks += 1
+        logging.info(f"Migrated {ticks} order-book ticks into {self.root}")
+        return ticks
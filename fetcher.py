@@ -0,0 +1,143 @@
+"""Asyncio poller for the Hypixel Bazaar endpoint.
+
+One pooled keep-alive HTTP session is reused for every poll. Requests are
+conditional (If-None-Match / If-Modified-Since), and payloads whose
+lastUpdated has not moved are dropped, so an unchanged bazaar costs one 304
+and no parsing or writing. Failures back off exponentially with jitter
+instead of sleeping a fixed interval. New payloads go through a small
+bounded queue to a separate writer task, so slow disk I/O never delays the
+next poll; if the writer falls behind, the oldest queued tick is dropped.
+"""
+import json
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import SIZE_BUCKETS, Counter, Histogram
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:  # optional speed-up
+    loads = json.loads
+
+FETCH_SECONDS = Histogram("bz_fetch_seconds", "Bazaar API request latency in seconds, 304s included")
+FETCH_BYTES = Histogram("bz_fetch_payload_bytes", "Size of fetched Bazaar payloads in bytes", SIZE_BUCKETS)
+FETCH_POLLS = Counter("bz_fetch_polls_total", "Bazaar API polls by result (new, not_modified, unchanged, error)")
+
+
+class BazaarFetcher:
+    """Polls url every interval seconds and calls handle(snapshot_time, products) for new data.
+
+    handle runs in a worker thread; snapshot_time is the naive local time the
+    poll started, to the second.
+    """
+
+    def __init__(self, url, handle, interval=120, timeout=10, queue_size=2,
+                 backoff_base=5, backoff_max=600):
+        self.url = url
+        self.handle = handle
+        self.interval = interval
+        self.timeout = timeout
+        self.queue_size = queue_size
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.etag = None
+        self.last_modified = None
+        self.last_updated = None
+        self.failures = 0
+        self.stats = {"polls": 0, "new": 0, "not_modified": 0, "unchanged": 0, "errors": 0, "dropped": 0}
+
+    def _get(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return self.session.get(self.url, headers=headers, timeout=self.timeout)
+
+    async def poll(self):
+        """One conditional GET; returns the decoded payload, or None if nothing changed."""
+        with FETCH_SECONDS.time():
+            response = await asyncio.to_thread(self._get)
+        self.stats["polls"] += 1
+        if response.status_code == 304:
+            self.stats["not_modified"] += 1
+            FETCH_POLLS.inc(result="not_modified")
+            return None
+        response.raise_for_status()
+        FETCH_BYTES.observe(len(response.content))
+        data = loads(response.content)
+        if not data.get("success", True):
+            raise ValueError(f"API error: {data.get('cause', 'unknown')}")
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        last_updated = data.get("lastUpdated")
+        if last_updated is not None and last_updated == self.last_updated:
+            self.stats["unchanged"] += 1
+            FETCH_POLLS.inc(result="unchanged")
+            return None
+        self.last_updated = last_updated
+        self.stats["new"] += 1
+        FETCH_POLLS.inc(result="new")
+        return data
+
+    def backoff(self):
+        """Seconds to wait after the current run of failures: exponential, capped, half jittered."""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** max(0, self.failures - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _poll_loop(self, queue, polls):
+        done = 0
+        while polls is None or done < polls:
+            started = time.monotonic()
+            snapshot_time = datetime.now().replace(microsecond=0)
+            done += 1
+            try:
+                data = await self.poll()
+            except Exception as e:
+                self.failures += 1
+                self.stats["errors"] += 1
+                FETCH_POLLS.inc(result="error")
+                delay = self.backoff()
+                logging.error(f"Error fetching API data (failure {self.failures}), retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+            self.failures = 0
+            if data is not None:
+                if queue.qsize() >= self.queue_size:
+                    queue.get_nowait()
+                    self.stats["dropped"] += 1
+                    logging.warning("Snapshot writer is behind; dropped the oldest queued tick")
+                queue.put_nowait((snapshot_time, data.get("products", {})))
+            if polls is None or done < polls:
+                await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+        await queue.put(None)
+
+    async def _write_loop(self, queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            snapshot_time, products = item
+            try:
+                await asyncio.to_thread(self.handle, snapshot_time, products)
+            except Exception as e:
+                logging.error(f"Error writing tick {snapshot_time}: {e}")
+
+    async def run_async(self, polls=None):
+        # maxsize + 1 leaves room for the end-of-polls marker.
+        queue = asyncio.Queue(maxsize=self.queue_size + 1)
+        await asyncio.gather(self._poll_loop(queue, polls), self._write_loop(queue))
+
+    def run(self, polls=None):
+        """Poll forever (or polls times, then drain the writer) on a fresh event loop."""
+        asyncio.run(self.run_async(polls))
@@ -0,0 +1,208 @@
+"""Pluggable forecasting engines for the per-product peak-price models.
+
+An engine is a function fit(X, y, previous=None) -> (model, scaler) over a
+training set from training.build_training_set (X rows are [time, *features]
+in time order, y the peak sellPrice of the next window). The pair is used
+like the original MLP's: inference.predict_batch(models, scalers, X).
+
+    mlp         scaler + 3-layer MLPRegressor (warm-starts from previous)
+    ewma        exponentially weighted level of y, closed form
+    holt        Holt's linear trend (double exponential smoothing)
+    rolling_lr  least-squares line through the last ROLLING_WINDOW rows
+    ridge       ridge regression on time, features and LAGS lagged targets
+
+Every engine but the MLP reduces to a LinearForecast, a + b*(t - t0) + c.x,
+so thousands of them predict with a few vectorized operations and need no
+scaler. select_engine() fits each engine on the older part of a product's
+data and keeps the cheapest whose error on the newest part is within
+SELECT_TOLERANCE of the best. The MLP only joins that contest when the
+cheap engines all miss by more than MLP_SELECT_ERROR, so a reselection
+does not pay for a from-scratch network where a line already does. The
+model's confidence is the share of the naive last-value forecast's
+holdout error that the chosen engine removes.
+"""
+import time
+
+import numpy as np
+
+from inference import predict_batch
+
+HIDDEN_LAYERS = (64, 32, 16)
+MAX_ITER = 500        # iterations for a model fitted from scratch
+WARM_MAX_ITER = 100   # iterations when continuing from the previous fit
+EWMA_ALPHA = 0.3
+HOLT_ALPHA, HOLT_BETA = 0.3, 0.1
+ROLLING_WINDOW = 180  # rows (6 hours of 2-minute snapshots)
+LAGS = 3
+RIDGE_LAMBDA = 1.0
+HOLDOUT = 0.2          # newest share of the rows that select_engine() scores on
+MIN_SELECT_ROWS = 20   # below this there is too little to hold out: DEFAULT_ENGINE
+SELECT_TOLERANCE = 0.1  # an engine within 10% of the best holdout error counts as as good
+DEFAULT_ENGINE = "holt"
+MLP_SELECT_ERROR = 0.02  # holdout MAE (relative to the mean price) above which the MLP is tried too
+
+ENGINES = {}
+
+
+def engine(name):
+    """Register fit(X, y, previous=None) -> (model, scaler) as an engine."""
+    def register(fit):
+        ENGINES[name] = fit
+        return fit
+    return register
+
+
+def engine_name(model):
+    return getattr(model, "engine", "mlp")
+
+
+class LinearForecast:
+    """a + b * (t - t0) + c . features: what every engine but the MLP fits."""
+
+    __slots__ = ("engine", "a", "b", "t0", "c")
+
+    def __init__(self, engine, a, b, t0, c):
+        self.engine = engine
+        self.a, self.b, self.t0 = float(a), float(b), float(t0)
+        self.c = np.asarray(c, dtype=float)
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=float)
+        return self.a + self.b * (X[:, 0] - self.t0) + X[:, 1:] @ self.c
+
+    @staticmethod
+    def predict_stacked(models, X):
+        """X: (G, R, F) -> (G, R) predictions for G LinearForecasts."""
+        a = np.array([m.a for m in models])[:, None]
+        b = np.array([m.b for m in models])[:, None]
+        t0 = np.array([m.t0 for m in models])[:, None]
+        c = np.stack([m.c for m in models])
+        return a + b * (X[:, :, 0] - t0) + np.einsum("grf,gf->gr", X[:, :, 1:], c)
+
+
+def _features(X):
+    return X.shape[1] - 1
+
+
+@engine("mlp")
+def fit_mlp(X, y, previous=None):
+    import warnings
+    from sklearn.exceptions import ConvergenceWarning
+    from sklearn.neural_network import MLPRegressor
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = StandardScaler()
+    X_scaled = scaler.fit_transform(X)
+    if previous is not None and hasattr(previous, "set_params") and \
+            getattr(previous, "n_features_in_", None) == X.shape[1]:
+        model = previous
+        model.set_params(warm_start=True, max_iter=WARM_MAX_ITER)
+    else:
+        model = MLPRegressor(hidden_layer_sizes=HIDDEN_LAYERS, max_iter=MAX_ITER, random_state=42)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", ConvergenceWarning)
+        model.fit(X_scaled, y)
+    return model, scaler
+
+
+@engine("ewma")
+def fit_ewma(X, y, previous=None):
+    n = len(y)
+    weights = EWMA_ALPHA * (1 - EWMA_ALPHA) ** np.arange(n - 1, -1, -1, dtype=float)
+    weights[0] = (1 - EWMA_ALPHA) ** (n - 1)  # the first value seeds the level
+    return LinearForecast("ewma", weights @ y, 0.0, X[-1, 0], np.zeros(_features(X))), None
+
+
+@engine("holt")
+def fit_holt(X, y, previous=None):
+    values = y.tolist()
+    level, trend = values[0], (values[1] - values[0]) if len(values) > 1 else 0.0
+    for value in values[1:]:
+        last = level
+        level = HOLT_ALPHA * value + (1 - HOLT_ALPHA) * (level + trend)
+        trend = HOLT_BETA * (level - last) + (1 - HOLT_BETA) * trend
+    step = float(np.median(np.diff(X[:, 0]))) if len(X) > 1 else 1.0
+    return LinearForecast("holt", level, trend / step if step > 0 else 0.0, X[-1, 0], np.zeros(_features(X))), None
+
+
+def linear_fit(t, y):
+    """(slope, intercept) of the least-squares line through (t, y), in closed form."""
+    t = np.asarray(t, dtype=float)
+    y = np.asarray(y, dtype=float)
+    t_mean, y_mean = t.mean(), y.mean()
+    dt = t - t_mean
+    denom = dt @ dt
+    slope = (dt @ (y - y_mean)) / denom if denom > 0 else 0.0
+    return slope, y_mean - slope * t_mean
+
+
+@engine("rolling_lr")
+def fit_rolling_lr(X, y, previous=None):
+    t, v = X[-ROLLING_WINDOW:, 0], y[-ROLLING_WINDOW:]
+    slope, _ = linear_fit(t, v)
+    return LinearForecast("rolling_lr", v.mean(), slope, t.mean(), np.zeros(_features(X))), None
+
+
+@engine("ridge")
+def fit_ridge(X, y, previous=None):
+    n, f = len(y), _features(X)
+    if n <= LAGS + 1:
+        return fit_ewma(X, y)
+    t_end = X[-1, 0]
+    mu = X[:, 1:].mean(axis=0)
+    sigma = X[:, 1:].std(axis=0)
+    sigma[sigma == 0] = 1.0
+    lags = np.column_stack([y[LAGS - k:n - k] for k in range(1, LAGS + 1)])
+    A = np.column_stack([(X[LAGS:, 0] - t_end) / 3600, (X[LAGS:, 1:] - mu) / sigma, lags])
+    target = y[LAGS:]
+    m = A.mean(axis=0)
+    Ac = A - m
+    w = np.linalg.solve(Ac.T @ Ac + RIDGE_LAMBDA * np.eye(A.shape[1]), Ac.T @ (target - target.mean()))
+    w_t, w_f, w_l = w[0], w[1:1 + f], w[1 + f:]
+    last_lags = y[::-1][:LAGS]  # y[n-1], y[n-2], ...: the lags of the next row
+    a = target.mean() - w_t * m[0] - w_f @ (mu / sigma + m[1:1 + f]) + w_l @ (last_lags - m[1 + f:])
+    return LinearForecast("ridge", a, w_t / 3600, t_end, w_f / sigma), None
+
+
+def evaluate(name, X_train, y_train, X_test, y_test, previous=None):
+    """Fit one engine and score it: {"error" (MAE), "relative_error", "baseline_error", "fit_seconds",
+    "predict_seconds"} (CPU time).
+
+    relative_error is the MAE over the mean absolute target of the test rows;
+    baseline_error is the MAE of the naive forecast, the last training target.
+    """
+    t0 = time.process_time()
+    model, scaler = ENGINES[name](X_train, y_train, previous)
+    t1 = time.process_time()
+    pred = predict_batch([model], [scaler], X_test[None, :, :])[0]
+    t2 = time.process_time()
+    error = float(np.mean(np.abs(pred - y_test)))
+    scale = float(np.mean(np.abs(y_test)))
+    return {"error": error, "relative_error": error / scale if scale > 0 else float("inf"),
+            "baseline_error": float(np.mean(np.abs(y_train[-1] - y_test))),
+            "fit_seconds": t1 - t0, "predict_seconds": t2 - t1}
+
+
+def holdout_confidence(result):
+    """Confidence (0-100) of a model from its evaluate() result: how much of the naive forecast's error it removes."""
+    if result["baseline_error"] == 0:
+        return 100.0 if result["error"] == 0 else 0.0
+    return max(0.0, min(100.0, (1 - result["error"] / result["baseline_error"]) * 100))
+
+
+def select_engine(X, y, engines=None):
+    """(engine, report): the cheapest engine whose holdout error is within SELECT_TOLERANCE of the best.
+
+    The MLP is only fitted when no other engine gets within MLP_SELECT_ERROR.
+    """
+    engines = list(engines or ENGINES)
+    if len(y) < MIN_SELECT_ROWS:
+        return DEFAULT_ENGINE, {}
+    split = int(len(y) * (1 - HOLDOUT))
+    report = {name: evaluate(name, X[:split], y[:split], X[split:], y[split:]) for name in engines if name != "mlp"}
+    if "mlp" in engines and min((r["relative_error"] for r in report.values()), default=float("inf")) > MLP_SELECT_ERROR:
+        report["mlp"] = evaluate("mlp", X[:split], y[:split], X[split:], y[split:])
+    engines = [name for name in engines if name in report]
+    best = min(r["error"] for r in report.values())
+    good = [name for name in engines if report[name]["error"] <= best * (1 + SELECT_TOLERANCE)]
+    return min(good, key=lambda name: report[name]["fit_seconds"] + report[name]["predict_seconds"]), report
@@ -0,0 +1,54 @@
+"""gunicorn settings: web workers only read; one supervised ingest process writes.
+
+`gunicorn "run:create_app()"` picks this file up from the working directory.
+The master starts `python run.py` with BZ_ROLE=ingest (fetcher, tick writer,
+trainer and the shared-state publisher) and restarts it if it dies; every
+worker runs with BZ_ROLE=web and maps the state that process publishes, so
+`-w 8` does not multiply the fetching, training or snapshot memory.
+
+/stream keeps one response open per browser, and under gthread each open
+stream holds one of the worker's `threads`. So a worker only keeps
+STREAM_MAX_CLIENTS streams open, by default 3/4 of GUNICORN_THREADS (48 of
+64); the rest of its threads always serve pages. A client past the limit
+is sent what it missed and reconnects STREAM_OVERFLOW_RETRY (30) seconds
+later with its Last-Event-ID. It still gets every tick, just up to 30s
+late, and holds no thread meanwhile. Sizing: live clients ~= workers x
+STREAM_MAX_CLIENTS, plus overflow clients polling every 30s. With 8
+workers x 256 threads (STREAM_MAX_CLIENTS=192), about 1500 dashboards
+stream live.
+"""
+import os
+import sys
+import time
+import logging
+import threading
+import subprocess
+
+raw_env = ["BZ_ROLE=web"]
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 64))
+
+_INGEST = {"process": None, "stopping": False}
+
+
+def _supervise_ingest():
+    env = dict(os.environ, BZ_ROLE="ingest")
+    while not _INGEST["stopping"]:
+        process = subprocess.Popen([sys.executable, "run.py"], env=env)
+        _INGEST["process"] = process
+        code = process.wait()
+        if not _INGEST["stopping"]:
+            logging.error(f"Ingest process exited with {code}; restarting in 5s")
+            time.sleep(5)
+
+
+def on_starting(server):
+    threading.Thread(target=_supervise_ingest, daemon=True).start()
+
+
+def on_exit(server):
+    _INGEST["stopping"] = True
+    process = _INGEST["process"]
+    if process is not None and process.poll() is None:
+        process.terminate()
+        process.wait(timeout=30)
@@ -0,0 +1,78 @@
+"""Batched inference over many per-product models at once.
+
+Every product has its own scaler + MLPRegressor, but they share one
+architecture, so their weights can be stacked into (products, in, out)
+tensors and evaluated with a handful of batched matmuls instead of one
+sklearn predict() call (and its input validation) per product. Other model
+types can do the same by providing predict_stacked(models, X).
+"""
+import numpy as np
+
+ACTIVATIONS = {
+    "identity": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "tanh": np.tanh,
+    "logistic": lambda x: 1.0 / (1.0 + np.exp(-x)),
+}
+
+
+def _family(model):
+    """Key of models whose forward pass can be stacked, or None if it cannot."""
+    coefs = getattr(model, "coefs_", None)
+    if coefs is None or getattr(model, "activation", None) not in ACTIVATIONS \
+            or getattr(model, "out_activation_", None) != "identity":
+        return None
+    return (model.activation,) + tuple(w.shape for w in coefs)
+
+
+def _scaler_params(scaler, n_features):
+    mean = getattr(scaler, "mean_", None)
+    scale = getattr(scaler, "scale_", None)
+    return (np.zeros(n_features) if mean is None else mean,
+            np.ones(n_features) if scale is None else scale)
+
+
+def _stacked_forward(models, scalers, X):
+    """X: (G, R, F) -> (G, R) predictions for G models of one family."""
+    means, scales = zip(*(_scaler_params(s, X.shape[2]) for s in scalers))
+    h = (X - np.stack(means)[:, None, :]) / np.stack(scales)[:, None, :]
+    act = ACTIVATIONS[models[0].activation]
+    n_layers = len(models[0].coefs_)
+    for layer in range(n_layers):
+        W = np.stack([m.coefs_[layer] for m in models])
+        b = np.stack([m.intercepts_[layer] for m in models])
+        h = np.matmul(h, W) + b[:, None, :]
+        if layer < n_layers - 1:
+            h = act(h)
+    return h[:, :, 0]
+
+
+def predict_batch(models, scalers, X):
+    """Predict for many (model, scaler) pairs in one pass.
+
+    X is (G, F) - one feature row per model - or (G, R, F) - R rows per model.
+    Returns (G,) or (G, R) accordingly. MLPs of the same family are
+    evaluated together as stacked matrices, models with predict_stacked()
+    (which need no scaler) together per type; anything else falls back to
+    its own predict().
+    """
+    X = np.asarray(X, dtype=float)
+    single = X.ndim == 2
+    if single:
+        X = X[:, None, :]
+    out = np.empty(X.shape[:2])
+    families = {}
+    for i, model in enumerate(models):
+        family = _family(model)
+        if family is None and hasattr(model, "predict_stacked"):
+            family = type(model)
+        families.setdefault(family, []).append(i)
+    for family, idx in families.items():
+        if family is None:
+            for i in idx:
+                out[i] = models[i].predict(scalers[i].transform(X[i]))
+        elif isinstance(family, type):
+            out[idx] = family.predict_stacked([models[i] for i in idx], X[idx])
+        else:
+            out[idx] = _stacked_forward([models[i] for i in idx], [scalers[i] for i in idx], X[idx])
+    return out[:, 0] if single else out
@@ -0,0 +1,208 @@
+"""Prometheus-style counters, gauges and histograms, with no dependencies.
+
+Metrics are created once at module level and registered in REGISTRY:
+
+    FETCH_SECONDS = Histogram("bz_fetch_seconds", "Bazaar API poll latency")
+    with FETCH_SECONDS.time():
+        ...
+    WRITE_ROWS.inc(n, source="store")
+
+Labels are keyword arguments; every distinct combination is its own series.
+REGISTRY.snapshot() returns the current values as plain JSON-able data, so
+processes that cannot share memory (the ingest process and each gunicorn
+worker) can dump their snapshots to files and one /metrics scrape can
+merge() them: counters and histograms are summed, gauges come from the
+most recently written snapshot. render() produces the text exposition
+format (version 0.0.4).
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = tuple(2 ** k for k in range(10, 31, 2))  # 1 KiB .. 1 GiB
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        """{name: {"type", "help", "buckets", "series": [[labels, value], ...]}} plus "written_at"."""
+        out = {name: metric.snapshot() for name, metric in self.metrics.items()}
+        return {"written_at": time.time(), "metrics": out}
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self._series = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _value(self, value):
+        return value
+
+    def snapshot(self):
+        with self._lock:
+            series = [[dict(key), self._value(value)] for key, value in self._series.items()]
+        return {"type": self.kind, "help": self.documentation, "buckets": getattr(self, "buckets", None),
+                "series": series}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._series[_key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(float(b) for b in buckets)
+        super().__init__(name, documentation, registry)
+
+    def observe(self, value, **labels):
+        key = _key(labels)
+        with self._lock:
+            state = self._series.get(key)
+            if state is None:
+                state = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _value(self, state):
+        return {"counts": list(state[0]), "sum": state[1], "count": state[2]}
+
+    @contextmanager
+    def time(self, **labels):
+        """Timing span: observe the wall-clock seconds the with-block took."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+# ---- several processes -------------------------------------------------
+def dump(path, registry=REGISTRY):
+    """Write registry's snapshot to path (atomically), for another process's /metrics to merge."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp, path)
+
+
+def load_dumps(directory, exclude=()):
+    """Snapshots dumped into directory as <pid>.json by live processes; files of dead ones are removed."""
+    snapshots = []
+    for name in os.listdir(directory) if os.path.isdir(directory) else ():
+        stem, ext = os.path.splitext(name)
+        if ext != ".json" or not stem.isdigit() or int(stem) in exclude:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            os.kill(int(stem), 0)
+        except ProcessLookupError:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        except PermissionError:
+            pass  # alive, just not ours to signal
+        try:
+            with open(path, encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (FileNotFoundError, ValueError):
+            continue
+    return snapshots
+
+
+def merge(snapshots):
+    """One snapshot from several: counters and histograms summed, gauges from the newest writer."""
+    merged = {}
+    for snapshot in sorted(snapshots, key=lambda s: s["written_at"]):
+        for name, metric in snapshot["metrics"].items():
+            target = merged.setdefault(name, dict(metric, series={}))
+            for labels, value in metric["series"]:
+                key = _key(labels)
+                old = target["series"].get(key)
+                if old is None or metric["type"] == "gauge":
+                    target["series"][key] = value
+                elif metric["type"] == "counter":
+                    target["series"][key] = old + value
+                else:
+                    target["series"][key] = {"counts": [a + b for a, b in zip(old["counts"], value["counts"])],
+                                             "sum": old["sum"] + value["sum"], "count": old["count"] + value["count"]}
+    for metric in merged.values():
+        metric["series"] = [[dict(key), value] for key, value in metric["series"].items()]
+    return {"written_at": time.time(), "metrics": merged}
+
+
+# ---- exposition --------------------------------------------------------
+def _labels(labels, extra=None):
+    pairs = sorted(labels.items()) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')  # noqa: E731
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshot):
+    """Text exposition format for a snapshot."""
+    lines = []
+    for name, metric in sorted(snapshot["metrics"].items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, value in metric["series"]:
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"], value["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, ('le', _number(float(bound))))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels, ('le', '+Inf'))} {value['count']}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(float(value['sum']))}")
+            lines.append(f"{name}_count{_labels(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
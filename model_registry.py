@@ -0,0 +1,269 @@
+"""On-disk, versioned registry of the per-product models, for warm restarts.
+
+    <root>/entries/<product>.<version>.pkl   one finished fit: (model, scaler, avg_dt, confidence)
+                                             plus its training metadata, written as it is published
+    <root>/stacked-<n>/                      checkpoint of every model: MLP weights stacked per
+                                             architecture, LinearForecast coefficients per feature
+                                             count (see write_stacked), loaded memory-mapped
+    <root>/CHECKPOINT                        name of the newest complete checkpoint
+
+Every file is written under a temporary name and renamed into place, so a
+reader (or a restart after a crash) sees a whole model or the previous one,
+never half of either. load() maps the newest checkpoint - no unpickling
+(except for model types it cannot stack) and no sklearn import - and
+overlays the few entries fitted since, so a restarted process can score
+every product within seconds. The full sklearn objects (with their
+optimiser state) are only unpickled when the trainer warm-starts from them.
+"""
+import os
+import json
+import pickle
+import shutil
+import logging
+import threading
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from inference import _family, _scaler_params, predict_batch
+from forecasters import LinearForecast
+
+KEEP_CHECKPOINTS = 2  # the newest, plus the one a slow reader may still be mapping
+
+
+class _StackedModel:
+    """Just enough of MLPRegressor for inference.predict_batch, over memory-mapped weights."""
+
+    out_activation_ = "identity"
+
+    def __init__(self, activation, coefs, intercepts):
+        self.activation = activation
+        self.coefs_ = coefs
+        self.intercepts_ = intercepts
+        self.n_features_in_ = coefs[0].shape[0]
+
+    def predict(self, X):
+        return predict_batch([self], [_StackedScaler(np.zeros(X.shape[1]), np.ones(X.shape[1]))], X[None])[0]
+
+
+class _StackedScaler:
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=float) - self.mean_) / self.scale_
+
+
+def _save(directory, prefix, arrays):
+    for name, values in arrays.items():
+        np.save(os.path.join(directory, f"{prefix}{name}.npy"), np.asarray(values, dtype=float))
+
+
+def write_stacked(directory, models, versions, meta=None):
+    """Stack {pid: (model, scaler, avg_dt, confidence)} into .npy files.
+
+    MLPs are stacked per architecture, LinearForecasts per feature count;
+    only models of any other type are pickled.
+    """
+    families, linear, other = {}, {}, []
+    for pid, entry in models.items():
+        if isinstance(entry[0], LinearForecast):
+            linear.setdefault(len(entry[0].c), []).append(pid)
+        elif _family(entry[0]) is not None:
+            families.setdefault(_family(entry[0]), []).append(pid)
+        else:
+            other.append(pid)
+    index = {"families": [], "linear": [], "pickled": None, "versions": versions, "meta": meta or {}}
+    if other:  # not stackable: pickle these few
+        index["pickled"] = "other.pkl"
+        with open(os.path.join(directory, "other.pkl"), "wb") as fh:
+            pickle.dump({pid: models[pid] for pid in other}, fh)
+    for g, pids in enumerate(linear.values()):
+        entries = [models[pid][0] for pid in pids]
+        _save(directory, f"l{g}_", {
+            "a": [m.a for m in entries], "b": [m.b for m in entries], "t0": [m.t0 for m in entries],
+            "c": [m.c for m in entries], "avg_dt": [models[pid][2] for pid in pids],
+            "confidence": [models[pid][3] for pid in pids]})
+        index["linear"].append({"prefix": f"l{g}_", "engines": [m.engine for m in entries], "pids": pids})
+    for f, (family, pids) in enumerate(families.items()):
+        entries = [models[pid] for pid in pids]
+        n_layers = len(entries[0][0].coefs_)
+        n_features = entries[0][0].coefs_[0].shape[0]
+        arrays = {"mean": [], "scale": []}
+        for model, scaler, _, _ in entries:
+            mean, scale = _scaler_params(scaler, n_features)
+            arrays["mean"].append(mean)
+            arrays["scale"].append(scale)
+        for layer in range(n_layers):
+            arrays[f"W{layer}"] = [e[0].coefs_[layer] for e in entries]
+            arrays[f"b{layer}"] = [e[0].intercepts_[layer] for e in entries]
+        arrays["avg_dt"] = [e[2] for e in entries]
+        arrays["confidence"] = [e[3] for e in entries]
+        _save(directory, f"f{f}_", arrays)
+        index["families"].append({"prefix": f"f{f}_", "activation": family[0], "layers": n_layers, "pids": pids})
+    with open(os.path.join(directory, "index.json"), "w", encoding="utf-8") as fh:
+        json.dump(index, fh)
+
+
+def read_stacked(directory):
+    """(models, versions, meta) from a write_stacked directory; weights stay memory-mapped."""
+    with open(os.path.join(directory, "index.json"), encoding="utf-8") as fh:
+        index = json.load(fh)
+    models = {}
+    for family in index["families"]:
+        load = lambda name: np.load(os.path.join(directory, f"{family['prefix']}{name}.npy"), mmap_mode="r")  # noqa: E731
+        W = [load(f"W{layer}") for layer in range(family["layers"])]
+        b = [load(f"b{layer}") for layer in range(family["layers"])]
+        mean, scale, avg_dt, confidence = load("mean"), load("scale"), load("avg_dt"), load("confidence")
+        for i, pid in enumerate(family["pids"]):
+            model = _StackedModel(family["activation"], [w[i] for w in W], [v[i] for v in b])
+            models[pid] = (model, _StackedScaler(mean[i], scale[i]), float(avg_dt[i]), float(confidence[i]))
+    for group in index.get("linear", []):
+        load = lambda name: np.load(os.path.join(directory, f"{group['prefix']}{name}.npy"), mmap_mode="r")  # noqa: E731
+        a, b, t0, c, avg_dt, confidence = (load(name) for name in ("a", "b", "t0", "c", "avg_dt", "confidence"))
+        for i, (pid, engine) in enumerate(zip(group["pids"], group["engines"])):
+            models[pid] = (LinearForecast(engine, a[i], b[i], t0[i], c[i]), None, float(avg_dt[i]),
+                           float(confidence[i]))
+    if index["pickled"]:
+        with open(os.path.join(directory, index["pickled"]), "rb") as fh:
+            models.update(pickle.load(fh))
+    return models, index["versions"], index.get("meta", {})
+
+
+class ModelRegistry:
+    """Versioned per-product models on disk: put() each fit, checkpoint() all of them, load() on startup."""
+
+    def __init__(self, root):
+        self.root = root
+        self._entries = os.path.join(root, "entries")
+        self._lock = threading.Lock()
+        os.makedirs(self._entries, exist_ok=True)
+        self._files = self._scan()  # product_id -> newest version on disk
+
+    def _path(self, pid, version):
+        return os.path.join(self._entries, f"{quote(pid, safe='')}.{version}.pkl")
+
+    def _scan(self):
+        files = {}
+        for name in os.listdir(self._entries):
+            stem, ext = os.path.splitext(name)
+            pid, _, version = stem.rpartition(".")
+            if ext != ".pkl" or not version.isdigit():
+                continue  # temporary files of an interrupted put()
+            pid = unquote(pid)
+            files[pid] = max(files.get(pid, 0), int(version))
+        return files
+
+    def _write(self, path, write):
+        tmp = f"{path}.tmp{threading.get_ident()}"
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+
+    # ---- writing ---------------------------------------------------------
+    def put(self, pid, entry, version, meta):
+        """Persist one product's (model, scaler, avg_dt, confidence) as version, replacing older ones."""
+        record = {"entry": entry, "version": version, "meta": meta}
+        self._write(self._path(pid, version), lambda f: pickle.dump(record, f, protocol=pickle.HIGHEST_PROTOCOL))
+        with self._lock:
+            old = self._files.get(pid)
+            self._files[pid] = version
+        if old is not None and old != version:
+            try:
+                os.remove(self._path(pid, old))
+            except FileNotFoundError:
+                pass
+
+    def checkpoint(self, models, versions, meta):
+        """Write every model as one memory-mappable checkpoint and make it the one load() uses."""
+        current = self._checkpoint_name()
+        n = int(current.rpartition("-")[2]) + 1 if current else 1
+        directory = os.path.join(self.root, f"stacked-{n}")
+        shutil.rmtree(directory, ignore_errors=True)  # left over from an interrupted checkpoint
+        os.makedirs(directory)
+        write_stacked(directory, models, versions, meta)
+        self._write(os.path.join(self.root, "CHECKPOINT"), lambda f: f.write(os.path.basename(directory).encode()))
+        for name in os.listdir(self.root):
+            if name.startswith("stacked-") and int(name.rpartition("-")[2]) <= n - KEEP_CHECKPOINTS:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def evict(self, pids):
+        """Forget products for good (delisted); the next checkpoint leaves them out."""
+        for pid in pids:
+            with self._lock:
+                version = self._files.pop(pid, None)
+            if version is not None:
+                try:
+                    os.remove(self._path(pid, version))
+                except FileNotFoundError:
+                    pass
+
+    # ---- reading ---------------------------------------------------------
+    def _checkpoint_name(self):
+        try:
+            with open(os.path.join(self.root, "CHECKPOINT"), encoding="utf-8") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def _read_entry(self, pid):
+        version = self._files.get(pid)
+        if version is None:
+            return None
+        try:
+            with open(self._path(pid, version), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None  # replaced or evicted meanwhile
+
+    def load(self):
+        """(models, versions, meta) of every registered product: the checkpoint, plus newer entries."""
+        models, versions, meta = {}, {}, {}
+        name = self._checkpoint_name()
+        if name:
+            try:
+                models, versions, meta = read_stacked(os.path.join(self.root, name))
+            except (FileNotFoundError, ValueError) as e:
+                logging.warning(f"Ignoring model checkpoint {name}: {e}")
+        with self._lock:
+            files = dict(self._files)
+        for pid in set(models) - set(files):
+            models.pop(pid)  # evicted since the checkpoint
+            versions.pop(pid, None)
+            meta.pop(pid, None)
+        for pid, version in files.items():
+            if version > versions.get(pid, 0):
+                record = self._read_entry(pid)
+                if record is not None:
+                    models[pid], versions[pid], meta[pid] = record["entry"], record["version"], record["meta"]
+        return models, versions, meta
+
+    def model(self, pid):
+        """The full fitted model of pid (to warm-start from), or None."""
+        record = self._read_entry(pid)
+        return None if record is None else record["entry"][0]
+
+
+class WarmStarts(dict):
+    """previous_models for TrainingScheduler.run_cycle: fitted models in memory, else the registry's.
+
+    models is {pid: (model, scaler, avg_dt, confidence)}; checkpoint shims
+    hold only weights, so those products are warm-started from their entry.
+    meta is the trainer's {pid: meta}: only products whose "engine" is mlp
+    (the default for metadata older than the engines) are read from disk,
+    since nothing else warm-starts.
+    """
+
+    def __init__(self, registry, models, meta=None):
+        super().__init__({pid: entry[0] for pid, entry in models.items() if hasattr(entry[0], "set_params")})
+        self.registry = registry
+        self.meta = meta or {}
+
+    def get(self, pid, default=None):
+        if pid in self:
+            return self[pid]
+        if self.meta.get(pid, {}).get("engine", "mlp") != "mlp":
+            return default
+        model = self.registry.model(pid)
+        return default if model is None else model
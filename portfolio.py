@@ -0,0 +1,194 @@
+"""Tracked purchases in SQLite, valued against the latest prices in one vectorised join.
+
+    <path>            SQLite database in WAL mode
+      positions       id, purchase_time (epoch seconds), product_id, quantity,
+                      buy_price, target_sell, status; indexed on product_id
+                      and on purchase_time
+      meta            key/value flags (the one-time tracked_items.csv import)
+
+WAL lets readers run alongside the single writer, and every write is a
+short BEGIN IMMEDIATE transaction that waits (busy timeout) for any other
+writer, so purchases from several threads and gunicorn workers never
+interleave. Each write also bumps PRAGMA user_version, so positions() can
+keep the whole table as numpy columns and re-read it only after some
+process changed it. value() prices those columns with one searchsorted
+join against a latest-price table, whatever the number of positions.
+"""
+import os
+import csv
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+BUSY_TIMEOUT = 30  # seconds a writer waits for another one
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS positions (id INTEGER PRIMARY KEY, purchase_time INTEGER NOT NULL, "
+    "product_id TEXT NOT NULL, quantity REAL NOT NULL, buy_price REAL NOT NULL, target_sell REAL, "
+    "status TEXT NOT NULL DEFAULT 'open')",
+    "CREATE INDEX IF NOT EXISTS positions_product ON positions (product_id, purchase_time)",
+    "CREATE INDEX IF NOT EXISTS positions_time ON positions (purchase_time)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+]
+COLUMNS = ["id", "purchase_time", "product_id", "quantity", "buy_price", "target_sell", "status"]
+LEGACY_COLUMNS = ["purchase_time", "product_id", "quantity", "buy_price", "target_sell", "status"]
+
+
+class Portfolio:
+    """Positions store shared by every thread and process that opens the same path."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._table = (None, None)  # (user_version, columns) of the last full read
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; a crash cannot corrupt WAL
+            if not _has_schema(conn):
+                self._write(conn, lambda c: [c.execute(statement) for statement in SCHEMA])
+            self._local.conn = conn
+        return conn
+
+    def _write(self, conn, change):
+        """Run change(conn) in one immediate transaction and bump user_version with it."""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = change(conn)
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            conn.execute(f"PRAGMA user_version = {int(version) + 1}")
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # ---- writing ---------------------------------------------------------
+    def add(self, purchase_time, product_id, quantity, buy_price, target_sell, status="open"):
+        """Record one purchase; returns its id."""
+        return self._write(self._conn(), lambda c: c.execute(
+            "INSERT INTO positions (purchase_time, product_id, quantity, buy_price, target_sell, status) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (int(purchase_time), product_id, float(quantity), float(buy_price), target_sell, status)).lastrowid)
+
+    def migrate_csv(self, csv_path):
+        """One-shot import of the legacy tracked_items.csv (with or without its header). Returns rows imported."""
+        if not os.path.exists(csv_path):
+            return 0
+
+        def migrate(conn):
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_csv'").fetchone():
+                return 0
+            rows = []
+            with open(csv_path, newline="", encoding="utf-8") as f:
+                for row in csv.reader(f):
+                    if len(row) < 4 or row[:2] == LEGACY_COLUMNS[:2]:
+                        continue  # blank, truncated by an interleaved write, or the header
+                    record = dict(zip(LEGACY_COLUMNS, row))
+                    try:
+                        target = record.get("target_sell")
+                        rows.append((_epoch(record["purchase_time"]), record["product_id"],
+                                     float(record["quantity"]), float(record["buy_price"]),
+                                     float(target) if target not in (None, "", "N/A") else None,
+                                     record.get("status") if record.get("status") not in (None, "", "N/A") else "open"))
+                    except (ValueError, KeyError) as e:
+                        logging.warning(f"Skipping unreadable row in {csv_path}: {row} ({e})")
+            conn.executemany("INSERT INTO positions (purchase_time, product_id, quantity, buy_price, target_sell, "
+                             "status) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_csv', ?)", (csv_path,))
+            return len(rows)
+
+        return self._write(self._conn(), migrate)
+
+    # ---- reading ---------------------------------------------------------
+    def version(self):
+        """Changes whenever any process has written; cheap enough to check on every request."""
+        return self._conn().execute("PRAGMA user_version").fetchone()[0]
+
+    def positions(self, product_id=None, since=None):
+        """Positions as {column: array} in purchase order, optionally of one product and/or since an epoch.
+
+        The unfiltered table is cached until the next write; filtered reads go
+        through the product and purchase-time indexes.
+        """
+        if product_id is None and since is None:
+            version = self.version()
+            cached_version, columns = self._table
+            if cached_version == version:
+                return columns
+        where, args = [], []
+        if product_id is not None:
+            where.append("product_id = ?")
+            args.append(product_id)
+        if since is not None:
+            where.append("purchase_time >= ?")
+            args.append(int(since))
+        sql = f"SELECT {', '.join(COLUMNS)} FROM positions"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        conn = self._conn()
+        conn.execute("BEGIN")  # one snapshot for the version and the rows
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            rows = conn.execute(sql + " ORDER BY purchase_time, id", args).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        columns = _columns(rows)
+        if not where:
+            with self._lock:
+                self._table = (version, columns)
+        return columns
+
+
+def _epoch(text):
+    """'%Y-%m-%d %H:%M:%S' (naive local time, like snapshot_time) to epoch seconds."""
+    return int(datetime.strptime(text, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp())
+
+
+def _has_schema(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'meta'").fetchone() is not None
+
+
+def _columns(rows):
+    values = list(zip(*rows)) or [()] * len(COLUMNS)
+    columns = {
+        "id": np.array(values[0], dtype=np.int64),
+        "purchase_time": np.array(values[1], dtype=np.int64),
+        "product_id": np.array(values[2], dtype=object),
+        "quantity": np.array(values[3], dtype=float),
+        "buy_price": np.array(values[4], dtype=float),
+        "target_sell": np.array([np.nan if v is None else v for v in values[5]], dtype=float),
+        "status": np.array(values[6], dtype=object),
+    }
+    for arr in columns.values():
+        arr.flags.writeable = False
+    return columns
+
+
+def value(positions, codes, latest_codes, latest_prices):
+    """Mark every position to market in one join.
+
+    codes are the positions' product codes (-1 if unknown), latest_codes the
+    sorted codes of a latest-price table and latest_prices its prices.
+    Returns {"current", "value", "cost", "pnl", "pnl_pct", "to_target"}
+    arrays; positions without a latest price get NaN.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    current = np.full(len(codes), np.nan)
+    if len(latest_codes):
+        pos = np.minimum(np.searchsorted(latest_codes, codes), len(latest_codes) - 1)
+        found = (codes >= 0) & (latest_codes[pos] == codes)
+        current[found] = latest_prices[pos[found]]
+    cost = positions["quantity"] * positions["buy_price"]
+    worth = positions["quantity"] * current
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pnl_pct = np.where(cost != 0, (worth - cost) / cost * 100, np.nan)
+    return {"current": current, "value": worth, "cost": cost, "pnl": worth - cost, "pnl_pct": pnl_pct,
+            "to_target": positions["target_sell"] - current}
@@ -0,0 +1,101 @@
+"""Opt-in sampling profiler that writes flamegraph-compatible folded stacks.
+
+    sampler = Sampler(threading.get_ident())
+    sampler.start()
+    ...                           # the request or training cycle to profile
+    path = sampler.stop().write("snapshot_store/profiles", "plot")
+
+A background thread looks at the target thread's current frame every
+interval seconds (sys._current_frames(), no tracing hooks), so the profiled
+code runs at full speed and nothing is paid while profiling is off. The
+output has one line per distinct stack, root first, with its sample count:
+
+    main (run.py:912);top_variations (run.py:741);advance (rollups.py:110) 12
+
+which flamegraph.pl, speedscope and inferno read directly. While a sampler
+runs, the interpreter's thread switch interval is lowered to match, or a
+busy target thread would hold the GIL past several samples; the original
+interval comes back when the last running sampler stops. Only the target
+thread is sampled: work it hands to other processes (training fits) shows
+up as the time spent waiting for them.
+"""
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+DEFAULT_INTERVAL = 0.001  # seconds between samples (a training cycle uses a coarser one)
+MAX_DEPTH = 128
+
+_ACTIVE = {"count": 0, "switch_interval": None}  # samplers running, and the interval to restore after the last
+_ACTIVE_LOCK = threading.Lock()
+
+
+def _label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Sampler:
+    """Samples one thread's stack every interval seconds until stop()."""
+
+    def __init__(self, thread_id, interval=DEFAULT_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = 0.0
+        self._running = False
+
+    def start(self):
+        self._started = time.perf_counter()
+        with _ACTIVE_LOCK:
+            if _ACTIVE["count"] == 0:
+                _ACTIVE["switch_interval"] = sys.getswitchinterval()
+            _ACTIVE["count"] += 1
+            sys.setswitchinterval(min(sys.getswitchinterval(), self.interval / 2))
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return  # the thread is gone
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._running:
+            self._running = False
+            with _ACTIVE_LOCK:
+                _ACTIVE["count"] -= 1
+                if _ACTIVE["count"] == 0:
+                    sys.setswitchinterval(_ACTIVE["switch_interval"])
+        self.seconds = time.perf_counter() - self._started
+        return self
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def write(self, directory, name):
+        """Write the folded stacks to <directory>/<time>-<name>.folded and return the path."""
+        os.makedirs(directory, exist_ok=True)
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in name).strip("_") or "profile"
+        path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.folded())
+        return path
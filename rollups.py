@@ -0,0 +1,253 @@
+"""Incrementally maintained per-product sellPrice rollups for the /top page.
+
+For every product and window (minute, hour, day, week, month, year, all)
+Rollups keeps the first/last/min/max sellPrice and row count of the rows
+inside [T - window, T], where T is the current time (or the newest snapshot,
+if that is later). Neither new rows nor the passage of time cause a rescan:
+
+* update() only folds in rows appended to the cache since the previous call;
+* advance() slides the windows to a later T, touching only the products
+  whose oldest in-window row just expired;
+* the first row of a window is a pointer into the product's time-sorted
+  series that only ever moves forward, and min/max come from monotonic
+  deques of (row index, price), so both are amortised O(1) per row.
+
+History older than the raw snapshots (see bars.py) comes in through
+set_history() as per-window summaries of the retention-tier bars; it is
+merged into each window's first/min/max/count and refreshed by the
+compaction job rather than slid row by row.
+
+The result is published as a table of flat numpy arrays (one entry per
+product, ordered by product code), so /top is a vectorized sort/filter over
+~1,300 rows.
+"""
+import threading
+from collections import deque
+
+import numpy as np
+
+WINDOWS = {
+    "minute": 120,
+    "hour": 3600,
+    "day": 86400,
+    "week": 7 * 86400,
+    "month": 30 * 86400,
+    "year": 365 * 86400,
+    "all": None,
+}
+COMPARE_SECONDS = 120  # /top?compare=2min: snapshot closest to T - 2 minutes
+
+
+def _suffix_extremes(prices, lo, keep_max):
+    """Row indices >= lo that a max (or min) monotonic deque would hold after seeing prices[lo:]."""
+    seg = prices[lo:]
+    if keep_max:
+        later = np.maximum.accumulate(seg[::-1])[::-1]
+        keep = seg > np.append(later[1:], -np.inf)
+    else:
+        later = np.minimum.accumulate(seg[::-1])[::-1]
+        keep = seg < np.append(later[1:], np.inf)
+    idx = np.flatnonzero(keep) + lo
+    return deque(zip(idx.tolist(), seg[idx - lo].tolist()))
+
+
+def _closest(times, target):
+    """Index of the snapshot closest to target (the earlier one on ties)."""
+    i = int(np.searchsorted(times, target))
+    if i == len(times) or (i > 0 and target - times[i - 1] <= times[i] - target):
+        i -= 1
+    return i
+
+
+class _ProductRollup:
+    __slots__ = ("seen", "last_time", "first", "maxq", "minq", "prev")
+
+    def __init__(self):
+        self.seen = 0
+        self.last_time = None
+        self.first = {}  # window -> index of the oldest row inside it
+        self.maxq = {}
+        self.minq = {}
+        self.prev = 0    # index of the row closest to T - COMPARE_SECONDS
+
+
+class Rollups:
+    """Per-product first/last/min/max sellPrice for each of WINDOWS."""
+
+    def __init__(self):
+        self._products = {}  # product code -> _ProductRollup
+        self._series = {}    # product code -> snapshot_time/sellPrice views as of the last update
+        self._codes = None
+        self._history = {}   # window -> {code: (first_price, first_time, min, max, count)} from bars
+        self._lock = threading.Lock()
+        self.anchor = None   # T: the end of every window
+        self.version = 0
+        self.table = None
+
+    def update(self, cache, now=None):
+        """Fold rows the cache gained since the last call into the rollups and publish a new table."""
+        with self._lock:
+            latest = cache.latest(["product", "snapshot_time"])
+            if len(latest["product"]) == 0:
+                return
+            anchor = int(latest["snapshot_time"].max())
+            if now is not None:
+                anchor = max(anchor, int(now))
+            if self.anchor is not None:
+                anchor = max(anchor, self.anchor)
+            self._codes = latest["product"]
+            for code in self._codes.tolist():
+                self._series[code] = cache.product(code, ["snapshot_time", "sellPrice"])
+                self._fold(code, anchor)
+            self.anchor = anchor
+            self._publish()
+
+    def set_history(self, history):
+        """Summaries of the bars before the raw snapshots, per window; used from the next update() on."""
+        with self._lock:
+            self._history = history
+
+    def advance(self, now):
+        """Slide every window to end at now; returns the current table.
+
+        Cheap when no row has left a window since the last call, so it can
+        run on every request.
+        """
+        now = int(now)
+        table = self.table
+        if table is None or now <= table["anchor"]:
+            return table
+        with self._lock:
+            table = self.table
+            if now <= table["anchor"]:
+                return table
+            codes = self._codes.tolist()
+            windows = dict(table["windows"])
+            for name, seconds in WINDOWS.items():
+                if seconds is None:
+                    continue
+                window = windows[name]
+                cutoff = now - seconds
+                moved = np.flatnonzero((window["raw_count"] > 0) & (window["raw_first_time"] < cutoff))
+                if len(moved) == 0:
+                    continue
+                window = {key: value.copy() for key, value in window.items()}
+                for j in moved.tolist():
+                    self._slide(codes[j], name, cutoff)
+                    self._fill(window, j, codes[j], name)
+                windows[name] = window
+            compare = table["compare"]
+            target = now - COMPARE_SECONDS
+            moved = np.flatnonzero((compare["prev_time"] < target) & (compare["prev_time"] < compare["last_time"]))
+            if len(moved):
+                compare = {key: value.copy() for key, value in compare.items()}
+                for j in moved.tolist():
+                    state = self._products[codes[j]]
+                    times = self._series[codes[j]]["snapshot_time"]
+                    # The closest row to a later target can only be a later row.
+                    while state.prev + 1 < state.seen and \
+                            times[state.prev + 1] - target < target - times[state.prev]:
+                        state.prev += 1
+                    compare["prev_price"][j] = self._series[codes[j]]["sellPrice"][state.prev]
+                    compare["prev_time"][j] = times[state.prev]
+            self.anchor = now
+            self.version += 1
+            self.table = dict(table, windows=windows, compare=compare, anchor=now, version=self.version)
+            return self.table
+
+    def _fold(self, code, anchor):
+        series = self._series[code]
+        times, prices = series["snapshot_time"], series["sellPrice"]
+        n = len(times)
+        state = self._products.get(code)
+        if state is None or state.seen > n or \
+                (state.seen and int(times[state.seen - 1]) != state.last_time):
+            # New product, or the cache re-sorted this product's rows: rebuild from its series.
+            state = _ProductRollup()
+            self._products[code] = state
+            for name, seconds in WINDOWS.items():
+                lo = 0 if seconds is None else int(np.searchsorted(times, anchor - seconds, side="left"))
+                state.first[name] = lo
+                state.maxq[name] = _suffix_extremes(prices, lo, True)
+                state.minq[name] = _suffix_extremes(prices, lo, False)
+        else:
+            new_prices = prices[state.seen:n].tolist()
+            for name in WINDOWS:
+                maxq, minq = state.maxq[name], state.minq[name]
+                for i, price in enumerate(new_prices, start=state.seen):
+                    while maxq and maxq[-1][1] <= price:
+                        maxq.pop()
+                    maxq.append((i, price))
+                    while minq and minq[-1][1] >= price:
+                        minq.pop()
+                    minq.append((i, price))
+        state.seen = n
+        state.last_time = int(times[n - 1]) if n else None
+        for name, seconds in WINDOWS.items():
+            if seconds is not None:
+                self._slide(code, name, anchor - seconds)
+        state.prev = _closest(times[:n], anchor - COMPARE_SECONDS) if n else 0
+
+    def _slide(self, code, name, cutoff):
+        """Drop rows older than cutoff from one product's window."""
+        state = self._products[code]
+        times = self._series[code]["snapshot_time"]
+        lo = state.first[name]
+        if lo < state.seen and times[lo] < cutoff:
+            lo = int(np.searchsorted(times[:state.seen], cutoff, side="left"))
+            state.first[name] = lo
+            maxq, minq = state.maxq[name], state.minq[name]
+            while maxq and maxq[0][0] < lo:
+                maxq.popleft()
+            while minq and minq[0][0] < lo:
+                minq.popleft()
+
+    def _fill(self, window, j, code, name):
+        state = self._products[code]
+        series = self._series[code]
+        lo = state.first[name]
+        window["count"][j] = window["raw_count"][j] = state.seen - lo
+        if lo < state.seen:
+            window["first_price"][j] = series["sellPrice"][lo]
+            window["first_time"][j] = window["raw_first_time"][j] = series["snapshot_time"][lo]
+            window["max"][j] = state.maxq[name][0][1]
+            window["min"][j] = state.minq[name][0][1]
+        else:
+            window["first_price"][j] = window["first_time"][j] = window["max"][j] = window["min"][j] = 0
+            window["raw_first_time"][j] = 0
+        history = self._history.get(name, {}).get(code)
+        if history is not None:
+            first_price, first_time, low, high, count = history
+            if window["count"][j]:
+                low, high = min(low, window["min"][j]), max(high, window["max"][j])
+            window["first_price"][j], window["first_time"][j] = first_price, first_time
+            window["min"][j], window["max"][j] = low, high
+            window["count"][j] += count
+
+    def _publish(self):
+        codes = self._codes.tolist()
+        size = len(codes)
+        # Taken from the series views (not the latest table) so they agree with the counts.
+        last_price = np.array([self._series[c]["sellPrice"][self._products[c].seen - 1] for c in codes], dtype=float)
+        last_time = np.array([self._products[c].last_time for c in codes], dtype=np.int64)
+        windows = {}
+        for name in WINDOWS:
+            window = {
+                "first_price": np.zeros(size), "first_time": np.zeros(size, dtype=np.int64),
+                "last_price": last_price, "last_time": last_time,
+                "min": np.zeros(size), "max": np.zeros(size), "count": np.zeros(size, dtype=np.int64),
+                # The raw snapshots' part alone: what advance() slides.
+                "raw_first_time": np.zeros(size, dtype=np.int64), "raw_count": np.zeros(size, dtype=np.int64),
+            }
+            for j, code in enumerate(codes):
+                self._fill(window, j, code, name)
+            windows[name] = window
+        prev = [self._products[c].prev for c in codes]
+        compare = {
+            "prev_price": np.array([self._series[c]["sellPrice"][i] for c, i in zip(codes, prev)], dtype=float),
+            "prev_time": np.array([self._series[c]["snapshot_time"][i] for c, i in zip(codes, prev)], dtype=np.int64),
+            "last_price": last_price, "last_time": last_time,
+        }
+        self.version += 1
+        self.table = {"codes": self._codes, "anchor": self.anchor, "version": self.version,
+                      "windows": windows, "compare": compare}
@@ -1,20 +1,33 @@
 import os
-import csv
 import threading
 import time
 import json
+import signal
 import logging
-import requests
+import hashlib
+import functools
+import importlib.util
+import importlib.metadata
 import numpy as np
-import pandas as pd  # Use Pandas for fast CSV I/O and caching
-from math import log
-from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash
-from sklearn.neural_network import MLPRegressor
-from sklearn.preprocessing import StandardScaler
-from sklearn.linear_model import LinearRegression
-import plotly.graph_objects as go
-from plotly.offline import plot
+from collections import OrderedDict
+from datetime import datetime
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, make_response, send_file, g
+from flask import before_render_template, template_rendered
+from snapshot_store import SnapshotStore, SnapshotCache, from_epoch, to_epoch, partition_start
+from training import FEATURE_COLUMNS, TrainingScheduler, build_training_set
+from model_registry import ModelRegistry, WarmStarts
+from forecasters import linear_fit
+from inference import predict_batch
+from tick_writer import TickWriter
+from depth_store import DepthStore
+from rollups import Rollups, WINDOWS
+from bars import BarStore, DAY, TIERS
+from charts import product_figures, MAX_POINTS
+from shared_state import SharedArena, SharedStateReader, SharedStateWriter, models_key
+from stream import DeltaLog, EventStream, KEEPALIVE, RESET_EVENT, encode_event
+from metrics import CONTENT_TYPE, LATENCY_BUCKETS, REGISTRY, Counter, Gauge, Histogram, dump, load_dumps, merge, render
+from profiler import Sampler
+from portfolio import Portfolio, value as value_positions
 
 # ===============================
 # CONFIGURATION & LOGGING
@@ -27,9 +40,35 @@ logging.basicConfig(
 SNAPSHOT_FILE = "market_snapshot.csv"
 SELL_SUMMARY_FILE = "sell_summary.csv"
 BUY_SUMMARY_FILE = "buy_summary.csv"
-TRACKED_FILE = "tracked_items.csv"  # For purchase/tracking data
+TRACKED_FILE = "tracked_items.csv"  # legacy purchase log, imported into TRACKED_DB once
+SNAPSHOT_STORE_DIR = "snapshot_store"  # Columnar, hour-partitioned snapshot history
+DEPTH_STORE_DIR = os.path.join(SNAPSHOT_STORE_DIR, "depth")  # Order-book tiers (replaces the summary CSVs)
+BARS_DIR = os.path.join(SNAPSHOT_STORE_DIR, "bars")  # 15m/1h/1d OHLC bars of older history
+MODEL_REGISTRY_DIR = os.path.join(SNAPSHOT_STORE_DIR, "models")  # fitted models, reloaded on restart
+TRACKED_DB = os.path.join(SNAPSHOT_STORE_DIR, "portfolio.db")  # tracked purchases (SQLite, WAL), shared by all workers
 
-API_URL = "https://api.hypixel.net/v2/skyblock/bazaar"
+API_URL = os.environ.get("BAZAAR_API_URL", "https://api.hypixel.net/v2/skyblock/bazaar")
+FETCH_INTERVAL = 120  # seconds between polls; unchanged payloads (304 / same lastUpdated) are skipped
+TRAIN_INTERVAL = 120  # seconds between training cycles; products without new snapshots are skipped
+MODEL_TTL = 2 * 86400  # a product this far behind the newest snapshot is delisted: its model is evicted
+COMPACT_INTERVAL = 3600  # seconds between retention passes (roll complete days into bars, drop expired data)
+
+# Days each tier is kept: raw 2-minute snapshots, then bars (None: forever).
+# A raw day is only dropped once every bar tier has it.
+RETENTION_DAYS = {
+    "raw": int(os.environ.get("RETENTION_RAW_DAYS", 7)),
+    "15m": int(os.environ.get("RETENTION_15M_DAYS", 90)),
+    "1h": int(os.environ.get("RETENTION_1H_DAYS", 730)),
+    "1d": None,
+}
+TOP_HISTORY_POINTS = 100  # /top windows reaching past the raw snapshots use bars at most 1/100 of the window wide
+
+# all: this process fetches, trains and serves (python run.py). Under gunicorn
+# (see gunicorn.conf.py) one ingest process does the fetching, training and
+# publishing, and the web workers only map what it publishes.
+ROLE = os.environ.get("BZ_ROLE", "all")
+SHARED_STATE_DIR = os.path.join(SNAPSHOT_STORE_DIR, "shared")
+SHARED_PUBLISH_INTERVAL = 1  # seconds between checks for something new to publish
 
 app = Flask(__name__)
 app.secret_key = "bztracker.me"  # Change in production
@@ -37,197 +76,536 @@ app.secret_key = "bztracker.me"  # Change in production
 # ===============================
 # GLOBAL CACHES
 # ===============================
-CSV_CACHE = None  # Pandas DataFrame caching CSV data (snapshots)
-CSV_CACHE_LOCK = threading.Lock()
+STORE = SnapshotStore(SNAPSHOT_STORE_DIR)
+if ROLE == "web":
+    SHARED = SharedStateReader(SHARED_STATE_DIR, STORE)  # what the ingest process publishes
+    SNAPSHOT_CACHE = SHARED.snapshots
+    ROLLUPS = SHARED.rollups
+else:
+    # time-sorted columnar snapshots, tailed from STORE (in shared files when other processes read them)
+    SNAPSHOT_CACHE = SnapshotCache(STORE, SharedArena(SHARED_STATE_DIR) if ROLE == "ingest" else None)
+    ROLLUPS = Rollups()  # per-product first/last/min/max sellPrice per /top window
+DEPTH_STORE = DepthStore(DEPTH_STORE_DIR, STORE)  # memory-mapped order-book tiers
+BAR_STORE = BarStore(BARS_DIR)  # rolled-up history older than the raw snapshots
+TICK_WRITER = TickWriter(STORE, DEPTH_STORE)  # fsynced, marker-committed ticks
 
-# MODEL_CACHE: product_id -> (model, scaler, avg_dt, confidence)
+# MODEL_CACHE: product_id -> (model, scaler, avg_dt, confidence). Like
+# PREDICTIONS, it and MODEL_VERSIONS are read-only dicts that publishers
+# replace whole, so lookups and inference never take MODEL_LOCK.
 MODEL_CACHE = {}
-MODEL_LOCK = threading.Lock()
+MODEL_VERSIONS = {}  # product_id -> number of models published so far (kept across restarts)
+MODEL_LOCK = threading.Lock()  # serialises publishers; readers never take it
+MODEL_REGISTRY = ModelRegistry(MODEL_REGISTRY_DIR) if ROLE != "web" else None
+
+# PREDICTIONS: read-only table of per-product scores, rebuilt and swapped in
+# whole after every fetch and training tick; routes only look things up.
+PREDICTIONS = {"version": 0, "generated_at": 0.0, "products": {}, "top_investments": [],
+               "json": json.dumps({"version": 0, "generated_at": 0.0, "predictions": []})}
+PREDICTIONS_LOCK = threading.Lock()  # serialises rebuilds, never taken by readers
+PREDICTION_REFRESH_SECONDS = 5
+
+# STREAM: the last few per-tick deltas, encoded once and written as-is to
+# every /stream client. The ingest role has no clients: it appends them to
+# DELTA_LOG instead, which each web worker follows into its own STREAM.
+STREAM = EventStream()
+DELTA_LOG = DeltaLog(os.path.join(SHARED_STATE_DIR, "events")) if ROLE != "all" else None
+
+# PORTFOLIO: tracked purchases in SQLite; any worker may write one (a short
+# transaction that waits for the others). TRACKED_VIEW is the whole
+# portfolio valued at the latest prices, rebuilt only after a purchase or
+# a new tick and swapped in whole, like PREDICTIONS.
+PORTFOLIO = Portfolio(TRACKED_DB)
+TRACKED_VIEW = {"key": None}
+
+# ===============================
+# INSTRUMENTATION (metrics.py; served at /metrics)
+# ===============================
+METRICS_DIR = os.path.join(SHARED_STATE_DIR, "metrics")  # per-process dumps the web workers' /metrics merges
+METRICS_DUMP_INTERVAL = 5  # seconds between dumps by the ingest process and by each web worker
+PROFILE_DIR = os.path.join(SNAPSHOT_STORE_DIR, "profiles")  # folded stacks from ?profile=1 and SIGUSR1
+PROFILE_REQUESTS = os.environ.get("BZ_PROFILE") == "1"  # honour ?profile=1 (off by default: anyone could ask)
+PROFILE_NEXT_CYCLE = threading.Event()  # set by SIGUSR1: profile the next training cycle
+
+TICK_WRITE_SECONDS = Histogram("bz_tick_write_seconds", "Time to commit one fetched tick (snapshots and order-book tiers)")
+TICK_PRODUCTS = Gauge("bz_tick_products", "Products in the last written tick")
+CACHE_RELOAD_SECONDS = Histogram("bz_cache_reload_seconds",
+                                 "Snapshot cache reloads, by source (store: tailing the store, shared: a published version)")
+CACHE_RELOAD_ROWS = Counter("bz_cache_reload_rows_total", "Rows added to the snapshot cache by reloads")
+CACHE_ROWS = Gauge("bz_cache_rows", "Rows held in the snapshot cache")
+PREPARE_SECONDS = Histogram("bz_prepare_training_seconds", "prepare_training_data time per product")
+FIT_SECONDS = Histogram("bz_fit_seconds", "Model fit time per product in the training workers, by engine")
+TRAIN_CYCLE_SECONDS = Histogram("bz_training_cycle_seconds", "Length of a training cycle",
+                                LATENCY_BUCKETS + (600, 1800, 3600))
+STREAM_OVERFLOWS = Counter("bz_stream_overflow_total", "/stream clients turned away at STREAM_MAX_CLIENTS (told to retry)")
+MODELS_TRAINED = Counter("bz_models_trained_total", "Model fits by outcome (trained, failed)")
+MODEL_STALENESS = Gauge("bz_model_staleness_seconds", "Age of the oldest fitted model")
+MODELS = Gauge("bz_models", "Products with a fitted model")
+REQUEST_SECONDS = Histogram("bz_request_seconds", "Request latency until the response starts, by route, method and status")
+RENDER_SECONDS = Histogram("bz_template_render_seconds", "Template render time, by template")
 
 # ===============================
 # CSV & DATA CACHING FUNCTIONS
 # ===============================
-def init_csv(file_path, headers):
-    if not os.path.exists(file_path):
+def now_epoch():
+    """Current wall-clock time in the store's epoch seconds (naive local time, like snapshot_time)."""
+    return int(np.datetime64(datetime.now(), "s").astype(np.int64))
+
+def migrate_snapshot_csv():
+    """Import the legacy market_snapshot.csv / order-book CSVs into empty stores (runs once)."""
+    if STORE.is_empty() and BAR_STORE.is_empty() and os.path.exists(SNAPSHOT_FILE):
         try:
-            with open(file_path, "w", newline="", encoding="utf-8") as f:
-                csv.writer(f).writerow(headers)
-            logging.info(f"Initialized {file_path}")
+            rows = STORE.migrate_csv(SNAPSHOT_FILE)
+            logging.info(f"Migrated {rows} rows from {SNAPSHOT_FILE} into {SNAPSHOT_STORE_DIR}")
         except Exception as e:
-            logging.error(f"Error initializing {file_path}: {e}")
+            logging.error(f"Error migrating {SNAPSHOT_FILE}: {e}")
+    if len(DEPTH_STORE.ticks()) == 0 and os.path.exists(SELL_SUMMARY_FILE):
+        try:
+            DEPTH_STORE.migrate_csv(SELL_SUMMARY_FILE, BUY_SUMMARY_FILE)
+        except Exception as e:
+            logging.error(f"Error migrating {SELL_SUMMARY_FILE}: {e}")
 
-def load_csv_to_df(file_path):
+def migrate_tracked_csv():
+    """Import the legacy tracked_items.csv into PORTFOLIO (once, whichever process gets there first)."""
     try:
-        df = pd.read_csv(file_path)
-        return df
+        rows = PORTFOLIO.migrate_csv(TRACKED_FILE)
+        if rows:
+            logging.info(f"Migrated {rows} positions from {TRACKED_FILE} into {TRACKED_DB}")
     except Exception as e:
-        logging.error(f"Error reading {file_path}: {e}")
-        return pd.DataFrame()
+        logging.error(f"Error migrating {TRACKED_FILE}: {e}")
+
+def refresh_snapshot_cache():
+    """SNAPSHOT_CACHE.refresh(), timed. Returns rows added."""
+    with CACHE_RELOAD_SECONDS.time(source="store"):
+        rows = SNAPSHOT_CACHE.refresh()
+    CACHE_RELOAD_ROWS.inc(rows, source="store")
+    return rows
 
-def update_csv_cache():
-    global CSV_CACHE
+def update_snapshot_cache():
+    """Tail the store so rows from other writers show up; the fetcher refreshes on every tick."""
     while True:
-        with CSV_CACHE_LOCK:
-            CSV_CACHE = load_csv_to_df(SNAPSHOT_FILE)
+        try:
+            if refresh_snapshot_cache():
+                ROLLUPS.update(SNAPSHOT_CACHE, now_epoch())
+        except Exception as e:
+            logging.error(f"Error refreshing snapshot cache: {e}")
         time.sleep(60)  # update cache every minute
 
-threading.Thread(target=update_csv_cache, daemon=True).start()
+def _snapshot_records(cols):
+    """Convert cached column arrays to the legacy list-of-dicts shape."""
+    times = from_epoch(cols["snapshot_time"]).tolist()
+    pids = [STORE.products[code] for code in cols["product"].tolist()]
+    values = {col: arr.tolist() for col, arr in cols.items() if col not in ("snapshot_time", "product")}
+    return [dict({"snapshot_time": t, "product_id": pid}, **{col: v[i] for col, v in values.items()})
+            for i, (t, pid) in enumerate(zip(times, pids))]
 
 def get_latest_snapshots():
-    """Return a dict mapping product_id -> latest snapshot row (as dict) from CSV_CACHE."""
-    with CSV_CACHE_LOCK:
-        if CSV_CACHE is None or CSV_CACHE.empty:
-            return {}
-        df = CSV_CACHE.copy()
-    try:
-        df["snapshot_time"] = pd.to_datetime(df["snapshot_time"], format="%Y-%m-%d %H:%M:%S", errors='coerce')
-    except Exception:
-        return {}
-    df = df.dropna(subset=["snapshot_time"])
-    df.sort_values("snapshot_time", inplace=True)
-    latest = df.groupby("product_id").tail(1)
-    return latest.to_dict(orient="records")
-
-def get_snapshots_for_product(product_id):
-    """Return a sorted list of snapshots (as dicts) for product_id from CSV_CACHE."""
-    with CSV_CACHE_LOCK:
-        if CSV_CACHE is None or CSV_CACHE.empty:
-            return []
-        df = CSV_CACHE.copy()
-    df["snapshot_time"] = pd.to_datetime(df["snapshot_time"], format="%Y-%m-%d %H:%M:%S", errors='coerce')
-    df = df[df["product_id"] == product_id].dropna(subset=["snapshot_time"])
-    df.sort_values("snapshot_time", inplace=True)
-    return df.to_dict(orient="records")
+    """Return a list of latest snapshot rows (as dicts), one per product, in time order."""
+    latest = SNAPSHOT_CACHE.latest()
+    order = np.argsort(latest["snapshot_time"], kind="stable")
+    return _snapshot_records({col: arr[order] for col, arr in latest.items()})
+
+def get_product_series(product_id, columns=None, start=None, minutes=None):
+    """Return read-only, time-sorted column views (epoch-second snapshot_time) for product_id.
+
+    start (epoch seconds) or minutes (counted back from the product's latest
+    snapshot) narrow the range with a binary search instead of a scan.
+    """
+    code = STORE.codes.get(product_id)
+    if minutes is not None:
+        latest = SNAPSHOT_CACHE.latest_row(code)
+        start = None if latest is None else int(latest["snapshot_time"]) - int(minutes * 60)
+    return SNAPSHOT_CACHE.product(code, columns and ["snapshot_time"] + list(columns), start=start)
+
+def get_product_history(product_id, columns, start=None, max_points=MAX_POINTS):
+    """Like get_product_series, but reaching back past the raw snapshots through the bar tiers.
+
+    Days before the product's first raw snapshot come from the coarsest tier
+    whose bars are still at most (range / max_points) seconds wide, so a
+    one-year range costs a few thousand bars rather than a year of ticks.
+    Bars read as snapshots: their close in each column at their last tick.
+    """
+    raw = get_product_series(product_id, columns, start=start)
+    code = STORE.codes.get(product_id)
+    if code is None:
+        return raw
+    end = int(raw["snapshot_time"][0]) // DAY * DAY if len(raw["snapshot_time"]) else now_epoch()
+    first = BAR_STORE.first_time() if start is None else start
+    if first is None or first >= end:
+        return raw
+    tier = BAR_STORE.pick_tier((now_epoch() - first) / max_points, first)
+    bars = BAR_STORE.product(tier, code, start, end, ["snapshot_time"] + list(columns))
+    if len(bars["snapshot_time"]) == 0:
+        return raw
+    return {col: np.concatenate([bars[col], raw[col]]) for col in raw}
 
 def get_latest_snapshot(product_id):
-    snaps = get_snapshots_for_product(product_id)
-    return snaps[-1] if snaps else None
+    """Return the latest snapshot of product_id (as a dict) in O(1), or None."""
+    row = SNAPSHOT_CACHE.latest_row(STORE.codes.get(product_id))
+    if row is None:
+        return None
+    latest = {"snapshot_time": from_epoch(row.pop("snapshot_time")).item(), "product_id": product_id}
+    row.pop("product")
+    latest.update({col: value.item() for col, value in row.items()})
+    return latest
 
 # ===============================
 # DATA FETCHING (Background)
 # ===============================
+def write_tick(now, products):
+    """Writer stage: commit one fetched tick, then bring the in-memory views up to date."""
+    try:
+        stats = TICK_WRITER.write(now, products)
+    except Exception as e:
+        logging.error(f"Error writing tick {now}: {e}")
+        return
+    TICK_WRITE_SECONDS.observe(stats["seconds"])
+    TICK_PRODUCTS.set(stats["products"])
+    try:
+        refresh_snapshot_cache()
+        ROLLUPS.update(SNAPSHOT_CACHE, now_epoch())
+        refresh_predictions()
+        publish_delta(now)
+    except Exception as e:
+        logging.error(f"Error refreshing caches after tick {now}: {e}")
+    logging.info(f"Logged {stats['products']} products, {stats['sell_summary']} sell / "
+                 f"{stats['buy_summary']} buy tiers at {now} in {stats['seconds'] * 1000:.0f}ms")
+
 def fetch_and_log_data():
-    init_csv(SNAPSHOT_FILE, ["snapshot_time", "product_id", "sellPrice", "buyPrice",
-                               "sellVolume", "buyVolume", "sellMovingWeek", "buyMovingWeek",
-                               "sellOrders", "buyOrders"])
-    init_csv(SELL_SUMMARY_FILE, ["snapshot_time", "product_id", "pricePerUnit", "amount", "orders", "tier_rank"])
-    init_csv(BUY_SUMMARY_FILE, ["snapshot_time", "product_id", "pricePerUnit", "amount", "orders", "tier_rank"])
-    
+    from fetcher import BazaarFetcher
     logging.info("Starting API data fetch loop...")
-    while True:
-        snapshot_time = datetime.now().isoformat(sep=" ", timespec="seconds")
-        try:
-            response = requests.get(API_URL, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-        except Exception as e:
-            logging.error(f"Error fetching API data: {e}")
-            time.sleep(120)
+    BazaarFetcher(API_URL, write_tick, interval=FETCH_INTERVAL).run()
+
+# ===============================
+# RETENTION & COMPACTION (Background)
+# ===============================
+def top_history():
+    """Bar summaries for the /top windows that reach back past the oldest raw snapshot."""
+    parts = STORE.partitions()
+    if not parts:
+        return {}
+    raw_start = partition_start(parts[0])
+    first = BAR_STORE.first_time()
+    if first is None or first >= raw_start:
+        return {}
+    history = {}
+    for name, seconds in WINDOWS.items():
+        cutoff = None if seconds is None else now_epoch() - seconds
+        if cutoff is not None and cutoff >= raw_start:
             continue
-        products = data.get("products", {})
+        reach = first if cutoff is None else max(cutoff, first)
+        tier = BAR_STORE.pick_tier((raw_start - reach) / TOP_HISTORY_POINTS, cutoff)
+        history[name] = BAR_STORE.window_summary(tier, cutoff, raw_start)
+    return history
+
+def compact_history():
+    """Roll complete raw days into the bar tiers, then drop raw days and bars past their retention."""
+    today = now_epoch() // DAY * DAY
+    parts = STORE.partitions()
+    if parts:
+        done = [BAR_STORE.last_day(tier) for tier in TIERS]
+        day = partition_start(parts[0]) // DAY * DAY
+        if None not in done:
+            day = max(day, min(done) + DAY)
+        while day < today:
+            started = time.time()
+            BAR_STORE.append_day(day, STORE.read(start=day, end=day + DAY - 1))
+            logging.info(f"Rolled {datetime.fromtimestamp(day):%Y-%m-%d} into bars in {time.time() - started:.1f}s")
+            day += DAY
+    done = [BAR_STORE.last_day(tier) for tier in TIERS]
+    if None not in done:
+        cutoff = min(today - RETENTION_DAYS["raw"] * DAY, min(done) + DAY)
+        dropped = STORE.drop_before(cutoff)
+        if dropped:
+            rows = SNAPSHOT_CACHE.trim(cutoff)
+            logging.info(f"Dropped {dropped} raw partitions ({rows} cached rows) before {datetime.fromtimestamp(cutoff)}")
+    for tier in TIERS:
+        if RETENTION_DAYS[tier] is not None:
+            BAR_STORE.drop_before(tier, today - RETENTION_DAYS[tier] * DAY)
+    ROLLUPS.set_history(top_history())
+    ROLLUPS.update(SNAPSHOT_CACHE, now_epoch())
+
+def compact_history_periodically():
+    while True:
         try:
-            with open(SNAPSHOT_FILE, "a", newline="", encoding="utf-8") as snap_f, \
-                 open(SELL_SUMMARY_FILE, "a", newline="", encoding="utf-8") as sell_f, \
-                 open(BUY_SUMMARY_FILE, "a", newline="", encoding="utf-8") as buy_f:
-                snap_writer = csv.writer(snap_f)
-                sell_writer = csv.writer(sell_f)
-                buy_writer = csv.writer(buy_f)
-                for pid, info in products.items():
-                    quick = info.get("quick_status", {})
-                    snap_writer.writerow([
-                        snapshot_time, pid,
-                        quick.get("sellPrice", 0.0),
-                        quick.get("buyPrice", 0.0),
-                        quick.get("sellVolume", 0),
-                        quick.get("buyVolume", 0),
-                        quick.get("sellMovingWeek", 0),
-                        quick.get("buyMovingWeek", 0),
-                        quick.get("sellOrders", 0),
-                        quick.get("buyOrders", 0)
-                    ])
-                    for i, sell in enumerate(info.get("sell_summary", [])):
-                        sell_writer.writerow([snapshot_time, pid,
-                                              sell.get("pricePerUnit", 0.0),
-                                              sell.get("amount", 0),
-                                              sell.get("orders", 0), i])
-                    for i, buy in enumerate(info.get("buy_summary", [])):
-                        buy_writer.writerow([snapshot_time, pid,
-                                             buy.get("pricePerUnit", 0.0),
-                                             buy.get("amount", 0),
-                                             buy.get("orders", 0), i])
-                    logging.info(f"Logged data for {pid} at {snapshot_time}")
+            compact_history()
         except Exception as e:
-            logging.error(f"Error writing CSVs: {e}")
-        time.sleep(120)
-
-threading.Thread(target=fetch_and_log_data, daemon=True).start()
+            logging.error(f"Error compacting history: {e}")
+        time.sleep(COMPACT_INTERVAL)
 
 # ===============================
 # MODEL TRAINING & CACHING
 # ===============================
 def prepare_training_data(product_id, window_seconds=600):
     """Prepares training data for product_id using snapshots within a future window."""
-    snapshots = get_snapshots_for_product(product_id)
-    if not snapshots or len(snapshots) < 5:
-        return None
-    X, y, dt_diffs = [], [], []
-    for row in snapshots:
+    with PREPARE_SECONDS.time():
+        series = get_product_series(product_id, ["sellPrice"] + FEATURE_COLUMNS)
+        if len(series["snapshot_time"]) < 5:
+            return None
+        X, y, dt_diffs = build_training_set(series["snapshot_time"], series["sellPrice"],
+                                            np.column_stack([series[col] for col in FEATURE_COLUMNS]),
+                                            window_seconds)
+        if len(X) < 5:
+            return None
+        avg_dt = np.mean(dt_diffs)
+        return X, y, avg_dt
+
+def publish_model(pid, model, scaler, avg_dt, confidence, meta):
+    """Persist a finished fit, then swap it in."""
+    global MODEL_CACHE, MODEL_VERSIONS
+    FIT_SECONDS.observe(meta["fit_seconds"], engine=meta["engine"])
+    entry = (model, scaler, avg_dt, confidence)
+    with MODEL_LOCK:
+        version = MODEL_VERSIONS.get(pid, 0) + 1
         try:
-            current_time = row["snapshot_time"].to_pydatetime() if isinstance(row["snapshot_time"], pd.Timestamp) else datetime.strptime(row["snapshot_time"], "%Y-%m-%d %H:%M:%S")
-        except Exception:
-            continue
-        future = [r for r in snapshots if 0 < ( (r["snapshot_time"].to_pydatetime() if isinstance(r["snapshot_time"], pd.Timestamp) else datetime.strptime(r["snapshot_time"], "%Y-%m-%d %H:%M:%S")) - current_time).total_seconds() <= window_seconds]
-        if not future:
-            continue
-        peak = max(future, key=lambda r: float(r["sellPrice"]))
-        X.append([current_time.timestamp(), float(row["sellVolume"]), float(row["buyVolume"]), float(row["sellOrders"]), float(row["buyOrders"])])
-        y.append(float(peak["sellPrice"]))
-        dt_diffs.append(((peak["snapshot_time"].to_pydatetime() if isinstance(peak["snapshot_time"], pd.Timestamp) else datetime.strptime(peak["snapshot_time"], "%Y-%m-%d %H:%M:%S")) - current_time).total_seconds())
-    if len(X) < 5:
-        return None
-    avg_dt = np.mean(dt_diffs)
-    return np.array(X), np.array(y), avg_dt
+            MODEL_REGISTRY.put(pid, entry, version, meta)
+        except Exception as e:
+            logging.error(f"Error saving model for {pid}: {e}")
+        MODEL_CACHE = {**MODEL_CACHE, pid: entry}  # models first, then versions (see forecast())
+        MODEL_VERSIONS = {**MODEL_VERSIONS, pid: version}
+    # Let new models show up during a long cycle without rescoring after every single fit.
+    if time.time() - PREDICTIONS["generated_at"] > PREDICTION_REFRESH_SECONDS:
+        refresh_predictions()
+
+TRAINER = TrainingScheduler(lambda pid: prepare_training_data(pid, window_seconds=600), publish_model,
+                            workers=int(os.environ.get("TRAIN_WORKERS", 0)) or None)
 
 def update_models_periodically():
-    """Trains an MLPRegressor (with scaling) for each product and caches the model, scaler, avg_dt, and confidence."""
+    """Fits each product with new data (engine chosen per product, see forecasters.py), in parallel, and caches the model, scaler, avg_dt, and confidence."""
     while True:
-        snapshots = get_latest_snapshots()
-        product_ids = {row["product_id"] for row in snapshots}
-        for pid in product_ids:
-            data = prepare_training_data(pid, window_seconds=600)
-            if data is None:
-                continue
-            X_train, y_train, avg_dt = data
-            try:
-                scaler = StandardScaler()
-                X_scaled = scaler.fit_transform(X_train)
-                model = MLPRegressor(hidden_layer_sizes=(64, 32, 16), max_iter=500, random_state=42)
-                model.fit(X_scaled, y_train)
-                score = model.score(X_scaled, y_train)
-                confidence = max(0, min(100, score * 100))
-                with MODEL_LOCK:
-                    MODEL_CACHE[pid] = (model, scaler, avg_dt, confidence)
-                logging.info(f"Updated model for {pid} (conf: {confidence:.2f}%)")
-            except Exception as e:
-                logging.error(f"Model training failed for {pid}: {e}")
-        time.sleep(300)
-
-threading.Thread(target=update_models_periodically, daemon=True).start()
+        started = time.time()
+        latest = SNAPSHOT_CACHE.latest(["snapshot_time", "product", "sellVolume"])
+        candidates = [(STORE.products[code], int(t), int(vol)) for code, t, vol in
+                      zip(latest["product"], latest["snapshot_time"], latest["sellVolume"])]
+        sampler = None
+        if PROFILE_NEXT_CYCLE.is_set():
+            PROFILE_NEXT_CYCLE.clear()
+            sampler = Sampler(threading.get_ident(), interval=0.01).start()
+        stats = TRAINER.run_cycle(candidates, WarmStarts(MODEL_REGISTRY, MODEL_CACHE, TRAINER.fitted))
+        if sampler is not None:
+            path = sampler.stop().write(PROFILE_DIR, "training-cycle")
+            logging.info(f"Profiled training cycle: {sampler.samples} samples in {sampler.seconds:.1f}s -> {path}")
+        TRAIN_CYCLE_SECONDS.observe(stats["cycle_seconds"])
+        MODELS_TRAINED.inc(stats["trained"], outcome="trained")
+        MODELS_TRAINED.inc(stats["failed"], outcome="failed")
+        newest = max((t for _, t, _ in candidates), default=0)
+        evict_models({pid for pid, t, _ in candidates if t > newest - MODEL_TTL})
+        if stats["trained"]:
+            MODEL_REGISTRY.checkpoint(MODEL_CACHE, MODEL_VERSIONS, TRAINER.fitted)
+        refresh_predictions()
+        oldest = "n/a" if stats["oldest_model_age"] is None else f"{stats['oldest_model_age']:.0f}s"
+        logging.info(f"Training cycle: {stats['trained']} models in {stats['cycle_seconds']:.1f}s "
+                     f"({stats['models_per_second']:.2f} models/s), {stats['skipped']} unchanged, "
+                     f"{stats['failed']} failed, oldest model age {oldest}, engines {stats['engines']}")
+        time.sleep(max(0, TRAIN_INTERVAL - (time.time() - started)))
+
+def load_models():
+    """Warm restart: swap in every model the registry holds, so predictions need no training first."""
+    global MODEL_CACHE, MODEL_VERSIONS
+    started = time.time()
+    models, versions, meta = MODEL_REGISTRY.load()
+    with MODEL_LOCK:
+        MODEL_CACHE, MODEL_VERSIONS = models, versions
+    TRAINER.fitted.update(meta)
+    logging.info(f"Loaded {len(models)} models from {MODEL_REGISTRY_DIR} in {time.time() - started:.2f}s")
+
+def evict_models(listed):
+    """Drop the models of products that are no longer listed (see MODEL_TTL)."""
+    global MODEL_CACHE, MODEL_VERSIONS
+    stale = set(MODEL_CACHE) - set(listed)
+    if not stale:
+        return
+    with MODEL_LOCK:
+        MODEL_CACHE = {pid: entry for pid, entry in MODEL_CACHE.items() if pid not in stale}
+        MODEL_VERSIONS = {pid: v for pid, v in MODEL_VERSIONS.items() if pid not in stale}
+    for pid in stale:
+        TRAINER.fitted.pop(pid, None)
+    MODEL_REGISTRY.evict(stale)
+    logging.info(f"Evicted models of {len(stale)} delisted products")
+
+# ===============================
+# BATCHED INFERENCE
+# ===============================
+def refresh_predictions():
+    """Score every product that has a model in one batched pass and swap in a new PREDICTIONS table."""
+    global PREDICTIONS
+    with PREDICTIONS_LOCK:
+        latest = SNAPSHOT_CACHE.latest()
+        models = MODEL_CACHE
+        pids = [STORE.products[code] for code in latest["product"]]
+        rows = np.array([i for i, pid in enumerate(pids) if pid in models], dtype=np.int64)
+        products = {}
+        if len(rows):
+            entries = [models[pids[i]] for i in rows]
+            X = np.column_stack([latest["snapshot_time"][rows].astype(float)] +
+                                [latest[col][rows].astype(float) for col in FEATURE_COLUMNS])
+            peaks = predict_batch([e[0] for e in entries], [e[1] for e in entries], X)
+            current_sell = latest["sellPrice"][rows].astype(float)
+            confidence = np.array([e[3] for e in entries], dtype=float)
+            real_price = peaks + 0.1
+            margin = real_price - current_sell
+            score = margin * confidence * np.log(latest["sellVolume"][rows].astype(float) + 1)
+            for j, i in enumerate(rows):
+                products[pids[i]] = {
+                    "product_id": pids[i],
+                    "snapshot_time": str(from_epoch(latest["snapshot_time"][i])).replace("T", " "),
+                    "current_sell_price": float(current_sell[j]),
+                    "predicted_peak_price": float(peaks[j]),
+                    "real_price": float(real_price[j]),
+                    "margin": float(margin[j]),
+                    "confidence": float(confidence[j]),
+                    "investment_score": float(score[j]),
+                    "estimated_time_sec": float(entries[j][2]),
+                }
+        candidates = [p for p in products.values() if p["current_sell_price"] < p["real_price"]]
+        top_investments = [{
+            "product_id": p["product_id"],
+            "current_sell_price": p["current_sell_price"],
+            "predicted_peak_price": round(p["predicted_peak_price"], 2),
+            "real_price": round(p["real_price"], 2),
+            "confidence": round(p["confidence"], 2),
+            "investment_score": round(p["investment_score"], 2),
+        } for p in candidates]
+        top_investments.sort(key=lambda x: x["investment_score"], reverse=True)
+        version = PREDICTIONS["version"] + 1
+        generated_at = time.time()
+        PREDICTIONS = {
+            "version": version,
+            "generated_at": generated_at,
+            "products": products,
+            "top_investments": top_investments[:10],
+            "json": json.dumps({"version": version, "generated_at": generated_at,
+                                "predictions": list(products.values())}),
+        }
+
+# ===============================
+# HORIZON FORECASTS
+# ===============================
+FORECAST_HORIZON = 600   # default seconds ahead for /time_to_target and /plot
+FORECAST_STEP = 30       # default seconds between forecast points
+MAX_FORECAST_HORIZON = 6 * 3600
+MIN_FORECAST_STEP = 5
+MAX_FORECAST_POINTS = 5000
+FORECAST_CACHE_SIZE = 1024
+FORECAST_CACHE = OrderedDict()  # (pid, model version, latest tick, horizon, step) -> forecast
+FORECAST_LOCK = threading.Lock()
+
+def forecast_args():
+    """Read ?horizon=&step= (seconds) from the request; raises ValueError when out of bounds."""
+    horizon = int(request.args.get("horizon", FORECAST_HORIZON))
+    step = int(request.args.get("step", FORECAST_STEP))
+    if not 0 < horizon <= MAX_FORECAST_HORIZON:
+        raise ValueError(f"horizon must be between 1 and {MAX_FORECAST_HORIZON} seconds")
+    if step < MIN_FORECAST_STEP:
+        raise ValueError(f"step must be at least {MIN_FORECAST_STEP} seconds")
+    if horizon // step + 1 > MAX_FORECAST_POINTS:
+        raise ValueError(f"horizon/step gives more than {MAX_FORECAST_POINTS} points")
+    return horizon, step
+
+def forecast(product_id, horizon=FORECAST_HORIZON, step=FORECAST_STEP):
+    """Predicted peak price at every step over the next horizon seconds, in one predict call.
+
+    Returns (base_time, future_times, predictions, confidence), or None when
+    there is no model or no latest snapshot. Results are memoised per
+    (product, model version, latest snapshot), so repeated chart/target
+    requests are free until new data or a new model arrives.
+    """
+    # Version first: publish_model swaps models in before versions, so a
+    # result is never memoised under a newer version than its model.
+    version = MODEL_VERSIONS.get(product_id, 0)
+    entry = MODEL_CACHE.get(product_id)
+    latest = SNAPSHOT_CACHE.latest_row(STORE.codes.get(product_id))
+    if entry is None or latest is None:
+        return None
+    key = (product_id, version, int(latest["snapshot_time"]), horizon, step)
+    with FORECAST_LOCK:
+        if key in FORECAST_CACHE:
+            FORECAST_CACHE.move_to_end(key)
+            return FORECAST_CACHE[key]
+    model, scaler, _, confidence = entry
+    base_time = float(latest["snapshot_time"])
+    future_times = np.arange(base_time, base_time + horizon + step, step)
+    X = np.column_stack([future_times] + [np.full(len(future_times), float(latest[col])) for col in FEATURE_COLUMNS])
+    preds = predict_batch([model], [scaler], X[None, :, :])[0]
+    future_times.flags.writeable = False
+    preds.flags.writeable = False
+    result = (base_time, future_times, preds, confidence)
+    with FORECAST_LOCK:
+        FORECAST_CACHE[key] = result
+        if len(FORECAST_CACHE) > FORECAST_CACHE_SIZE:
+            FORECAST_CACHE.popitem(last=False)
+    return result
+
+# ===============================
+# CHART CACHE
+# ===============================
+PLOT_CACHE_SIZE = 256
+PLOT_CACHE = OrderedDict()  # (pid, latest tick, model version, horizon, step) -> rendered /plot figures
+PLOT_LOCK = threading.Lock()
+
+@functools.lru_cache(maxsize=1)
+def plotly_js():
+    """(path, version) of the plotly.min.js bundled with the plotly package, found without importing plotly."""
+    package = importlib.util.find_spec("plotly").submodule_search_locations[0]
+    return os.path.join(package, "package_data", "plotly.min.js"), importlib.metadata.version("plotly")
+
+def chart_key(product_id, horizon, step):
+    latest = SNAPSHOT_CACHE.latest_row(STORE.codes.get(product_id))
+    version = MODEL_VERSIONS.get(product_id, 0)
+    return (product_id, None if latest is None else int(latest["snapshot_time"]), version, horizon, step)
+
+def chart_etag(product_id, horizon, step):
+    """ETag of a chart, known before rendering it, so a revalidation that matches costs no work."""
+    return hashlib.sha1(repr(chart_key(product_id, horizon, step)).encode()).hexdigest()[:20]
+
+def _not_modified(etag):
+    response = make_response("", 304)
+    return _revalidate(response, etag)
+
+def _revalidate(response, etag):
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"  # may be stored, but always revalidated
+    return response
+
+def render_chart(product_id, horizon=FORECAST_HORIZON, step=FORECAST_STEP):
+    """{"json", "peak_info"} for /plot, memoised per (product, latest tick, model version, range); None if no data."""
+    key = chart_key(product_id, horizon, step)
+    with PLOT_LOCK:
+        if key in PLOT_CACHE:
+            PLOT_CACHE.move_to_end(key)
+            return PLOT_CACHE[key]
+    series = get_product_history(product_id, ["sellPrice", "buyPrice", "sellVolume", "buyVolume"])
+    if len(series["snapshot_time"]) == 0:
+        return None
+    peak_info = ""
+    peak = None
+    result = forecast(product_id, horizon, step)
+    if result is not None:
+        base_time, future_times, future_preds, confidence = result
+        max_idx = int(np.argmax(future_preds))
+        peak_price = future_preds[max_idx]
+        peak_time = datetime.fromtimestamp(future_times[max_idx])
+        minutes_to_peak = (future_times[max_idx] - base_time) / 60
+        peak = (future_times, future_preds, future_times[max_idx], peak_price + 0.1, confidence)
+        peak_info = f"Expected peak: {peak_price + 0.1:.2f} coins at {peak_time.strftime('%I:%M %p')} (in ~{minutes_to_peak:.1f} minutes). Confidence: {confidence:.2f}%"
+    figures = product_figures(product_id, series, peak)
+    # Safe to embed in a <script> block as well as to serve as JSON.
+    chart = {"json": json.dumps(figures).replace("<", "\\u003c"), "peak_info": peak_info}
+    with PLOT_LOCK:
+        PLOT_CACHE[key] = chart
+        if len(PLOT_CACHE) > PLOT_CACHE_SIZE:
+            PLOT_CACHE.popitem(last=False)
+    return chart
 
 # ===============================
 # ADDITIONAL PREDICTION ROUTES
 # ===============================
 @app.route('/predict_trend/<product_id>')
 def predict_trend(product_id):
-    """Classify trend direction using linear regression on historical data."""
-    snapshots = get_snapshots_for_product(product_id)
-    if len(snapshots) < 5:
+    """Classify trend direction using a least-squares line through the historical data."""
+    series = get_product_history(product_id, ["sellPrice"])
+    if len(series["snapshot_time"]) < 5:
         return json.dumps({"error": "Insufficient data"})
-    data = [(pd.to_datetime(r["snapshot_time"]).timestamp() if not isinstance(r["snapshot_time"], pd.Timestamp) else r["snapshot_time"].timestamp(), float(r["sellPrice"])) for r in snapshots]
-    X = np.array([t for t, _ in data]).reshape(-1, 1)
-    y = np.array([price for _, price in data])
-    lr = LinearRegression().fit(X, y)
-    slope = lr.coef_[0]
+    slope, _ = linear_fit(series["snapshot_time"], series["sellPrice"])
     trend = "sideways"
     if slope > 0.001:
         trend = "up"
@@ -245,28 +623,20 @@ def time_to_target(product_id):
         target = float(target)
     except Exception:
         return json.dumps({"error": "Invalid target"})
-    with MODEL_LOCK:
-        entry = MODEL_CACHE.get(product_id)
-    if entry is None:
+    try:
+        horizon, step = forecast_args()
+    except ValueError as e:
+        return json.dumps({"error": str(e)})
+    if product_id not in MODEL_CACHE:
         return json.dumps({"error": f"No model for {product_id}"})
-    model, scaler, _, _ = entry
-    latest = get_latest_snapshot(product_id)
-    if latest is None:
+    result = forecast(product_id, horizon, step)
+    if result is None:
         return json.dumps({"error": "No latest snapshot"})
-    base_time = pd.to_datetime(latest["snapshot_time"]).timestamp() if not isinstance(latest["snapshot_time"], pd.Timestamp) else latest["snapshot_time"].timestamp()
-    features_base = [float(latest["sellVolume"]), float(latest["buyVolume"]), float(latest["sellOrders"]), float(latest["buyOrders"])]
-    horizon = 600
-    step = 30
-    future_times = np.arange(base_time, base_time + horizon + step, step)
-    prediction_time = None
-    for t in future_times:
-        features = np.array([[t] + features_base])
-        pred = model.predict(scaler.transform(features))[0]
-        if pred >= target:
-            prediction_time = t
-            break
+    base_time, future_times, preds, _ = result
+    hits = np.flatnonzero(preds >= target)
+    prediction_time = future_times[hits[0]] if len(hits) else None
     if prediction_time is None:
-        msg = f"Target price {target} not reached in next 10 minutes."
+        msg = f"Target price {target} not reached in next {horizon / 60:g} minutes."
     else:
         dt_minutes = (prediction_time - base_time) / 60
         peak_time = datetime.fromtimestamp(prediction_time).strftime("%I:%M %p")
@@ -280,242 +650,184 @@ def time_to_target(product_id):
 def index():
     snapshots = get_latest_snapshots()
     snapshots.sort(key=lambda r: r["product_id"])
-    return render_template("index.html", snapshots=snapshots)
+    return render_template("index.html", snapshots=snapshots, predictions=PREDICTIONS["products"],
+                           last_event=STREAM.last_id)
 
 @app.route('/plot/<product_id>')
 def plot_product(product_id):
-    snapshots = get_snapshots_for_product(product_id)
-    if not snapshots:
+    try:
+        horizon, step = forecast_args()
+    except ValueError as e:
+        return f"Invalid forecast range: {e}"
+    etag = chart_etag(product_id, horizon, step)
+    if etag in request.if_none_match:
+        return _not_modified(etag)
+    chart = render_chart(product_id, horizon, step)
+    if chart is None:
         return f"No data available for product: {product_id}"
-    times = [pd.to_datetime(r["snapshot_time"]) for r in snapshots]
-    sell_prices = [float(r["sellPrice"]) for r in snapshots]
-    buy_prices = [float(r["buyPrice"]) for r in snapshots]
-    sell_volumes = [int(r["sellVolume"]) for r in snapshots]
-    buy_volumes = [int(r["buyVolume"]) for r in snapshots]
+    response = make_response(render_template("plot.html", product_id=product_id, figures=chart["json"],
+                                             peak_info=chart["peak_info"], plotly_version=plotly_js()[1]))
+    return _revalidate(response, etag)
 
-    fig_price = go.Figure()
-    fig_price.add_trace(go.Scatter(x=times, y=sell_prices, mode="lines+markers", name="Sell Price"))
-    fig_price.add_trace(go.Scatter(x=times, y=buy_prices, mode="lines+markers", name="Buy Price"))
+@app.route('/plot_data/<product_id>')
+def plot_data(product_id):
+    """The /plot figures as JSON, for clients that already have the page and plotly.js."""
+    try:
+        horizon, step = forecast_args()
+    except ValueError as e:
+        return json.dumps({"error": str(e)})
+    etag = chart_etag(product_id, horizon, step)
+    if etag in request.if_none_match:
+        return _not_modified(etag)
+    chart = render_chart(product_id, horizon, step)
+    if chart is None:
+        return json.dumps({"error": f"No data available for product: {product_id}"})
+    return _revalidate(make_response(chart["json"], {"Content-Type": "application/json"}), etag)
 
-    peak_info = ""
-    with MODEL_LOCK:
-        entry = MODEL_CACHE.get(product_id)
-    if entry is not None:
-        model, scaler, _, confidence = entry
-        latest = get_latest_snapshot(product_id)
-        if latest:
-            base_time = pd.to_datetime(latest["snapshot_time"]).timestamp()
-            features_base = [float(latest["sellVolume"]), float(latest["buyVolume"]), float(latest["sellOrders"]), float(latest["buyOrders"])]
-            horizon = 600
-            step = 30
-            future_times = np.arange(base_time, base_time + horizon + step, step)
-            future_dt = [datetime.fromtimestamp(t) for t in future_times]
-            future_preds = [model.predict(scaler.transform(np.array([[t] + features_base])))[0] for t in future_times]
-            fig_price.add_trace(go.Scatter(
-                x=future_dt,
-                y=future_preds,
-                mode="lines",
-                name="Predicted Trend"
-            ))
-            max_idx = int(np.argmax(future_preds))
-            peak_price = future_preds[max_idx]
-            peak_time = future_dt[max_idx]
-            minutes_to_peak = (future_times[max_idx] - base_time) / 60
-            fig_price.add_trace(go.Scatter(
-                x=[peak_time],
-                y=[peak_price + 0.1],
-                mode="markers",
-                marker=dict(size=12, symbol="star"),
-                name=f"Expected Peak (Conf: {confidence:.2f}%)"
-            ))
-            peak_info = f"Expected peak: {peak_price + 0.1:.2f} coins at {peak_time.strftime('%I:%M %p')} (in ~{minutes_to_peak:.1f} minutes). Confidence: {confidence:.2f}%"
-    
-    fig_price.update_layout(title=f"Price Evolution for {product_id}",
-                            xaxis_title="Time",
-                            yaxis_title="Price",
-                            hovermode="x unified")
-    price_div = plot(fig_price, output_type="div", include_plotlyjs=True)
-
-    # Sell Volume Graph
-    fig_sell = go.Figure()
-    fig_sell.add_trace(go.Scatter(x=times, y=sell_volumes, mode="lines+markers", name="Sell Volume"))
-    fig_sell.update_layout(title=f"Sell Volume for {product_id}", xaxis_title="Time", yaxis_title="Volume")
-    sell_vol_div = plot(fig_sell, output_type="div", include_plotlyjs=False)
-
-    # Buy Volume Graph
-    fig_buy = go.Figure()
-    fig_buy.add_trace(go.Scatter(x=times, y=buy_volumes, mode="lines+markers", name="Buy Volume"))
-    fig_buy.update_layout(title=f"Buy Volume for {product_id}", xaxis_title="Time", yaxis_title="Volume")
-    buy_vol_div = plot(fig_buy, output_type="div", include_plotlyjs=False)
-
-    return render_template("plot.html", product_id=product_id,
-                           price_div=price_div,
-                           sell_volume_div=sell_vol_div,
-                           buy_volume_div=buy_vol_div,
-                           peak_info=peak_info)
+@app.route('/assets/plotly.min.js')
+def plotly_asset():
+    """plotly.js from the installed plotly package; the page links it with ?v=<version>, so it caches for a year."""
+    return send_file(plotly_js()[0], mimetype="text/javascript", max_age=365 * 24 * 3600, conditional=True)
 
 @app.route('/predict/<product_id>')
 def predict_product(product_id):
-    with MODEL_LOCK:
-        entry = MODEL_CACHE.get(product_id)
-    if entry is None:
+    prediction = PREDICTIONS["products"].get(product_id)
+    if prediction is None:
+        if product_id in MODEL_CACHE and get_latest_snapshot(product_id) is None:
+            return json.dumps({"error": f"No latest data for {product_id}"})
         return json.dumps({"error": f"Model not available for {product_id}"})
-    model, scaler, avg_dt, confidence = entry
-    latest = get_latest_snapshot(product_id)
-    if latest is None:
-        return json.dumps({"error": f"No latest data for {product_id}"})
-    features = [pd.to_datetime(latest["snapshot_time"]).timestamp(), float(latest["sellVolume"]), float(latest["buyVolume"]),
-                float(latest["sellOrders"]), float(latest["buyOrders"])]
-    predicted_peak = model.predict(scaler.transform(np.array(features).reshape(1, -1)))[0]
     return json.dumps({
         "product_id": product_id,
-        "predicted_peak_price": predicted_peak,
-        "estimated_time_sec": avg_dt,
-        "confidence": confidence
+        "predicted_peak_price": prediction["predicted_peak_price"],
+        "estimated_time_sec": prediction["estimated_time_sec"],
+        "confidence": prediction["confidence"]
     })
 
+@app.route('/depth/<product_id>')
+def depth(product_id):
+    """Order-book depth at a tick: ?tick=<id> or ?time=<YYYY-mm-dd HH:MM:SS> (default latest), ?quantity=, ?side=."""
+    try:
+        tick = request.args.get("tick")
+        tick = int(tick) if tick is not None else None
+        if tick is None and request.args.get("time"):
+            tick = DEPTH_STORE.tick_at(int(to_epoch([request.args["time"]])[0]))
+            if tick is None:
+                return json.dumps({"error": "No order-book data at or before that time"})
+        quantity = request.args.get("quantity")
+        quantity = float(quantity) if quantity is not None else None
+    except ValueError:
+        return json.dumps({"error": "Invalid tick, time or quantity"})
+    side = request.args.get("side")
+    if side not in (None, "sell", "buy"):
+        return json.dumps({"error": "side must be sell or buy"})
+    result = DEPTH_STORE.depth(product_id, tick, quantity, [side] if side else None)
+    if result is None:
+        return json.dumps({"error": f"No order-book data for {product_id}"})
+    return json.dumps(result)
+
+@app.route('/api/predictions')
+def api_predictions():
+    """Whole prediction table, serialised once per rebuild."""
+    return PREDICTIONS["json"]
+
 @app.route('/investments')
 def investments():
-    snapshots = get_latest_snapshots()
-    investments_list = []
-    for row in snapshots:
-        try:
-            current_sell = float(row["sellPrice"])
-            volume = float(row["sellVolume"])
-            pid = row["product_id"]
-            with MODEL_LOCK:
-                entry = MODEL_CACHE.get(pid)
-            if entry is None:
-                continue
-            model, scaler, avg_dt, confidence = entry
-            latest = get_latest_snapshot(pid)
-            if not latest:
-                continue
-            features = [pd.to_datetime(latest["snapshot_time"]).timestamp(), float(latest["sellVolume"]), float(latest["buyVolume"]),
-                        float(latest["sellOrders"]), float(latest["buyOrders"])]
-            predicted_peak = model.predict(scaler.transform(np.array(features).reshape(1, -1)))[0]
-            real_price = predicted_peak + 0.1
-            if current_sell >= real_price:
-                continue
-            margin = real_price - current_sell
-            score = margin * confidence * log(volume + 1)
-            investments_list.append({
-                "product_id": pid,
-                "current_sell_price": current_sell,
-                "predicted_peak_price": round(predicted_peak, 2),
-                "real_price": round(real_price, 2),
-                "confidence": round(confidence, 2),
-                "investment_score": round(score, 2)
-            })
-        except Exception as ex:
-            logging.error(f"Error processing {row.get('product_id')}: {ex}")
-            continue
-    top_investments = sorted(investments_list, key=lambda x: x["investment_score"], reverse=True)[:10]
-    return render_template("investments.html", investments=top_investments)
+    return render_template("investments.html", investments=PREDICTIONS["top_investments"])
 
 @app.route('/buy_investment/<product_id>', methods=["GET", "POST"])
 def buy_investment(product_id):
     if request.method == "POST":
         try:
             quantity = float(request.form.get("quantity"))
+            if not quantity > 0:
+                flash("Quantity must be positive.", "danger")
+                return redirect(url_for("buy_investment", product_id=product_id))
             latest = get_latest_snapshot(product_id)
             if not latest:
                 flash("No current data for product.", "danger")
                 return redirect(url_for("investments"))
             current_sell = float(latest["sellPrice"])
             buy_price = current_sell + 0.1
-            with MODEL_LOCK:
-                entry = MODEL_CACHE.get(product_id)
-            if entry is None:
+            prediction = PREDICTIONS["products"].get(product_id)
+            if prediction is None:
                 flash("Model not available.", "danger")
                 return redirect(url_for("investments"))
-            model, scaler, _, _ = entry
-            features = [pd.to_datetime(latest["snapshot_time"]).timestamp(), float(latest["sellVolume"]), float(latest["buyVolume"]),
-                        float(latest["sellOrders"]), float(latest["buyOrders"])]
-            predicted_peak = model.predict(scaler.transform(np.array(features).reshape(1, -1)))[0]
-            target_sell = predicted_peak + 0.1
-            with open(TRACKED_FILE, "a", newline="", encoding="utf-8") as f:
-                csv.writer(f).writerow([datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                         product_id, quantity, buy_price, round(target_sell, 2), "N/A"])
+            target_sell = prediction["predicted_peak_price"] + 0.1
+            PORTFOLIO.add(now_epoch(), product_id, quantity, buy_price, round(target_sell, 2))
             flash(f"Bought {quantity} of {product_id} at {buy_price} coins.", "success")
             return redirect(url_for("tracked"))
         except Exception as e:
             flash(f"Error processing purchase: {e}", "danger")
             return redirect(url_for("investments"))
-    return render_template("buy_investment.html", product_id=product_id)
+    return render_template("buy_investment.html", product_id=product_id, latest=get_latest_snapshot(product_id),
+                           prediction=PREDICTIONS["products"].get(product_id))
+
+def _nullable(values, decimals=2):
+    """Rounded floats as a list, NaN as None (null in JSON)."""
+    values = np.round(values, decimals)
+    return np.where(np.isnan(values), None, values).tolist()
+
+def value_portfolio(product_id=None):
+    """Positions (all, or one product's) marked to the latest sell prices: {"summary", "json"}.
+
+    One indexed read (cached until the next purchase) and one vectorised join
+    against the latest-row table, however many positions there are.
+    """
+    positions = PORTFOLIO.positions(product_id=product_id)
+    if len(positions["id"]) == 0:  # fresh install, or everything sold
+        return {"summary": {"positions": 0, "unpriced": 0, "unpriced_cost": 0.0, "cost": 0.0, "value": 0.0,
+                            "pnl": 0.0, "pnl_pct": None},
+                "json": "[]"}
+    names, inverse = np.unique(positions["product_id"], return_inverse=True)
+    codes = np.array([STORE.codes.get(pid, -1) for pid in names.tolist()], dtype=np.int64)[inverse]
+    latest = SNAPSHOT_CACHE.latest(["product", "sellPrice"])
+    marked = value_positions(positions, codes, latest["product"], latest["sellPrice"])
+    priced = ~np.isnan(marked["current"])
+    cost, worth = float(marked["cost"][priced].sum()), float(marked["value"][priced].sum())
+    summary = {"positions": len(codes), "unpriced": int((~priced).sum()),
+               "unpriced_cost": round(float(marked["cost"][~priced].sum()), 2), "cost": round(cost, 2),
+               "value": round(worth, 2),
+               "pnl": round(worth - cost, 2), "pnl_pct": round((worth - cost) / cost * 100, 2) if cost else None}
+    times = np.char.replace(np.datetime_as_string(from_epoch(positions["purchase_time"]), unit="s"), "T", " ")
+    rows = list(zip(times.tolist(), positions["product_id"].tolist(), _nullable(positions["quantity"]),
+                    _nullable(positions["buy_price"]), _nullable(positions["target_sell"]),
+                    _nullable(marked["current"]), _nullable(marked["value"]), _nullable(marked["pnl"]),
+                    _nullable(marked["pnl_pct"]), positions["status"].tolist()))
+    return {"summary": summary, "json": json.dumps(rows).replace("</", "<\\/")}
 
 @app.route('/tracked')
 def tracked():
-    tracked_items = pd.read_csv(TRACKED_FILE)
-    for row in tracked_items:
-        try:
-            t = datetime.strptime(row["purchase_time"], "%Y-%m-%d %H:%M:%S")
-            row["purchase_time"] = t.strftime("%Y-%m-%d %H:%M:%S")
-        except Exception:
-            continue
-    return render_template("tracked.html", tracked_items=tracked_items)
+    """Tracked purchases with live P&L; ?product_id= narrows to one product (through its index)."""
+    global TRACKED_VIEW
+    product_id = request.args.get("product_id") or None
+    if product_id is not None:
+        view = value_portfolio(product_id)
+    else:
+        view, key = TRACKED_VIEW, (PORTFOLIO.version(), len(SNAPSHOT_CACHE))
+        if view["key"] != key:
+            view = dict(value_portfolio(), key=key)
+            TRACKED_VIEW = view
+    return render_template("tracked.html", summary=view["summary"], positions=view["json"], product_id=product_id)
 
 @app.route('/top')
 def top_variations():
-    df = load_csv_to_df(SNAPSHOT_FILE)
-    if df.empty:
+    table = ROLLUPS.advance(now_epoch())
+    if table is None:
         return "No data available."
-    df["snapshot_time"] = pd.to_datetime(df["snapshot_time"], format="%Y-%m-%d %H:%M:%S", errors="coerce")
-    df = df.dropna(subset=["snapshot_time"])
-    variations = []
     compare_mode = request.args.get("compare", "").lower()
-    now = datetime.now()
-    
     if compare_mode == "2min":
-        target_time = now - timedelta(minutes=2)
-        for pid, group in df.groupby("product_id"):
-            group_sorted = group.sort_values("snapshot_time")
-            if len(group_sorted) < 2:
-                continue
-            prev = group_sorted.iloc[(group_sorted["snapshot_time"] - target_time).abs().argsort()].iloc[0]
-            latest = group_sorted.iloc[-1]
-            if prev["snapshot_time"] >= latest["snapshot_time"]:
-                continue
-            raw_margin = latest["sellPrice"] - prev["sellPrice"]
-            perc = (raw_margin / prev["sellPrice"] * 100) if prev["sellPrice"] else 0
-            variations.append({
-                "product_id": pid,
-                "previous_price": prev["sellPrice"],
-                "current_price": latest["sellPrice"],
-                "raw_margin": raw_margin,
-                "percentage_variation": perc,
-                "snapshot_time": latest["snapshot_time"].strftime("%Y-%m-%d %H:%M:%S")
-            })
-        variations.sort(key=lambda x: abs(x["percentage_variation"]), reverse=True)
+        window = table["compare"]
+        previous = window["prev_price"]
+        keep = window["prev_time"] < window["last_time"]
     else:
         time_filter = request.args.get("time_filter", "all").lower()
-        time_deltas = {"minute": timedelta(minutes=2), "hour": timedelta(hours=1),
-                       "day": timedelta(days=1), "week": timedelta(weeks=1),
-                       "month": timedelta(days=30), "year": timedelta(days=365), "all": None}
-        delta = time_deltas.get(time_filter)
-        if delta:
-            cutoff = now - delta
-            df = df[df["snapshot_time"] >= cutoff]
-        for pid, group in df.groupby("product_id"):
-            group_sorted = group.sort_values("snapshot_time")                                                                   
-            if len(group_sorted) < 2:
-                continue
-            first = group_sorted.iloc[0]
-            last = group_sorted.iloc[-1]
-            raw_margin = last["sellPrice"] - first["sellPrice"]
-            perc = (raw_margin / first["sellPrice"] * 100) if first["sellPrice"] else 0
-            variations.append({
-                "product_id": pid,
-                "previous_price": first["sellPrice"],
-                "current_price": last["sellPrice"],
-                "raw_margin": raw_margin,
-                "percentage_variation": perc,
-                "snapshot_time": last["snapshot_time"].strftime("%Y-%m-%d %H:%M:%S")
-            })
-        sort_by = request.args.get("sort_by", "percentage_variation")
-        sort_order = request.args.get("sort_order", "desc")
-        variations.sort(key=lambda x: x.get(sort_by, 0), reverse=(sort_order=="desc"))
-    
+        window = table["windows"].get(time_filter, table["windows"]["all"])
+        previous = window["first_price"]
+        keep = window["count"] >= 2
+    current = window["last_price"]
+    raw_margin = current - previous
+    with np.errstate(divide="ignore", invalid="ignore"):
+        perc = np.where(previous != 0, raw_margin / previous * 100, 0.0)
     try:
         min_perc = float(request.args.get("min_percentage", 0))
     except Exception:
@@ -524,11 +836,313 @@ def top_variations():
         min_margin = float(request.args.get("min_margin", 0))
     except Exception:
         min_margin = 0
-    variations = [v for v in variations if abs(v["percentage_variation"]) >= min_perc and abs(v["raw_margin"]) >= min_margin]
-    top_variations = variations[:100]
-    return render_template("top.html", variations=top_variations,
+    keep &= (np.abs(perc) >= min_perc) & (np.abs(raw_margin) >= min_margin)
+
+    names = np.asarray(STORE.products, dtype=object)[table["codes"]]
+    rows = np.flatnonzero(keep)
+    rows = rows[np.argsort(names[rows], kind="stable")]  # same base order as a groupby over product_id
+    if compare_mode == "2min":
+        rows = rows[np.argsort(-np.abs(perc[rows]), kind="stable")]
+    else:
+        sort_by = request.args.get("sort_by", "percentage_variation")
+        descending = request.args.get("sort_order", "desc") == "desc"
+        keys = {"previous_price": previous, "current_price": current, "raw_margin": raw_margin,
+                "percentage_variation": perc, "snapshot_time": window["last_time"]}
+        if sort_by in keys:
+            values = keys[sort_by][rows]
+            rows = rows[np.argsort(-values if descending else values, kind="stable")]
+        elif sort_by == "product_id" and descending:
+            rows = rows[::-1]
+    top = rows[:100]
+    times = from_epoch(window["last_time"][top]).astype(datetime)
+    variations = [{
+        "product_id": names[i],
+        "previous_price": previous[i],
+        "current_price": current[i],
+        "raw_margin": raw_margin[i],
+        "percentage_variation": perc[i] if previous[i] else 0,
+        "snapshot_time": t.strftime("%Y-%m-%d %H:%M:%S"),
+    } for i, t in zip(top, times)]
+    return render_template("top.html", variations=variations,
                            current_filter=request.args.get("time_filter", "all"),
-                           compare_mode=compare_mode)
+                           compare_mode=compare_mode, last_event=STREAM.last_id)
+
+# ===============================
+# LIVE UPDATES (server-sent events)
+# ===============================
+DELTA_COLUMNS = ["sellPrice", "buyPrice", "sellVolume", "buyVolume",
+                 "sellOrders", "buyOrders", "sellMovingWeek", "buyMovingWeek"]  # the index table's order
+DELTA_MOVERS = 10
+STREAM_KEEPALIVE = 15  # seconds between comments that keep idle connections (and proxies) open
+# Open /stream connections per process. Under gthread each one holds a worker
+# thread, so the default leaves a quarter of GUNICORN_THREADS for pages;
+# clients past the limit get what they missed and reconnect after
+# STREAM_OVERFLOW_RETRY instead of waiting for a thread.
+STREAM_MAX_CLIENTS = int(os.environ.get("STREAM_MAX_CLIENTS", max(1, int(os.environ.get("GUNICORN_THREADS", 64)) * 3 // 4)))
+STREAM_OVERFLOW_RETRY = 30  # seconds
+STREAM_SLOTS = threading.BoundedSemaphore(STREAM_MAX_CLIENTS)
+_DELTA_STATE = {"latest": None, "predictions": {}}  # what the previous delta reported (fetcher thread only)
+_FOLLOWER_LOCK = threading.Lock()
+_FOLLOWING = False
+
+def tick_delta(now):
+    """What changed since the previous delta: latest rows, the 2-minute movers and predictions."""
+    latest = SNAPSHOT_CACHE.latest(["product"] + DELTA_COLUMNS)
+    codes = latest["product"]
+    changed = np.ones(len(codes), dtype=bool)
+    previous = _DELTA_STATE["latest"]
+    if previous is not None and len(previous["product"]):
+        pos = np.minimum(np.searchsorted(previous["product"], codes), len(previous["product"]) - 1)
+        same = previous["product"][pos] == codes
+        for col in DELTA_COLUMNS:
+            same &= previous[col][pos] == latest[col]
+        changed = ~same
+    _DELTA_STATE["latest"] = latest
+    rows = np.flatnonzero(changed)
+    values = zip(*(latest[col][rows].tolist() for col in DELTA_COLUMNS))
+    prices = {STORE.products[code]: list(row) for code, row in zip(codes[rows].tolist(), values)}
+
+    movers = []
+    table = ROLLUPS.advance(now_epoch())
+    if table is not None:
+        compare = table["compare"]
+        previous_price, current = compare["prev_price"], compare["last_price"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            perc = np.where(previous_price != 0, (current - previous_price) / previous_price * 100, 0.0)
+        rows = np.flatnonzero(compare["prev_time"] < compare["last_time"])
+        rows = rows[np.argsort(-np.abs(perc[rows]), kind="stable")][:DELTA_MOVERS]
+        movers = [{"product_id": STORE.products[code], "previous_price": float(previous_price[i]),
+                   "current_price": float(current[i]), "percentage_variation": float(perc[i])}
+                  for i, code in zip(rows.tolist(), table["codes"][rows].tolist())]
+
+    predictions = {pid: [p["predicted_peak_price"], p["confidence"]] for pid, p in PREDICTIONS["products"].items()}
+    reported = _DELTA_STATE["predictions"]
+    _DELTA_STATE["predictions"] = predictions
+    return {
+        "time": now.strftime("%Y-%m-%d %H:%M:%S"),
+        "columns": DELTA_COLUMNS,
+        "prices": prices,
+        "movers": movers,
+        "predictions": {pid: p for pid, p in predictions.items() if reported.get(pid) != p},
+    }
+
+def publish_delta(now):
+    """Encode this tick's delta once, for every /stream client (through DELTA_LOG in the ingest role)."""
+    tick = int(np.datetime64(now, "s").astype(np.int64))
+    event = encode_event(tick, "tick", tick_delta(now))
+    if DELTA_LOG is not None:
+        DELTA_LOG.append(tick, event)
+    else:
+        STREAM.publish(tick, event)
+
+def _follow_delta_log():
+    """Web role: on the first /stream request, load DELTA_LOG and start following it."""
+    global _FOLLOWING
+    with _FOLLOWER_LOCK:
+        if not _FOLLOWING:
+            last = DELTA_LOG.catch_up(STREAM)
+            threading.Thread(target=DELTA_LOG.follow, args=(STREAM, last), daemon=True).start()
+            _FOLLOWING = True
+
+@app.route('/stream')
+def stream():
+    """Per-tick deltas as server-sent events. Resumes after Last-Event-ID (or ?last_id=).
+
+    At most STREAM_MAX_CLIENTS stay connected; any other client is sent the
+    events it missed and told to reconnect in STREAM_OVERFLOW_RETRY seconds.
+    """
+    if ROLE == "web":
+        _follow_delta_log()
+    try:
+        last_id = int(request.headers.get("Last-Event-ID") or request.args.get("last_id") or 0)
+    except ValueError:
+        last_id = 0
+
+    def events(last_id):
+        if not STREAM_SLOTS.acquire(blocking=False):  # taken here, so a client that never starts holds none
+            STREAM_OVERFLOWS.inc()
+            yield f"retry: {STREAM_OVERFLOW_RETRY * 1000}\n\n".encode()
+            pending = STREAM.since(last_id) if last_id else []
+            if pending is None:
+                yield RESET_EVENT
+            for _, data in pending or ():
+                yield data
+            return
+        try:
+            yield b"retry: 5000\n\n"
+            last_id = last_id or STREAM.last_id
+            while True:
+                pending = STREAM.wait(last_id, STREAM_KEEPALIVE)
+                if pending is None:
+                    yield RESET_EVENT
+                    last_id = STREAM.last_id
+                elif not pending:
+                    yield KEEPALIVE
+                else:
+                    for event_id, data in pending:
+                        yield data
+                        last_id = event_id
+        finally:
+            STREAM_SLOTS.release()
+
+    return Response(events(last_id), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ===============================
+# METRICS & PROFILING
+# ===============================
+_METRICS_DUMPED = 0.0
+
+def collect_gauges():
+    """Point-in-time gauges, refreshed just before a scrape or a dump."""
+    oldest = min((state["fitted_at"] for state in TRAINER.fitted.values()), default=None)
+    if oldest is not None:
+        MODEL_STALENESS.set(time.time() - oldest)
+    MODELS.set(len(MODEL_CACHE))
+    CACHE_ROWS.set(len(SNAPSHOT_CACHE))
+
+def dump_metrics(min_interval=METRICS_DUMP_INTERVAL):
+    """Ingest and web roles: write this process's metrics where the web workers' /metrics merges them."""
+    global _METRICS_DUMPED
+    if time.time() - _METRICS_DUMPED < min_interval:
+        return
+    _METRICS_DUMPED = time.time()
+    try:
+        collect_gauges()
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        dump(os.path.join(METRICS_DIR, f"{os.getpid()}.json"))
+    except Exception as e:
+        logging.error(f"Error dumping metrics: {e}")
+
+@app.before_request
+def _start_request():
+    g.request_started = time.perf_counter()
+    if PROFILE_REQUESTS and request.args.get("profile") == "1":
+        g.profiler = Sampler(threading.get_ident()).start()
+
+@app.after_request
+def _finish_request(response):
+    """Observe the request's latency; with ?profile=1, write its profile and name it in X-Profile."""
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    REQUEST_SECONDS.observe(time.perf_counter() - g.get("request_started", time.perf_counter()),
+                            route=route, method=request.method, status=response.status_code)
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        path = profiler.stop().write(PROFILE_DIR, request.endpoint or "request")
+        response.headers["X-Profile"] = path
+        logging.info(f"Profiled {request.path}: {profiler.samples} samples in {profiler.seconds:.2f}s -> {path}")
+    return response
+
+def _render_started(sender, template, context, **extra):
+    g.setdefault("render_started", {})[template.name] = time.perf_counter()
+
+def _render_finished(sender, template, context, **extra):
+    started = g.get("render_started", {}).pop(template.name, None)
+    if started is not None:
+        RENDER_SECONDS.observe(time.perf_counter() - started, template=template.name)
+
+before_render_template.connect(_render_started, app)
+template_rendered.connect(_render_finished, app)
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text format; under gunicorn, summed over the ingest process and every web worker."""
+    collect_gauges()
+    snapshot = REGISTRY.snapshot()
+    if ROLE == "web":
+        snapshot = merge(load_dumps(METRICS_DIR, exclude={os.getpid()}) + [snapshot])
+    return Response(render(snapshot), content_type=CONTENT_TYPE)
+
+# ===============================
+# SHARED STATE (multi-worker)
+# ===============================
+def _rollups_changed(table, published):
+    """True if any /top window or the compare table moved (a bare anchor bump does not count)."""
+    if published is None or table is None:
+        return table is not published
+    return (table["compare"] is not published["compare"] or
+            any(window is not published["windows"][name] for name, window in table["windows"].items()))
+
+def publish_shared_state_periodically():
+    """Ingest role: slide the /top windows and publish a new version whenever anything changed."""
+    writer = SharedStateWriter(SHARED_STATE_DIR)
+    published = {"rows": -1, "rollups": None, "predictions": -1}
+    while True:
+        try:
+            table = ROLLUPS.advance(now_epoch())
+            versions = MODEL_VERSIONS  # before the models: a newer model is caught by the next check
+            models = MODEL_CACHE
+            current = {"rows": len(SNAPSHOT_CACHE), "rollups": table, "predictions": PREDICTIONS["version"]}
+            models_changed = models_key(versions) != writer.models_key and writer.models_due()
+            if models_changed or current["rows"] != published["rows"] or \
+                    current["predictions"] != published["predictions"] or \
+                    _rollups_changed(table, published["rollups"]):
+                writer.publish(SNAPSHOT_CACHE, table, PREDICTIONS, models, versions)
+                published = current
+            dump_metrics()
+        except Exception as e:
+            logging.error(f"Error publishing shared state: {e}")
+        time.sleep(SHARED_PUBLISH_INTERVAL)
+
+def sync_shared_state(min_interval=0.2):
+    """Web role: swap in the newest version the ingest process published (cheap when unchanged)."""
+    global PREDICTIONS, MODEL_CACHE, MODEL_VERSIONS
+    started, rows = time.perf_counter(), len(SNAPSHOT_CACHE)
+    if not SHARED.sync(min_interval):
+        return
+    CACHE_RELOAD_SECONDS.observe(time.perf_counter() - started, source="shared")
+    CACHE_RELOAD_ROWS.inc(max(0, len(SNAPSHOT_CACHE) - rows), source="shared")
+    if SHARED.predictions is not None:
+        PREDICTIONS = SHARED.predictions
+        MODEL_CACHE, MODEL_VERSIONS = SHARED.models, SHARED.model_versions
+
+# ===============================
+# APP FACTORY & BACKGROUND SERVICES
+# ===============================
+_LOADED = False
+
+def create_app():
+    """Load this process's state and return the app; starts no threads (see start_background_services).
+
+    Importing run.py only defines things, so gunicorn workers, training
+    processes and benchmarks pay for nothing they do not use:
+    gunicorn "run:create_app()".
+    """
+    global _LOADED
+    if not _LOADED:
+        migrate_tracked_csv()
+        if ROLE == "web":
+            sync_shared_state(min_interval=0)
+            app.before_request(sync_shared_state)
+            app.before_request(dump_metrics)
+        else:
+            migrate_snapshot_csv()
+            load_models()
+            refresh_snapshot_cache()
+            ROLLUPS.set_history(top_history())
+            ROLLUPS.update(SNAPSHOT_CACHE, now_epoch())
+            refresh_predictions()
+        _LOADED = True
+    return app
+
+def start_background_services():
+    """Fetcher, cache tailer, trainer and compaction (plus the shared-state publisher in the ingest role).
+
+    From the main thread, this also makes SIGUSR1 profile the next training cycle (see PROFILE_DIR).
+    """
+    if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR1, lambda signum, frame: PROFILE_NEXT_CYCLE.set())
+    threading.Thread(target=update_snapshot_cache, daemon=True).start()
+    threading.Thread(target=fetch_and_log_data, daemon=True).start()
+    threading.Thread(target=update_models_periodically, daemon=True).start()
+    threading.Thread(target=compact_history_periodically, daemon=True).start()
+    if ROLE == "ingest":
+        threading.Thread(target=publish_shared_state_periodically, daemon=True).start()
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app()
+    start_background_services()
+    if ROLE == "ingest":
+        threading.Event().wait()  # services run in daemon threads; gunicorn.conf.py stops us with SIGTERM
+    else:
+        app.run(debug=True, use_reloader=False)  # the reloader would run a second set of services
@@ -0,0 +1,370 @@
+"""Single-writer / multi-reader shared state for running several web workers.
+
+One ingest process (BZ_ROLE=ingest) fetches, writes, trains and publishes;
+gunicorn workers (BZ_ROLE=web) only map and read what it publishes:
+
+    <root>/arena-<gen>/<col>.bin    per-column memory-mapped files; each product's
+                                    time-sorted rows are one contiguous region
+    <root>/v<version>/tables.npz    region directory, latest-row table, /top rollups
+    <root>/v<version>/predictions.pkl
+    <root>/models-<n>/*.npy         fitted model weights, stacked per architecture
+    <root>/VERSION                  int64 counter, bumped once v<version>/ is complete
+
+The ingest process's own SnapshotCache allocates its per-product buffers from
+the arena, so the snapshot history exists once, in the page cache, however
+many workers map it. The same goes for model weights. A region is never
+written to again once it has been outgrown (it is relocated into fresh space),
+and compaction starts a new arena generation, so nothing a reader has mapped
+changes under it.
+"""
+import os
+import time
+import pickle
+import shutil
+import logging
+import threading
+
+import numpy as np
+
+from snapshot_store import SCHEMA, SnapshotCache
+from model_registry import read_stacked, write_stacked
+
+KEEP_VERSIONS = 4  # published versions kept on disk for readers still loading an older one
+MODELS_PUBLISH_INTERVAL = 30  # seconds; a training cycle refits models one by one, so batch them up
+
+
+class ArenaBuffer:
+    """ColumnBuffer look-alike whose columns are a region of a SharedArena's files.
+
+    The region is a single (maps, start, capacity, size) tuple that is
+    swapped whole, so lock-free readers always see a consistent one.
+    """
+
+    def __init__(self, dtypes, region, arena=None):
+        self.dtypes = dict(dtypes)
+        self.arena = arena
+        self.region = region
+
+    @property
+    def size(self):
+        return self.region[3]
+
+    def __len__(self):
+        return self.region[3]
+
+    def _move(self, capacity, keep):
+        maps, start, old_capacity, size = self.region
+        new_maps, new_start = self.arena.allocate(capacity)
+        for col in self.dtypes:
+            new_maps[col][new_start:new_start + keep] = maps[col][start:start + keep]
+        self.arena.release(old_capacity)
+        return new_maps, new_start
+
+    def append(self, data):
+        k = len(next(iter(data.values())))
+        if k == 0:
+            return
+        maps, start, capacity, size = self.region
+        end = size + k
+        if end > capacity:
+            capacity = max(end, capacity * 2)
+            maps, start = self._move(capacity, size)
+        for col in self.dtypes:
+            maps[col][start + size:start + end] = data[col]
+        self.region = (maps, start, capacity, end)
+
+    def view(self, col, start=0, stop=None):
+        return self.views([col], start, stop)[col]
+
+    def views(self, columns=None, start=0, stop=None):
+        maps, base, _, size = self.region
+        stop = size if stop is None else min(stop, size)
+        out = {}
+        for col in columns or self.dtypes:
+            v = maps[col][base + start:base + max(start, stop)].view(np.ndarray)
+            v.flags.writeable = False
+            out[col] = v
+        return out
+
+    def replace(self, data):
+        """Write fully rebuilt columns into a fresh region (out-of-order rows forced a re-sort)."""
+        n = len(next(iter(data.values())))
+        capacity = max(64, n)
+        maps, start = self.arena.allocate(capacity)
+        for col in self.dtypes:
+            maps[col][start:start + n] = data[col]
+        self.arena.release(self.region[2])
+        self.region = (maps, start, capacity, n)
+
+    def relocate(self):
+        """Copy this buffer into the arena's current generation, leaving some headroom."""
+        size = self.size
+        maps, start = self._move(max(64, size + size // 4), size)
+        self.region = (maps, start, max(64, size + size // 4), size)
+
+
+class SharedArena:
+    """Bump allocator over per-column memory-mapped files under <root>/arena-<gen>/."""
+
+    def __init__(self, root, dtypes=SCHEMA, rows=1 << 20):
+        self.root = root
+        self.dtypes = dict(dtypes)
+        self.initial_rows = rows
+        self.generation = None  # nothing touches disk until open(), so importing stays side-effect free
+        self.rows = self.used = self.live = 0
+        self.maps = {}
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Start a fresh generation after whatever a previous ingest process left behind."""
+        with self._lock:
+            if self.generation is None:
+                os.makedirs(self.root, exist_ok=True)
+                self.generation = max((int(d.split("-")[1]) for d in os.listdir(self.root)
+                                       if d.startswith("arena-")), default=-1)
+                self._start_generation(self.initial_rows)
+
+    def path(self, generation, col):
+        return os.path.join(self.root, f"arena-{generation}", f"{col}.bin")
+
+    def _start_generation(self, rows):
+        self.generation += 1
+        os.makedirs(os.path.dirname(self.path(self.generation, "x")), exist_ok=True)
+        self.rows = 0
+        self.used = 0  # rows handed out (bump pointer)
+        self.live = 0  # rows in regions that are still in use
+        self._grow(rows)
+
+    def _grow(self, rows):
+        maps = {}
+        for col, dtype in self.dtypes.items():
+            path = self.path(self.generation, col)
+            with open(path, "ab") as f:
+                f.truncate(rows * dtype.itemsize)
+            maps[col] = np.memmap(path, dtype=dtype, mode="r+", shape=(rows,))
+        self.maps, self.rows = maps, rows
+
+    def allocate(self, capacity):
+        """Reserve capacity rows; returns (maps, start). Earlier maps stay valid for earlier regions."""
+        if self.generation is None:
+            self.open()
+        with self._lock:
+            if self.used + capacity > self.rows:
+                self._grow(max(self.used + capacity, self.rows * 2))
+            start = self.used
+            self.used += capacity
+            self.live += capacity
+            return self.maps, start
+
+    def release(self, capacity):
+        with self._lock:
+            self.live -= capacity
+
+    def buffer(self, capacity=64):
+        maps, start = self.allocate(capacity)
+        return ArenaBuffer(self.dtypes, (maps, start, capacity, 0), self)
+
+    def needs_compaction(self):
+        return self.used > (1 << 20) and self.live * 2 < self.used
+
+    def compact(self, buffers):
+        """Move buffers into a fresh, tightly packed generation. The old files are removed by the publisher."""
+        buffers = list(buffers)
+        self._start_generation(max(1 << 20, sum(max(64, b.size + b.size // 4) for b in buffers)))
+        for buf in buffers:
+            buf.relocate()
+
+
+def _flatten_rollups(table):
+    out = {}
+    if table is None:
+        return out
+    out["rollups.codes"] = table["codes"]
+    out["rollups.anchor"] = np.int64(table["anchor"])
+    out["rollups.version"] = np.int64(table["version"])
+    for name, window in table["windows"].items():
+        for field, arr in window.items():
+            out[f"rollups.windows.{name}.{field}"] = arr
+    for field, arr in table["compare"].items():
+        out[f"rollups.compare.{field}"] = arr
+    return out
+
+
+def _unflatten_rollups(tables):
+    if "rollups.codes" not in tables:
+        return None
+    table = {"codes": tables["rollups.codes"], "anchor": int(tables["rollups.anchor"]),
+             "version": int(tables["rollups.version"]), "windows": {}, "compare": {}}
+    for key, arr in tables.items():
+        parts = key.split(".")
+        if parts[:2] == ["rollups", "windows"]:
+            table["windows"].setdefault(parts[2], {})[parts[3]] = arr
+        elif parts[:2] == ["rollups", "compare"]:
+            table["compare"][parts[2]] = arr
+    return table
+
+
+def _read_version(root):
+    try:
+        with open(os.path.join(root, "VERSION"), "rb") as f:
+            return int(np.frombuffer(f.read(8), dtype="<i8")[0])
+    except (FileNotFoundError, IndexError, ValueError):
+        return 0
+
+
+def models_key(model_versions):
+    """Identity of a model set: exact, so an eviction and a refit cannot cancel out like a sum of versions."""
+    return frozenset((model_versions or {}).items())
+
+
+class SharedStateWriter:
+    """Ingest side: publishes the cache's regions, tables, predictions and models as a new version."""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.version = _read_version(root)
+        self._models_dir = None
+        self.models_key = None
+        self._models_written = 0.0
+
+    def models_due(self):
+        """Whether changed models would be written by the next publish()."""
+        return self._models_dir is None or time.time() - self._models_written >= MODELS_PUBLISH_INTERVAL
+
+    def publish(self, cache, rollups_table, predictions, models=None, model_versions=None):
+        """Write v<version+1>/ and then bump VERSION. Models are only rewritten when model_versions changed."""
+        version = self.version + 1
+        tables = dict(cache.export_tables())
+        tables.update(_flatten_rollups(rollups_table))
+        key = models_key(model_versions)
+        if models is not None and key != self.models_key and self.models_due():
+            directory = os.path.join(self.root, f"models-{version}")
+            os.makedirs(directory, exist_ok=True)
+            write_stacked(directory, models, model_versions)
+            self._models_dir, self.models_key = os.path.basename(directory), key
+            self._models_written = time.time()
+        tables["models"] = np.array(self._models_dir or "")
+        staging = os.path.join(self.root, f".v{version}")
+        os.makedirs(staging, exist_ok=True)
+        np.savez(os.path.join(staging, "tables.npz"), **tables)
+        with open(os.path.join(staging, "predictions.pkl"), "wb") as f:
+            pickle.dump(predictions, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(staging, os.path.join(self.root, f"v{version}"))
+        fd = os.open(os.path.join(self.root, "VERSION"), os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            os.pwrite(fd, np.int64(version).tobytes(), 0)
+        finally:
+            os.close(fd)
+        self.version = version
+        self._cleanup(int(tables["generation"]))
+
+    def _cleanup(self, generation):
+        """Drop versions, arena generations and model sets no kept version refers to."""
+        keep = self.version - KEEP_VERSIONS
+        keep_gens, keep_models = {generation}, {self._models_dir}
+        for name in os.listdir(self.root):
+            if name.startswith("v") and name[1:].isdigit() and int(name[1:]) > keep:
+                try:
+                    with np.load(os.path.join(self.root, name, "tables.npz")) as z:
+                        keep_gens.add(int(z["generation"]))
+                        keep_models.add(str(z["models"]))
+                except FileNotFoundError:
+                    pass
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            stale = ((name.startswith("v") and name[1:].isdigit() and int(name[1:]) <= keep) or
+                     (name.startswith("arena-") and int(name.split("-")[1]) not in keep_gens) or
+                     (name.startswith("models-") and name not in keep_models))
+            if stale:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+class PublishedRollups:
+    """Rollups stand-in for web workers: the ingest process advances and publishes the table."""
+
+    def __init__(self):
+        self.table = None
+
+    def advance(self, now):
+        return self.table
+
+    def update(self, cache, now=None):
+        pass
+
+
+class SharedSnapshotCache(SnapshotCache):
+    """Read-only SnapshotCache over the per-product regions an ingest process published."""
+
+    def refresh(self):
+        return 0  # new state arrives through SharedStateReader.sync()
+
+    def load(self, tables, maps):
+        self._series = {int(code): ArenaBuffer(SCHEMA, (maps, int(start), int(size), int(size)))
+                        for code, start, size in zip(tables["codes"], tables["starts"], tables["sizes"])}
+        self._latest = {col: tables[f"latest.{col}"] for col in SCHEMA}
+        self._latest_rows = tables["latest_rows"]
+        self._rows = int(tables["rows"])
+
+
+class SharedStateReader:
+    """Web side: maps the newest published version; sync() is cheap when nothing changed."""
+
+    def __init__(self, root, store):
+        self.root = root
+        self.store = store
+        self.version = 0
+        self.snapshots = SharedSnapshotCache(store)
+        self.rollups = PublishedRollups()
+        self.predictions = None
+        self.models = {}
+        self.model_versions = {}
+        self._models_dir = None
+        self._arena = (None, 0, None)  # (generation, rows mapped, maps)
+        self._checked = 0.0
+
+    def _maps(self, generation, rows):
+        gen, mapped, maps = self._arena
+        if gen != generation or mapped < rows:
+            maps = {}
+            for col, dtype in SCHEMA.items():
+                path = os.path.join(self.root, f"arena-{generation}", f"{col}.bin")
+                maps[col] = np.memmap(path, dtype=dtype, mode="r", shape=(os.path.getsize(path) // dtype.itemsize,))
+            self._arena = (generation, min(len(m) for m in maps.values()), maps)
+        return self._arena[2]
+
+    def sync(self, min_interval=0.2):
+        """Load the newest published version if it changed. Returns True when state was replaced."""
+        now = time.monotonic()
+        if now - self._checked < min_interval:
+            return False
+        self._checked = now
+        for _ in range(3):
+            version = _read_version(self.root)
+            if version == self.version:
+                return False
+            try:
+                self._load(version)
+                return True
+            except FileNotFoundError:
+                continue  # superseded and cleaned up while we were loading it; try the newer one
+        logging.warning(f"Could not load shared state version {version} from {self.root}")
+        return False
+
+    def _load(self, version):
+        directory = os.path.join(self.root, f"v{version}")
+        with np.load(os.path.join(directory, "tables.npz")) as z:
+            tables = {key: z[key] for key in z.files}
+        with open(os.path.join(directory, "predictions.pkl"), "rb") as f:
+            predictions = pickle.load(f)
+        models_dir = str(tables["models"])
+        models, model_versions = self.models, self.model_versions
+        if models_dir != self._models_dir:
+            models, model_versions = read_stacked(os.path.join(self.root, models_dir))[:2] if models_dir else ({}, {})
+        maps = self._maps(int(tables["generation"]), int(tables["arena_rows"]))
+        self.store.reload_dictionary()
+        self.snapshots.load(tables, maps)
+        self.rollups.table = _unflatten_rollups(tables)
+        self.predictions = predictions
+        self.models, self.model_versions, self._models_dir = models, model_versions, models_dir
+        self.version = version
@@ -0,0 +1,536 @@
+"""Columnar, hour-partitioned storage for Bazaar quick_status snapshots.
+
+Layout on disk:
+
+    <root>/products.txt            product_id dictionary, one id per line (line no. = code)
+    <root>/<YYYYMMDDHH>/<col>.bin  one raw little-endian array per column and hour
+    <root>/ticks.bin               commit markers: (snapshot_time, partition, rows) records
+
+Each fetch appends one block per column to the partition of its hour, so
+writing is O(rows in the tick) and readers only open the partitions and
+columns a query asks for. A tick becomes visible only once its marker -
+the partition's committed row count - has been appended to ticks.bin, after
+the column blocks themselves; readers never look past the committed count,
+and the next writer truncates whatever an interrupted write left behind.
+"""
+import os
+import sys
+import shutil
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+
+# Column name -> on-disk dtype. snapshot_time is seconds since the epoch of
+# the naive wall-clock time the fetcher recorded (i.e. datetime64[s] as int64).
+SCHEMA = {
+    "snapshot_time": np.dtype("<i8"),
+    "product": np.dtype("<i4"),
+    "sellPrice": np.dtype("<f8"),
+    "buyPrice": np.dtype("<f8"),
+    "sellVolume": np.dtype("<i8"),
+    "buyVolume": np.dtype("<i8"),
+    "sellMovingWeek": np.dtype("<i8"),
+    "buyMovingWeek": np.dtype("<i8"),
+    "sellOrders": np.dtype("<i4"),
+    "buyOrders": np.dtype("<i4"),
+}
+VALUE_COLUMNS = [c for c in SCHEMA if c not in ("snapshot_time", "product")]
+CSV_COLUMNS = ["snapshot_time", "product_id"] + VALUE_COLUMNS
+
+PARTITION_SECONDS = 3600
+PARTITION_FORMAT = "%Y%m%d%H"
+MARKER_DTYPE = np.dtype([("snapshot_time", "<i8"), ("partition", "<i8"), ("rows", "<i8")])
+
+
+def to_epoch(values):
+    """Convert datetimes / '%Y-%m-%d %H:%M:%S' strings to int64 epoch seconds."""
+    import pandas as pd
+    return pd.to_datetime(values, format="%Y-%m-%d %H:%M:%S").values.astype("datetime64[s]").astype(np.int64)
+
+
+def from_epoch(values):
+    return np.asarray(values, dtype=np.int64).astype("datetime64[s]")
+
+
+def partition_key(epoch):
+    hour = int(epoch) - int(epoch) % PARTITION_SECONDS
+    return np.datetime64(hour, "s").astype(datetime).strftime(PARTITION_FORMAT)
+
+
+def partition_start(key):
+    return int(np.datetime64(datetime.strptime(key, PARTITION_FORMAT), "s").astype(np.int64))
+
+
+def columns_to_frame(data, products):
+    """Build a market_snapshot.csv shaped DataFrame from {column: ndarray} (consumes data)."""
+    import pandas as pd
+    # Re-code against alphabetically sorted categories so groupby order matches plain strings.
+    order = np.argsort(np.asarray(products, dtype=object))
+    rank = np.empty(len(order), dtype=np.int32)
+    rank[order] = np.arange(len(order), dtype=np.int32)
+    frame = {
+        "snapshot_time": from_epoch(data.pop("snapshot_time")),
+        "product_id": pd.Categorical.from_codes(rank[data.pop("product")],
+                                                categories=np.asarray(products, dtype=object)[order]),
+    }
+    frame.update(data)
+    return pd.DataFrame(frame)
+
+
+class SnapshotStore:
+    """Append-only columnar snapshot store with a product_id dictionary."""
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._dict_path = os.path.join(root, "products.txt")
+        self._marker_path = os.path.join(root, "ticks.bin")
+        self.products = []
+        self.codes = {}
+        self._committed = {}  # partition key -> committed rows, from ticks.bin
+        self._markers_seen = 0
+        self._marker_lock = threading.Lock()
+        self.reload_dictionary()
+
+    # ---- product dictionary -------------------------------------------
+    def reload_dictionary(self):
+        """Pick up product ids appended by another process."""
+        if not os.path.exists(self._dict_path):
+            return
+        with open(self._dict_path, encoding="utf-8") as f:
+            names = f.read().splitlines()
+        for name in names[len(self.products):]:
+            self.codes[name] = len(self.products)
+            self.products.append(name)
+
+    def encode(self, product_ids, sync=False):
+        """Return int32 codes for product_ids, interning unseen ids."""
+        new = [pid for pid in dict.fromkeys(product_ids) if pid not in self.codes]
+        if new:
+            with open(self._dict_path, "a", encoding="utf-8") as f:
+                f.write("".join(f"{pid}\n" for pid in new))
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            for pid in new:
+                self.codes[pid] = len(self.products)
+                self.products.append(pid)
+        return np.fromiter((self.codes[pid] for pid in product_ids), dtype=np.int32, count=len(product_ids))
+
+    def decode(self, codes):
+        return np.asarray(self.products, dtype=object)[codes]
+
+    # ---- commit markers ------------------------------------------------
+    def _load_markers(self):
+        """Fold markers appended since the last call (by any process) into self._committed."""
+        with self._marker_lock:
+            try:
+                n = os.path.getsize(self._marker_path) // MARKER_DTYPE.itemsize
+            except FileNotFoundError:
+                return False
+            if n > self._markers_seen:
+                records = np.fromfile(self._marker_path, dtype=MARKER_DTYPE, count=n - self._markers_seen,
+                                      offset=self._markers_seen * MARKER_DTYPE.itemsize)
+                # Only the newest record of each partition matters.
+                hours, newest = np.unique(records["partition"][::-1], return_index=True)
+                for hour, rows in zip(hours.tolist(), records["rows"][::-1][newest].tolist()):
+                    self._committed[partition_key(hour)] = rows
+                self._markers_seen = n
+            return True
+
+    def _recover(self):
+        """Writer-side: drop torn markers and uncommitted column bytes before appending."""
+        if not os.path.exists(self._marker_path):
+            # A store from before markers existed: everything on disk counts as committed.
+            records = [(partition_start(key), partition_start(key),
+                        self._partition_rows(os.path.join(self.root, key), SCHEMA, committed=False))
+                       for key in self.partitions()]
+            with open(self._marker_path, "wb") as f:
+                f.write(np.array(records, dtype=MARKER_DTYPE).tobytes())
+        size = os.path.getsize(self._marker_path)
+        if size % MARKER_DTYPE.itemsize:
+            os.truncate(self._marker_path, size - size % MARKER_DTYPE.itemsize)
+        self._load_markers()
+
+    def _truncate_partition(self, part_dir, rows):
+        for col, dtype in SCHEMA.items():
+            path = os.path.join(part_dir, f"{col}.bin")
+            if os.path.exists(path) and os.path.getsize(path) > rows * dtype.itemsize:
+                os.truncate(path, rows * dtype.itemsize)
+
+    # ---- writing -------------------------------------------------------
+    def append(self, times, product_ids, columns, sync=False):
+        """Append rows and commit them. times are epoch seconds, columns maps VALUE_COLUMNS to arrays.
+
+        Each partition's column files get one write each, then one marker
+        record per partition is appended. With sync=True the column files and
+        then the marker are fsynced, so a tick survives a crash whole or not
+        at all.
+        """
+        times = np.asarray(times, dtype=np.int64)
+        if times.size == 0:
+            return
+        with self._lock:
+            self._recover()
+            data = {"snapshot_time": times, "product": self.encode(list(product_ids), sync)}
+            for col in VALUE_COLUMNS:
+                data[col] = columns[col]
+            hours = times - times % PARTITION_SECONDS
+            markers = []
+            for hour in np.unique(hours):
+                mask = hours == hour
+                key = partition_key(hour)
+                part_dir = os.path.join(self.root, key)
+                os.makedirs(part_dir, exist_ok=True)
+                committed = self._committed.get(key, 0)
+                self._truncate_partition(part_dir, committed)
+                for col, dtype in SCHEMA.items():
+                    arr = np.asarray(data[col])[mask].astype(dtype, copy=False)
+                    with open(os.path.join(part_dir, f"{col}.bin"), "ab") as f:
+                        f.write(arr.tobytes())
+                        if sync:
+                            f.flush()
+                            os.fsync(f.fileno())
+                markers.append((int(times[mask].max()), int(hour), committed + int(mask.sum())))
+            with open(self._marker_path, "ab") as f:
+                f.write(np.array(markers, dtype=MARKER_DTYPE).tobytes())
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            self._load_markers()
+
+    def drop_before(self, cutoff):
+        """Remove the hour partitions that end at or before cutoff (epoch seconds). Returns partitions removed."""
+        with self._lock:
+            dropped = [k for k in self.partitions() if partition_start(k) + PARTITION_SECONDS <= cutoff]
+            for key in dropped:
+                shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+                self._committed.pop(key, None)
+        return len(dropped)
+
+    # ---- reading -------------------------------------------------------
+    def partitions(self, start=None, end=None):
+        """Sorted partition keys overlapping [start, end] (epoch seconds)."""
+        keys = sorted(k for k in os.listdir(self.root) if k.isdigit() and len(k) == 10)
+        if start is not None:
+            keys = [k for k in keys if partition_start(k) + PARTITION_SECONDS > start]
+        if end is not None:
+            keys = [k for k in keys if partition_start(k) <= end]
+        return keys
+
+    def is_empty(self):
+        return not self.partitions()
+
+    def _partition_rows(self, part_dir, columns, committed=True):
+        """Rows readable in a partition: its committed count, or (pre-marker stores) the shortest column."""
+        if committed and self._load_markers():
+            return self._committed.get(os.path.basename(part_dir), 0)
+        sizes = []
+        for col in columns:
+            path = os.path.join(part_dir, f"{col}.bin")
+            sizes.append(os.path.getsize(path) // SCHEMA[col].itemsize if os.path.exists(path) else 0)
+        return min(sizes) if sizes else 0
+
+    def read(self, columns=None, start=None, end=None):
+        """Return {column: ndarray} for rows with start <= snapshot_time <= end.
+
+        Only the partitions overlapping the range and the requested columns
+        are read from disk.
+        """
+        columns = list(columns or SCHEMA)
+        wanted = columns if "snapshot_time" in columns else columns + ["snapshot_time"]
+        chunks = {col: [] for col in wanted}
+        for key in self.partitions(start, end):
+            part_dir = os.path.join(self.root, key)
+            n = self._partition_rows(part_dir, wanted)
+            if n == 0:
+                continue
+            arrays = {col: np.fromfile(os.path.join(part_dir, f"{col}.bin"), dtype=SCHEMA[col], count=n)
+                      for col in wanted}
+            t = arrays["snapshot_time"]
+            mask = None
+            if start is not None and t[0] < start:
+                mask = t >= start
+            if end is not None and t[-1] > end:
+                mask = (t <= end) if mask is None else mask & (t <= end)
+            for col in wanted:
+                chunks[col].append(arrays[col] if mask is None else arrays[col][mask])
+        return {col: (np.concatenate(chunks[col]) if chunks[col] else np.empty(0, dtype=SCHEMA[col]))
+                for col in columns}
+
+    def read_frame(self, columns=None, start=None, end=None):
+        """Return a DataFrame shaped like market_snapshot.csv (snapshot_time as datetime64).
+
+        columns optionally restricts the value columns that are loaded.
+        """
+        data = self.read(["snapshot_time", "product"] + list(columns or VALUE_COLUMNS), start, end)
+        self.reload_dictionary()
+        return columns_to_frame(data, self.products)
+
+    def read_partition(self, key, columns=None, offset=0):
+        """Return ({column: ndarray}, rows) for rows [offset, end) of one partition."""
+        columns = list(columns or SCHEMA)
+        part_dir = os.path.join(self.root, key)
+        n = self._partition_rows(part_dir, columns)
+        if n <= offset:
+            return {col: np.empty(0, dtype=SCHEMA[col]) for col in columns}, n
+        return {col: np.fromfile(os.path.join(part_dir, f"{col}.bin"), dtype=SCHEMA[col],
+                                 count=n - offset, offset=offset * SCHEMA[col].itemsize)
+                for col in columns}, n
+
+    # ---- migration -----------------------------------------------------
+    def migrate_csv(self, csv_path, chunksize=1_000_000):
+        """One-shot import of an existing market_snapshot.csv. Returns rows imported."""
+        import pandas as pd
+        total = 0
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            chunk = chunk.dropna(subset=["snapshot_time", "product_id"])
+            times = pd.to_datetime(chunk["snapshot_time"], format="%Y-%m-%d %H:%M:%S", errors="coerce")
+            chunk = chunk[times.notna()]
+            times = times[times.notna()]
+            order = np.argsort(times.values, kind="stable")
+            chunk = chunk.iloc[order]
+            self.append(times.values[order].astype("datetime64[s]").astype(np.int64),
+                        chunk["product_id"].astype(str).tolist(),
+                        {col: chunk[col].fillna(0).to_numpy() for col in VALUE_COLUMNS})
+            total += len(chunk)
+            logging.info(f"Migrated {total} rows from {csv_path}")
+        return total
+
+
+class ColumnBuffer:
+    """Growable set of equal-length numpy columns with amortised O(1) appends.
+
+    view() hands out read-only slices of the backing arrays; appends write past
+    the end of every slice already handed out, so readers never need a copy or
+    a lock.
+    """
+
+    def __init__(self, dtypes, capacity=1024):
+        self.dtypes = dict(dtypes)
+        self._arrays = {col: np.empty(capacity, dtype=dt) for col, dt in self.dtypes.items()}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, data):
+        k = len(next(iter(data.values())))
+        if k == 0:
+            return
+        end = self.size + k
+        capacity = len(next(iter(self._arrays.values())))
+        if end > capacity:
+            capacity = max(end, capacity * 2)
+            grown = {}
+            for col, arr in self._arrays.items():
+                grown[col] = np.empty(capacity, dtype=arr.dtype)
+                grown[col][:self.size] = arr[:self.size]
+            self._arrays = grown
+        arrays = self._arrays
+        for col, arr in arrays.items():
+            arr[self.size:end] = data[col]
+        self.size = end
+
+    def view(self, col, start=0, stop=None):
+        return self.views([col], start, stop)[col]
+
+    def views(self, columns=None, start=0, stop=None):
+        # Read size before the arrays: a grow swaps the arrays in before size moves.
+        size = self.size
+        arrays = self._arrays
+        stop = size if stop is None else min(stop, size)
+        out = {}
+        for col in columns or self.dtypes:
+            v = arrays[col][start:stop]
+            v.flags.writeable = False
+            out[col] = v
+        return out
+
+    def replace(self, data):
+        """Swap in fully rebuilt columns (used when out-of-order rows force a re-sort)."""
+        self._arrays = {col: np.array(data[col], dtype=dt) for col, dt in self.dtypes.items()}
+        self.size = len(next(iter(self._arrays.values())))
+
+
+class SnapshotCache:
+    """In-memory snapshot index, kept current by tailing the store.
+
+    Rows are held per product in contiguous, time-sorted ColumnBuffers, so a
+    product's history is a slice (range queries are a binary search on its
+    snapshot_time column) and never a scan over every product. A separate
+    latest-row table, indexed by product code, is swapped in on each refresh
+    and answers "latest snapshot" lookups in O(1).
+
+    refresh() reads only rows appended since the previous call, so its cost is
+    proportional to new data rather than to total history. Timestamps are kept
+    as int64 epoch seconds and never re-parsed.
+
+    With an arena (shared_state.SharedArena) the buffers live in shared
+    memory-mapped files that other processes can map through export_tables().
+    """
+
+    def __init__(self, store, arena=None):
+        self.store = store
+        self.arena = arena
+        self._series = {}  # product code -> ColumnBuffer (or ArenaBuffer)
+        self._latest = {col: np.empty(0, dtype=dt) for col, dt in SCHEMA.items()}
+        self._latest_rows = np.empty(0, dtype=np.int64)  # codes present in the latest table
+        self._offsets = {}  # partition key -> rows already loaded
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._rows
+
+    def refresh(self):
+        """Append rows written to the store since the last refresh. Returns rows added."""
+        with self._lock:
+            keys = self.store.partitions()
+            if self._offsets:
+                last = max(self._offsets)
+                keys = [k for k in keys if k >= last]
+            chunks = []
+            for key in keys:
+                data, n = self.store.read_partition(key, offset=self._offsets.get(key, 0))
+                self._offsets[key] = max(n, self._offsets.get(key, 0))
+                if len(data["snapshot_time"]):
+                    chunks.append(data)
+            if not chunks:
+                return 0
+            new = {col: np.concatenate([c[col] for c in chunks]) for col in SCHEMA}
+            self.store.reload_dictionary()
+            self._add(new)
+            return len(new["snapshot_time"])
+
+    def _add(self, new):
+        # Group the batch by product (stable, so each group stays in time order).
+        order = np.lexsort((new["snapshot_time"], new["product"]))
+        new = {col: arr[order] for col, arr in new.items()}
+        codes = new["product"]
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(codes)]))
+        for lo, hi in zip(starts, ends):
+            code = int(codes[lo])
+            group = {col: arr[lo:hi] for col, arr in new.items()}
+            buf = self._series.get(code)
+            if buf is None:
+                buf = (ColumnBuffer(SCHEMA, capacity=max(64, hi - lo)) if self.arena is None
+                       else self.arena.buffer(max(64, hi - lo)))
+                self._series[code] = buf
+            if buf.size and group["snapshot_time"][0] < buf.view("snapshot_time")[-1]:
+                # Late rows for this product: rebuild its slice once in sorted order.
+                merged = {col: np.concatenate([buf.view(col), group[col]]) for col in SCHEMA}
+                by_time = np.argsort(merged["snapshot_time"], kind="stable")
+                buf.replace({col: arr[by_time] for col, arr in merged.items()})
+            else:
+                buf.append(group)
+        self._rows += len(codes)
+        self._update_latest(new, ends - 1)
+
+    def _update_latest(self, new, tails):
+        """Fold the newest row of each product in a grouped batch into a fresh latest table and swap it in."""
+        size = max(len(self._latest["product"]), int(new["product"][tails].max()) + 1)
+        latest = {}
+        for col, dt in SCHEMA.items():
+            latest[col] = np.zeros(size, dtype=dt)
+            latest[col][:len(self._latest[col])] = self._latest[col]
+        present = np.zeros(size, dtype=bool)
+        present[self._latest_rows] = True
+        codes = new["product"][tails]
+        newer = ~present[codes] | (new["snapshot_time"][tails] >= latest["snapshot_time"][codes])
+        for col in SCHEMA:
+            latest[col][codes[newer]] = new[col][tails[newer]]
+            latest[col].flags.writeable = False
+        present[codes] = True
+        self._latest, self._latest_rows = latest, np.flatnonzero(present)
+
+    def trim(self, cutoff):
+        """Forget rows older than cutoff (once the store has dropped them). Returns rows removed."""
+        with self._lock:
+            removed = 0
+            for code, buf in list(self._series.items()):
+                t = buf.view("snapshot_time")
+                lo = int(np.searchsorted(t, cutoff, side="left"))
+                if lo == 0:
+                    continue
+                removed += lo
+                if lo < len(t):
+                    buf.replace(buf.views(None, lo))
+                    continue
+                if self.arena is not None:
+                    self.arena.release(buf.region[2])
+                del self._series[code]
+                self._latest_rows = self._latest_rows[self._latest_rows != code]
+            first = partition_key(cutoff)
+            self._offsets = {k: n for k, n in self._offsets.items() if k >= first}
+            self._rows -= removed
+            return removed
+
+    def export_tables(self):
+        """Region directory and latest table of an arena-backed cache, as arrays for SharedStateWriter."""
+        self.arena.open()
+        with self._lock:
+            if self.arena.needs_compaction():
+                self.arena.compact(self._series.values())
+            codes = np.array(sorted(self._series), dtype=np.int64)
+            regions = [self._series[code].region for code in codes.tolist()]
+            tables = {
+                "codes": codes,
+                "starts": np.array([r[1] for r in regions], dtype=np.int64),
+                "sizes": np.array([r[3] for r in regions], dtype=np.int64),
+                "generation": np.int64(self.arena.generation),
+                "arena_rows": np.int64(self.arena.rows),
+                "latest_rows": self._latest_rows,
+                "rows": np.int64(self._rows),
+            }
+            tables.update({f"latest.{col}": arr for col, arr in self._latest.items()})
+            return tables
+
+    # ---- zero-copy reads ----------------------------------------------
+    def product(self, code, columns=None, start=None, end=None):
+        """Read-only views of one product's rows with start <= snapshot_time <= end."""
+        buf = self._series.get(code)
+        if buf is None:
+            return {col: np.empty(0, dtype=SCHEMA[col]) for col in (columns or SCHEMA)}
+        t = buf.view("snapshot_time")
+        lo = 0 if start is None else int(np.searchsorted(t, start, side="left"))
+        hi = len(t) if end is None else int(np.searchsorted(t, end, side="right"))
+        return buf.views(columns, lo, hi)
+
+    def latest(self, columns=None):
+        """Latest row of every product: {column: array} ordered by product code."""
+        table, rows = self._latest, self._latest_rows
+        return {col: table[col][rows] for col in (columns or SCHEMA)}
+
+    def latest_row(self, code):
+        """Latest row of one product as {column: scalar}, or None."""
+        table = self._latest
+        if code is None or code not in self._series or code >= len(table["product"]):
+            return None
+        return {col: arr[code] for col, arr in table.items()}
+
+    def frame(self, start=None, end=None):
+        """DataFrame (same shape as SnapshotStore.read_frame) of a time range."""
+        parts = [self.product(code, start=start, end=end) for code in sorted(self._series)]
+        data = {col: np.concatenate([p[col] for p in parts]) if parts else np.empty(0, dtype=dt)
+                for col, dt in SCHEMA.items()}
+        order = np.argsort(data["snapshot_time"], kind="stable")
+        return columns_to_frame({col: arr[order] for col, arr in data.items()}, self.store.products)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    if len(sys.argv) < 2 or sys.argv[1] != "migrate":
+        sys.exit("usage: python snapshot_store.py migrate [market_snapshot.csv] [store_dir]")
+    src = sys.argv[2] if len(sys.argv) > 2 else "market_snapshot.csv"
+    dest = sys.argv[3] if len(sys.argv) > 3 else "snapshot_store"
+    store = SnapshotStore(dest)
+    if not store.is_empty():
+        sys.exit(f"{dest} already contains data; refusing to migrate twice")
+    rows = store.migrate_csv(src)
+    logging.info(f"Done: {rows} rows in {len(store.partitions())} partitions, {len(store.products)} products")
@@ -0,0 +1,11 @@
+// Live dashboard updates: one EventSource on /stream, onTick(delta) once per fetch tick.
+// delta = {time, columns, prices: {id: [value per column]}, movers: [...], predictions: {id: [peak, confidence]}}
+function liveUpdates(url, onTick) {
+  if (!window.EventSource) {  // no SSE: fall back to reloading the page
+    setInterval(() => location.reload(), 60000);
+    return;
+  }
+  const source = new EventSource(url);
+  source.addEventListener('tick', e => onTick(JSON.parse(e.data)));
+  source.addEventListener('reset', () => location.reload());  // missed more ticks than the server keeps
+}
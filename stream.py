@@ -0,0 +1,137 @@
+"""Server-sent events: one encoded delta per fetch tick, fanned out to every client.
+
+The ingest loop builds each tick's delta (changed prices, movers,
+predictions) and encodes it as SSE bytes exactly once. An EventStream keeps
+the last few of those events; a client connection only waits on its
+condition and writes the bytes it is handed, so a tick costs the same
+server work for one client or thousands.
+
+Other processes (gunicorn web workers) follow the ingest process through a
+DeltaLog, a small on-disk ring of the same encoded events:
+
+    <root>/<event id>.sse    one event, written under a temporary name and renamed
+    <root>/LATEST            int64 id of the newest complete event
+
+Event ids are tick times (epoch seconds), so they only ever grow and a
+reconnecting browser's Last-Event-ID says exactly what it has missed.
+"""
+import os
+import time
+import json
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+KEEP_EVENTS = 32  # ~1 hour of 2-minute ticks a reconnecting client can catch up on
+RESET_EVENT = b"event: reset\ndata: {}\n\n"  # the client missed too much: reload the page
+KEEPALIVE = b": keepalive\n\n"
+
+
+def encode_event(event_id, name, payload):
+    """One SSE event: id, event name and payload serialised as a single JSON data line."""
+    return f"id: {event_id}\nevent: {name}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n".encode()
+
+
+class EventStream:
+    """In-process ring of encoded events, shared by every client connection."""
+
+    def __init__(self, keep=KEEP_EVENTS):
+        self._events = deque(maxlen=keep)  # (previous id, id, bytes)
+        self._cond = threading.Condition()
+        self.last_id = 0
+
+    def publish(self, event_id, data):
+        """Append one encoded event (ids must grow) and wake every waiting client."""
+        with self._cond:
+            if event_id <= self.last_id:
+                return
+            self._events.append((self.last_id, event_id, data))
+            self.last_id = event_id
+            self._cond.notify_all()
+
+    def since(self, last_id):
+        """Encoded events after last_id, or None when some of them already fell out of the ring."""
+        with self._cond:
+            events = list(self._events)
+        if not events or last_id >= events[-1][1]:
+            return []
+        for i, (previous, event_id, _) in enumerate(events):
+            if event_id > last_id:
+                return [e[1:] for e in events[i:]] if previous == last_id else None
+        return []
+
+    def wait(self, last_id, timeout):
+        """Block until there is something after last_id (or timeout); then since(last_id)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.last_id > last_id, timeout)
+        return self.since(last_id)
+
+
+class DeltaLog:
+    """On-disk ring of encoded events, for processes that serve clients but do not ingest."""
+
+    def __init__(self, root, keep=KEEP_EVENTS):
+        self.root = root
+        self.keep = keep
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, event_id):
+        return os.path.join(self.root, f"{event_id}.sse")
+
+    def ids(self):
+        """Ids of the events on disk, oldest first."""
+        names = (name[:-4] for name in os.listdir(self.root) if name.endswith(".sse"))
+        return sorted(int(name) for name in names if name.isdigit())
+
+    def latest(self):
+        try:
+            with open(os.path.join(self.root, "LATEST"), "rb") as f:
+                return int(np.frombuffer(f.read(8), dtype="<i8")[0])
+        except (FileNotFoundError, IndexError, ValueError):
+            return 0
+
+    def append(self, event_id, data):
+        """Write one event, then point LATEST at it and drop events beyond keep."""
+        tmp = f"{self._path(event_id)}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(event_id))
+        fd = os.open(os.path.join(self.root, "LATEST"), os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            os.pwrite(fd, np.int64(event_id).tobytes(), 0)
+        finally:
+            os.close(fd)
+        for old in self.ids()[:-self.keep]:
+            try:
+                os.remove(self._path(old))
+            except FileNotFoundError:
+                pass
+
+    def read(self, event_id):
+        try:
+            with open(self._path(event_id), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None  # dropped from the ring meanwhile
+
+    def catch_up(self, stream, last=0):
+        """Publish the events newer than last into stream. Returns the new last."""
+        latest = self.latest()
+        if latest <= last:
+            return last
+        for event_id in self.ids():
+            data = self.read(event_id) if event_id > last else None
+            if data is not None:
+                stream.publish(event_id, data)
+        return latest
+
+    def follow(self, stream, last=0, interval=0.25):
+        """catch_up() every interval seconds, forever (run it in a thread)."""
+        while True:
+            try:
+                last = self.catch_up(stream, last)
+            except Exception as e:
+                logging.error(f"Error following {self.root}: {e}")
+            time.sleep(interval)
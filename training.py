@@ -0,0 +1,225 @@
+"""Training sets, model fitting and the parallel training scheduler for the
+per-product peak-price models.
+
+Kept free of Flask and of run.py's import-time side effects so that it can
+be imported by benchmarks and by training worker processes.
+"""
+import os
+import time
+import logging
+from collections import Counter
+
+import numpy as np
+
+from forecasters import ENGINES, engine_name, holdout_confidence, select_engine
+
+FEATURE_COLUMNS = ["sellVolume", "buyVolume", "sellOrders", "buyOrders"]
+
+
+def window_argmax(values, lo, hi):
+    """Index of the first maximum of values[lo[i]:hi[i]] for every i (requires hi > lo).
+
+    Uses a sparse table of range-argmax indices, so n queries over n values
+    cost O(n log n) numpy work and no Python-level loop per row. Ties resolve
+    to the earliest index, like Python's max().
+    """
+    values = np.asarray(values)
+    lo = np.asarray(lo, dtype=np.int64)
+    hi = np.asarray(hi, dtype=np.int64)
+    levels = [np.arange(len(values), dtype=np.int64)]
+    span = 1
+    while span * 2 <= len(values):
+        prev = levels[-1]
+        a, b = prev[:-span], prev[span:]
+        levels.append(np.where(values[a] >= values[b], a, b))
+        span *= 2
+    k = np.floor(np.log2(hi - lo)).astype(np.int64)
+    out = np.empty(len(lo), dtype=np.int64)
+    for level in np.unique(k):
+        q = np.flatnonzero(k == level)
+        table = levels[level]
+        left = table[lo[q]]
+        right = table[hi[q] - (1 << int(level))]
+        out[q] = np.where(values[left] >= values[right], left, right)
+    return out
+
+
+def build_training_set(times, sell_prices, features, window_seconds=600):
+    """Build (X, y, dt_to_peak) for every snapshot in one vectorized pass.
+
+    times are time-sorted int64 epoch seconds, features a (n, 4) array of
+    FEATURE_COLUMNS. For row i the target is the highest sellPrice strictly
+    after times[i] and at most window_seconds later; rows without any future
+    snapshot in the window are dropped. X rows are [time, *features].
+    """
+    times = np.asarray(times, dtype=np.int64)
+    lo = np.searchsorted(times, times, side="right")
+    hi = np.searchsorted(times, times + window_seconds, side="right")
+    rows = np.flatnonzero(hi > lo)
+    peak = window_argmax(sell_prices, lo[rows], hi[rows])
+    X = np.column_stack([times[rows].astype(float), np.asarray(features, dtype=float)[rows]])
+    y = np.asarray(sell_prices, dtype=float)[peak]
+    dt = (times[peak] - times[rows]).astype(float)
+    return X, y, dt
+
+
+# ===============================
+# MODEL FITTING (runs in worker processes)
+# ===============================
+RESELECT_SECONDS = 3600  # how long a product keeps its engine before select_engine() runs again
+
+
+def fit_model(X, y, previous=None, engine=None):
+    """Fit one product's model with engine (see forecasters.ENGINES), or with the one select_engine() picks.
+
+    Returns (model, scaler, confidence, fit_seconds, selection); selection is
+    select_engine()'s report when it ran, else None. confidence comes from
+    the chosen engine's holdout error, so it is None when no selection ran
+    (the caller keeps the one from the last selection) and 0 when there
+    was too little data to hold any out.
+    """
+    t0 = time.perf_counter()
+    selection, score = None, None
+    if engine is None:
+        engine, selection = select_engine(X, y)
+        score = holdout_confidence(selection[engine]) if selection else 0.0
+    model, scaler = ENGINES[engine](X, y, previous)
+    return model, scaler, score, time.perf_counter() - t0, selection
+
+
+# ===============================
+# TRAINING SCHEDULER
+# ===============================
+class TrainingScheduler:
+    """Fans per-product model fits out to a process pool, freshest-data-first.
+
+    prepare(product_id) -> (X, y, avg_dt) | None builds a training set in the
+    calling process; publish(product_id, model, scaler, avg_dt, confidence,
+    meta) installs a finished model, meta being its new entry in fitted.
+    Products whose latest snapshot is not newer than the one their current
+    model saw are skipped. Each product keeps the engine select_engine() chose
+    for it, and the confidence measured on its holdout, for RESELECT_SECONDS;
+    products that had too little data to select reselect on their next fit.
+    MLPs that exist are refined with warm_start instead of being refitted
+    from scratch.
+    """
+
+    def __init__(self, prepare, publish, workers=None):
+        self.prepare = prepare
+        self.publish = publish
+        self.workers = workers or os.cpu_count() or 1
+        self.fitted = {}  # product_id -> {"fitted_at", "last_tick", "samples", "fit_seconds", "engine", ...}
+        self.stats = {}
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn: the caller is multi-threaded (fetcher, cache tailer, Flask), so no fork.
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _reset_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+
+    def plan(self, candidates):
+        """Order (product_id, last_tick, volume) candidates; drop ones with no new data.
+
+        Products without a model come first, then the stalest models, with
+        higher-volume products first among equals.
+        """
+        queue = []
+        for pid, last_tick, volume in candidates:
+            state = self.fitted.get(pid)
+            if state is not None and last_tick <= state["last_tick"]:
+                continue
+            fitted_at = state["fitted_at"] if state else float("-inf")
+            queue.append((fitted_at, -volume, pid, last_tick))
+        queue.sort()
+        return [(pid, last_tick) for _, _, pid, last_tick in queue]
+
+    def engine_for(self, pid):
+        """The engine pid keeps using, or None when it is due for select_engine()."""
+        state = self.fitted.get(pid)
+        if state is None or "selected_at" not in state or "confidence" not in state or \
+                time.time() - state["selected_at"] > RESELECT_SECONDS:
+            return None
+        return state["engine"]
+
+    def run_cycle(self, candidates, previous_models):
+        """Train every product in plan(candidates); returns this cycle's stats dict.
+
+        previous_models maps product_id -> fitted model to warm-start from.
+        """
+        from concurrent.futures import FIRST_COMPLETED, wait
+        from concurrent.futures.process import BrokenProcessPool
+
+        started = time.time()
+        planned = self.plan(candidates)
+        pool = self._executor()
+        pending = {}
+        trained = failed = 0
+
+        def collect(done):
+            nonlocal trained, failed
+            for future in done:
+                pid, last_tick, avg_dt, samples = pending.pop(future)
+                try:
+                    model, scaler, confidence, fit_seconds, selection = future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    failed += 1
+                    logging.error(f"Model training failed for {pid}: {e}")
+                    continue
+                meta = {"fitted_at": time.time(), "last_tick": last_tick, "samples": samples,
+                        "fit_seconds": fit_seconds, "engine": engine_name(model)}
+                if selection is None:
+                    meta["selected_at"] = self.fitted[pid]["selected_at"]
+                    confidence = self.fitted[pid]["confidence"]
+                elif selection:
+                    meta["selected_at"] = meta["fitted_at"]
+                    meta["holdout_error"] = {name: r["error"] for name, r in selection.items()}
+                meta["confidence"] = confidence
+                self.publish(pid, model, scaler, avg_dt, confidence, meta)
+                self.fitted[pid] = meta
+                trained += 1
+
+        try:
+            for pid, last_tick in planned:
+                data = self.prepare(pid)
+                if data is None:
+                    continue
+                X, y, avg_dt = data
+                # Bound in-flight work so training sets are not all pickled at once.
+                while len(pending) >= 2 * self.workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                engine = self.engine_for(pid)
+                previous = previous_models.get(pid) if engine in (None, "mlp") else None
+                pending[pool.submit(fit_model, X, y, previous, engine)] = (pid, last_tick, avg_dt, len(y))
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        except BrokenProcessPool as e:
+            logging.error(f"Training pool died, restarting it next cycle: {e}")
+            self._reset_pool()
+
+        elapsed = time.time() - started
+        now = time.time()
+        oldest = min((s["fitted_at"] for s in self.fitted.values()), default=None)
+        self.stats = {
+            "cycle_seconds": elapsed,
+            "trained": trained,
+            "failed": failed,
+            "skipped": len(candidates) - len(planned),
+            "models_per_second": trained / elapsed if elapsed > 0 else 0.0,
+            "oldest_model_age": now - oldest if oldest is not None else None,
+            "engines": dict(Counter(s.get("engine", "mlp") for s in self.fitted.values())),
+            "finished_at": now,
+        }
+        return self.stats